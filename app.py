@@ -1,27 +1,38 @@
 import atexit
+import collections
+import contextlib
+import fcntl
+import functools
+import hashlib
 import io
 import json
 import logging
+import math
 import os
+import re
 import shutil
 import sqlite3
 import subprocess
 import sys
 import threading
 import time
+import urllib.parse
 import uuid
 import zipfile
-from concurrent.futures import ThreadPoolExecutor
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
 
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 LIBS_DIR = os.path.join(BASE_DIR, "libs")
 if os.path.isdir(LIBS_DIR) and LIBS_DIR not in sys.path:
     sys.path.insert(0, LIBS_DIR)
 
-from flask import Flask, g, jsonify, make_response, render_template, request, send_file, send_from_directory
-from PIL import Image, ImageOps
+from flask import Flask, Request, g, jsonify, make_response, render_template, request, send_file, send_from_directory
+from PIL import Image, ImageChops, ImageFile
 from pypdf import PdfReader, PdfWriter
-from werkzeug.utils import secure_filename
+from werkzeug.datastructures import FileStorage, ImmutableMultiDict, MultiDict
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+from werkzeug.utils import secure_filename, send_file as _wz_send_file
 from werkzeug.exceptions import RequestEntityTooLarge
 
 # Register HEIF/HEIC support
@@ -31,6 +42,12 @@ try:
 except ImportError:
     pass
 
+# SSIM vectorise (compress comp_mode=quality)
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 app = Flask(__name__)
 
 UPLOAD_DIR = os.path.join(BASE_DIR, "uploads")
@@ -43,9 +60,89 @@ DIST_INDEX_PATH = os.path.join(FRONTEND_DIST_DIR, "index.html")
 MAX_CONTENT_LENGTH_BYTES = 10000 * 1024 * 1024
 RETENTION_SECONDS = int(os.environ.get("RETENTION_SECONDS", str(3 * 60 * 60)))
 CLEANUP_INTERVAL_SECONDS = int(os.environ.get("CLEANUP_INTERVAL_SECONDS", str(5 * 60)))
+# Lots de suppression et budget de temps par passage de nettoyage
+CLEANUP_BATCH_SIZE = max(1, int(os.environ.get("CLEANUP_BATCH_SIZE", "500")))
+CLEANUP_SWEEP_BUDGET_SECONDS = float(os.environ.get("CLEANUP_SWEEP_BUDGET_SECONDS", "5"))
+# Fichiers sans job (crash, /clear-all pendant un job, logs two-pass) supprimes apres ce delai
+ORPHAN_GRACE_SECONDS = int(os.environ.get("ORPHAN_GRACE_SECONDS", str(60 * 60)))
+ORPHAN_SCAN_INTERVAL_SECONDS = int(os.environ.get("ORPHAN_SCAN_INTERVAL_SECONDS", str(30 * 60)))
+ORPHAN_SCAN_BATCH = max(1, int(os.environ.get("ORPHAN_SCAN_BATCH", "500")))
+
+# compression a taille cible: ecart accepte sous la cible, taille du proxy de calibration
+TARGET_SIZE_TOLERANCE = float(os.environ.get("TARGET_SIZE_TOLERANCE", "0.05"))
+TARGET_SIZE_PROXY_PIXELS = int(os.environ.get("TARGET_SIZE_PROXY_PIXELS", str(1_000_000)))
+# tours d essais successifs (un encodage par tour sans parallelisme)
+TARGET_SIZE_MAX_ENCODES = 6
+
+# transformations JPEG sans perte (coefficients DCT) quand jpegtran est installe
+JPEGTRAN_BIN = os.environ.get("JPEGTRAN_BIN", "jpegtran")
+
+# compression a qualite visuelle cible (comp_mode=quality): SSIM luma vise, encodages max
+SSIM_TARGET_DEFAULT = float(os.environ.get("SSIM_TARGET_DEFAULT", "0.98"))
+SSIM_MAX_ENCODES = 7
+
+# Rasters geants: au-dela de IMAGE_TILED_MIN_PIXELS, une reduction (ou une conversion pleine taille
+# en PNG/TIFF) se fait par bandes de lignes, decodage borne a ~IMAGE_TILED_BAND_BYTES: TIFF bruts ou
+# compresses par bandes (LZW, deflate, packbits), PSD bruts ou RLE; IMAGE_MAX_PIXELS borne le decodage complet
+IMAGE_TILED_MIN_PIXELS = int(os.environ.get("IMAGE_TILED_MIN_PIXELS", str(64_000_000)))
+IMAGE_TILED_BAND_BYTES = int(os.environ.get("IMAGE_TILED_BAND_BYTES", str(64 * 1024 * 1024)))
+IMAGE_MAX_PIXELS = int(os.environ.get("IMAGE_MAX_PIXELS", str(2 * 89_478_485)))
+IMAGE_TILED_MAX_PIXELS = int(os.environ.get("IMAGE_TILED_MAX_PIXELS", str(2_000_000_000)))
+
+# Budget memoire des decodages image par processus, estime a la soumission depuis l en-tete
+# (0 = moitie de la memoire du conteneur partagee entre les WEB_CONCURRENCY workers gunicorn);
+# un job estime au-dela de IMAGE_HUGE_JOB_MB passe par la file "huge"
+IMAGE_MEMORY_BUDGET_MB = int(os.environ.get("IMAGE_MEMORY_BUDGET_MB", "0"))
+WEB_CONCURRENCY = max(1, int(os.environ.get("WEB_CONCURRENCY", "1")))
+IMAGE_HUGE_JOB_MB = int(os.environ.get("IMAGE_HUGE_JOB_MB", "512"))
+IMAGE_HUGE_WORKERS = max(1, int(os.environ.get("IMAGE_HUGE_WORKERS", "1")))
+
+# Effort d encodage image par defaut (fast / balanced / max), surchargeable par job (image_effort);
+# max reprend les reglages fixes de l ancien _encode_image_bytes (JPEG optimize, WebP method=6,
+# PNG optimize + compress_level=9, AVIF vitesse par defaut de Pillow)
+IMAGE_EFFORT = os.environ.get("IMAGE_EFFORT", "balanced").strip().lower()
+if IMAGE_EFFORT not in {"fast", "balanced", "max"}:
+    IMAGE_EFFORT = "balanced"
+
+# Animations GIF/WebP/APNG: traitement image par image; au-dela de ANIMATION_PARALLEL_MIN_FRAMES
+# les frames sont reduites/quantifiees en parallele sur frame_executor
+ANIMATION_MAX_FRAMES = int(os.environ.get("ANIMATION_MAX_FRAMES", "5000"))
+ANIMATION_PARALLEL_MIN_FRAMES = int(os.environ.get("ANIMATION_PARALLEL_MIN_FRAMES", "8"))
+
+# Assemblage de plusieurs images en un PDF: pages preparees sur pdf_page_executor, ecrites dans l ordre;
+# au plus PDF_PAGE_WINDOW pages en vol (0 = 2x PDF_PAGE_WORKERS)
+PDF_ASSEMBLE_MAX_PAGES = int(os.environ.get("PDF_ASSEMBLE_MAX_PAGES", "1000"))
+PDF_PAGE_WINDOW = int(os.environ.get("PDF_PAGE_WINDOW", "0"))
+
+# historique des durees par job (ETA, admission, capacite)
+JOB_HISTORY_RETENTION_DAYS = int(os.environ.get("JOB_HISTORY_RETENTION_DAYS", "30"))
+JOB_STATS_MAX_DAYS = 90
 
 MAX_ENQUEUED_JOBS = int(os.environ.get("MAX_ENQUEUED_JOBS", "50"))
 
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "60000"))
+SQLITE_CACHE_KB = int(os.environ.get("SQLITE_CACHE_KB", "8192"))
+SQLITE_MMAP_BYTES = int(os.environ.get("SQLITE_MMAP_BYTES", str(64 * 1024 * 1024)))
+
+
+def _env_flag(name: str, default: str = "0") -> bool:
+    return os.environ.get(name, default).strip().lower() in {"1", "true", "yes", "on"}
+
+
+# Archive zip par session alimentee au fil des jobs (download-all = simple envoi de fichier)
+SESSION_ARCHIVE_ENABLED = _env_flag("SESSION_ARCHIVE")
+ARCHIVE_DIR = os.path.join(DATA_DIR, "archives")
+
+# Delegation des telechargements au proxy frontal: "" (flask), "x-accel" (nginx), "x-sendfile" (apache/lighttpd)
+DOWNLOAD_OFFLOAD = os.environ.get("DOWNLOAD_OFFLOAD", "").strip().lower()
+DOWNLOAD_OFFLOAD_PREFIX = os.environ.get("DOWNLOAD_OFFLOAD_PREFIX", "/_protected").rstrip("/")
+
+# Transcodage audio/video demarre pendant la reception de l upload (ffmpeg lit un pipe)
+LIVE_TRANSCODE_ENABLED = _env_flag("LIVE_TRANSCODE")
+
+# PNG a taille cible: dichotomie sur le nombre de couleurs au lieu de l echelle 256..16
+PNG_TARGET_BISECT = _env_flag("PNG_TARGET_BISECT")
+
 app.config["UPLOAD_FOLDER"] = UPLOAD_DIR
 app.config["PROCESSED_FOLDER"] = PROCESSED_DIR
 app.config["MAX_CONTENT_LENGTH"] = MAX_CONTENT_LENGTH_BYTES
@@ -53,6 +150,7 @@ app.config["MAX_CONTENT_LENGTH"] = MAX_CONTENT_LENGTH_BYTES
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(PROCESSED_DIR, exist_ok=True)
 os.makedirs(DATA_DIR, exist_ok=True)
+os.makedirs(ARCHIVE_DIR, exist_ok=True)
 
 _background_lock = threading.Lock()
 _background_started = False
@@ -77,6 +175,18 @@ IMAGE_EXTENSIONS = {
     ".tga", ".sgi", ".qtif", ".pict", ".icns"
 }
 
+# Pillow leve DecompressionBombError au-dela de 2x: garde-fou au plafond du chemin par bandes
+# (Image.open doit accepter l en-tete d un raster geant); tout decodage complet passe par
+# _check_decode_pixels (plafond IMAGE_MAX_PIXELS)
+Image.MAX_IMAGE_PIXELS = IMAGE_TILED_MAX_PIXELS // 2
+
+
+def _check_decode_pixels(width: int, height: int, frames: int = 1) -> None:
+    """Refuse un decodage complet au-dela de IMAGE_MAX_PIXELS (toutes frames comprises)."""
+    pixels = width * height * frames
+    if pixels > IMAGE_MAX_PIXELS:
+        raise ValueError(f"image trop grande ({pixels // 1_000_000} Mpx) pour un decodage complet")
+
 _RESAMPLING = getattr(Image, "Resampling", Image)
 _LANCZOS = getattr(_RESAMPLING, "LANCZOS", getattr(Image, "LANCZOS", Image.BICUBIC))
 
@@ -115,18 +225,43 @@ AUDIO_WORKERS = CPU_THREADS
 IMAGE_WORKERS = max(4, CPU_THREADS)
 # PDF: 4 workers
 PDF_WORKERS = 4
+# Images hors budget memoire: file separee a faible concurrence
+HUGE_IMAGE_WORKERS = IMAGE_HUGE_WORKERS
 
 video_executor = ThreadPoolExecutor(max_workers=VIDEO_WORKERS)
 audio_executor = ThreadPoolExecutor(max_workers=AUDIO_WORKERS)
 image_executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS)
 pdf_executor = ThreadPoolExecutor(max_workers=PDF_WORKERS)
+huge_image_executor = ThreadPoolExecutor(max_workers=HUGE_IMAGE_WORKERS, thread_name_prefix="image-huge")
+# Essais d encodage concurrents (taille cible): les encodeurs JPEG/WebP relachent le GIL
+TRIAL_ENCODE_WORKERS = max(1, int(os.environ.get("TRIAL_ENCODE_WORKERS", str(min(4, CPU_THREADS)))))
+trial_encode_executor = ThreadPoolExecutor(max_workers=TRIAL_ENCODE_WORKERS, thread_name_prefix="trial-encode")
+# Frames d animation: resize et quantize relachent le GIL
+FRAME_WORKERS = max(1, int(os.environ.get("FRAME_WORKERS", str(min(4, CPU_THREADS)))))
+frame_executor = ThreadPoolExecutor(max_workers=FRAME_WORKERS, thread_name_prefix="frame")
+# Transcodages en direct: le job vit au rythme de l upload, pool separe pour ne pas bloquer video/audio
+LIVE_TRANSCODE_WORKERS = max(1, int(os.environ.get("LIVE_TRANSCODE_WORKERS", str(max(2, CPU_THREADS)))))
+live_transcode_executor = ThreadPoolExecutor(max_workers=LIVE_TRANSCODE_WORKERS, thread_name_prefix="live")
+# Pages d un PDF assemble: decodage, reduction et encodage JPEG relachent le GIL
+PDF_PAGE_WORKERS = max(1, int(os.environ.get("PDF_PAGE_WORKERS", str(min(4, CPU_THREADS)))))
+pdf_page_executor = ThreadPoolExecutor(max_workers=PDF_PAGE_WORKERS, thread_name_prefix="pdf-page")
 
 logging.info(f"Worker pool config: video={VIDEO_WORKERS}, audio={AUDIO_WORKERS}, image={IMAGE_WORKERS}, pdf={PDF_WORKERS} (CPU={CPU_THREADS})")
 
 
 def _shutdown_executors() -> None:
     """Gracefully shutdown all thread pool executors on application exit."""
-    for ex in (video_executor, audio_executor, image_executor, pdf_executor):
+    for ex in (
+        video_executor,
+        audio_executor,
+        image_executor,
+        pdf_executor,
+        huge_image_executor,
+        trial_encode_executor,
+        frame_executor,
+        pdf_page_executor,
+        live_transcode_executor,
+    ):
         ex.shutdown(wait=False)
     logging.info("thread pool executors shutdown")
 
@@ -134,13 +269,85 @@ def _shutdown_executors() -> None:
 atexit.register(_shutdown_executors)
 
 logging.info(
-    "workers cpu=%s video=%s audio=%s image=%s pdf=%s",
+    "workers cpu=%s video=%s audio=%s image=%s pdf=%s image_huge=%s",
     CPU_THREADS,
     VIDEO_WORKERS,
     AUDIO_WORKERS,
     IMAGE_WORKERS,
     PDF_WORKERS,
+    HUGE_IMAGE_WORKERS,
+)
+
+
+def _container_memory_bytes() -> int:
+    """Limite memoire du cgroup si definie, sinon RAM physique."""
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as f:
+                raw = f.read().strip()
+        except OSError:
+            continue
+        if raw.isdigit() and int(raw) < (1 << 60):
+            return int(raw)
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+
+
+class _MemoryBudget:
+    """Reservations d octets servies dans l ordre d arrivee; une demande plus grande que le budget attend d etre seule."""
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = max(1, capacity)
+        self.reserved = 0
+        self._lock = threading.Lock()
+        self._waiting: collections.deque = collections.deque()
+
+    def acquire(self, nbytes: int) -> int:
+        """Bloque jusqu a ce que nbytes tiennent dans le budget, derriere les demandes deja en attente;
+        renvoie le montant a rendre."""
+        granted: list[int] = []
+        ready = threading.Event()
+
+        def start(reserved: int) -> None:
+            granted.append(reserved)
+            ready.set()
+
+        self.submit(nbytes, start)
+        ready.wait()
+        return granted[0]
+
+    def submit(self, nbytes: int, start) -> None:
+        """Appelle start(reserve) des que nbytes tiennent, sans bloquer: les demandes en attente
+        sont servies dans l ordre a chaque release (aucun thread de pool immobilise)."""
+        nbytes = max(0, min(nbytes, self.capacity))
+        with self._lock:
+            self._waiting.append((nbytes, start))
+            ready = self._pop_ready()
+        for reserved, fn in ready:
+            fn(reserved)
+
+    def _pop_ready(self) -> list:
+        # sous self._lock; ordre d arrivee conserve: une grosse demande n est pas doublee
+        ready = []
+        while self._waiting and self.reserved + self._waiting[0][0] <= self.capacity:
+            nbytes, fn = self._waiting.popleft()
+            self.reserved += nbytes
+            ready.append((nbytes, fn))
+        return ready
+
+    def release(self, nbytes: int) -> None:
+        with self._lock:
+            self.reserved -= nbytes
+            ready = self._pop_ready()
+        for reserved, fn in ready:
+            fn(reserved)
+
+
+image_memory_budget = _MemoryBudget(
+    IMAGE_MEMORY_BUDGET_MB * 1024 * 1024
+    if IMAGE_MEMORY_BUDGET_MB > 0
+    else _container_memory_bytes() // 2 // WEB_CONCURRENCY
 )
+logging.info("image memory budget %s MB", image_memory_budget.capacity // (1024 * 1024))
 
 
 def _now_ts() -> int:
@@ -151,60 +358,247 @@ def _new_id() -> str:
     return uuid.uuid4().hex
 
 
-def _db_connect() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH, timeout=60, check_same_thread=False)
+_db_local = threading.local()
+
+
+def _db_open() -> sqlite3.Connection:
+    conn = sqlite3.connect(DB_PATH, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000, cached_statements=256)
     conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS};")
+    conn.execute("PRAGMA synchronous=NORMAL;")
+    conn.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_KB};")
+    conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_BYTES};")
+    conn.execute("PRAGMA temp_store=MEMORY;")
+    return conn
+
+
+def _db_connect() -> sqlite3.Connection:
+    """Connexion sqlite du thread courant, ouverte une seule fois (schema et requetes preparees en cache).
+
+    A utiliser avec `with`, qui commit/rollback sans fermer la connexion.
+    """
+    key = (os.getpid(), DB_PATH)
+    conn = getattr(_db_local, "conn", None)
+    if conn is None or getattr(_db_local, "key", None) != key:
+        conn = _db_open()
+        _db_local.conn = conn
+        _db_local.key = key
     return conn
 
 
+def _db_migrate_base(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS jobs (
+          id TEXT PRIMARY KEY,
+          session_id TEXT NOT NULL,
+          media_type TEXT,
+          original_filename TEXT NOT NULL,
+          action TEXT NOT NULL,
+          target_format TEXT,
+          comp_mode TEXT,
+          comp_value TEXT,
+          status TEXT NOT NULL,
+          error TEXT,
+          created_at INTEGER NOT NULL,
+          started_at INTEGER,
+          done_at INTEGER,
+          expires_at INTEGER,
+          input_path TEXT NOT NULL,
+          output_path TEXT,
+          output_filename TEXT
+        );
+        """
+    )
+    # bases creees avant l ajout de ces colonnes
+    columns = {r["name"] for r in conn.execute("PRAGMA table_info(jobs);")}
+    if "media_type" not in columns:
+        conn.execute("ALTER TABLE jobs ADD COLUMN media_type TEXT;")
+    if "params" not in columns:
+        conn.execute("ALTER TABLE jobs ADD COLUMN params TEXT;")
+
+
+def _db_migrate_hot_query_indexes(conn: sqlite3.Connection) -> None:
+    # admission: comptage des jobs actifs d une session (partiel et couvrant)
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_jobs_session_active
+        ON jobs(session_id, status) WHERE status IN ('queued', 'processing');
+        """
+    )
+    # listing: tri par created_at et filtre d expiration lus dans l index
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_jobs_session_listing
+        ON jobs(session_id, created_at, expires_at);
+        """
+    )
+    conn.execute("DROP INDEX IF EXISTS idx_jobs_session_created;")
+    # nettoyage: les deux branches du OR ont leur index (MULTI-INDEX OR)
+    conn.execute("DROP INDEX IF EXISTS idx_jobs_expires;")
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_jobs_expires
+        ON jobs(expires_at) WHERE expires_at IS NOT NULL;
+        """
+    )
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_jobs_created
+        ON jobs(created_at);
+        """
+    )
+
+
+def _db_migrate_session_stats(conn: sqlite3.Connection) -> None:
+    # compteurs par session tenus par triggers: admission et compteurs UI sans scan de jobs
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS session_stats (
+          session_id TEXT PRIMARY KEY,
+          queued INTEGER NOT NULL DEFAULT 0,
+          processing INTEGER NOT NULL DEFAULT 0,
+          done INTEGER NOT NULL DEFAULT 0,
+          error INTEGER NOT NULL DEFAULT 0
+        );
+        """
+    )
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_jobs_stats_insert AFTER INSERT ON jobs
+        BEGIN
+          INSERT OR IGNORE INTO session_stats(session_id) VALUES (NEW.session_id);
+          UPDATE session_stats SET
+            queued = queued + (NEW.status = 'queued'),
+            processing = processing + (NEW.status = 'processing'),
+            done = done + (NEW.status = 'done'),
+            error = error + (NEW.status = 'error')
+          WHERE session_id = NEW.session_id;
+        END;
+        """
+    )
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_jobs_stats_status AFTER UPDATE OF status ON jobs
+        WHEN OLD.status IS NOT NEW.status
+        BEGIN
+          UPDATE session_stats SET
+            queued = queued + (NEW.status = 'queued') - (OLD.status = 'queued'),
+            processing = processing + (NEW.status = 'processing') - (OLD.status = 'processing'),
+            done = done + (NEW.status = 'done') - (OLD.status = 'done'),
+            error = error + (NEW.status = 'error') - (OLD.status = 'error')
+          WHERE session_id = NEW.session_id;
+        END;
+        """
+    )
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_jobs_stats_delete AFTER DELETE ON jobs
+        BEGIN
+          UPDATE session_stats SET
+            queued = queued - (OLD.status = 'queued'),
+            processing = processing - (OLD.status = 'processing'),
+            done = done - (OLD.status = 'done'),
+            error = error - (OLD.status = 'error')
+          WHERE session_id = OLD.session_id;
+          DELETE FROM session_stats
+          WHERE session_id = OLD.session_id
+          AND queued = 0 AND processing = 0 AND done = 0 AND error = 0;
+        END;
+        """
+    )
+    conn.execute("DELETE FROM session_stats;")
+    conn.execute(
+        """
+        INSERT INTO session_stats (session_id, queued, processing, done, error)
+        SELECT session_id,
+          SUM(status = 'queued'), SUM(status = 'processing'),
+          SUM(status = 'done'), SUM(status = 'error')
+        FROM jobs
+        GROUP BY session_id;
+        """
+    )
+    # le comptage des jobs actifs ne lit plus jobs
+    conn.execute("DROP INDEX IF EXISTS idx_jobs_session_active;")
+
+
+def _db_migrate_listing_cursor_index(conn: sqlite3.Connection) -> None:
+    # pagination (created_at, id): l index donne l ordre complet, sans tri temporaire
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_jobs_session_page
+        ON jobs(session_id, created_at, id, expires_at);
+        """
+    )
+    conn.execute("DROP INDEX IF EXISTS idx_jobs_session_listing;")
+
+
+def _db_migrate_job_history(conn: sqlite3.Connection) -> None:
+    # une ligne par job termine, conservee apres la purge de jobs; ni session ni nom de fichier
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS job_history (
+          job_id TEXT NOT NULL,
+          media_type TEXT NOT NULL,
+          action TEXT NOT NULL,
+          target_format TEXT NOT NULL,
+          input_ext TEXT,
+          status TEXT NOT NULL,
+          finished_at INTEGER NOT NULL,
+          queue_wait_ms INTEGER,
+          probe_ms INTEGER,
+          encode_ms INTEGER,
+          write_ms INTEGER,
+          total_ms INTEGER,
+          input_bytes INTEGER,
+          output_bytes INTEGER,
+          media TEXT
+        );
+        """
+    )
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_job_history_finished
+        ON job_history(finished_at);
+        """
+    )
+
+
+# Version n = _DB_MIGRATIONS[n - 1] appliquee; stockee dans PRAGMA user_version
+_DB_MIGRATIONS = (
+    _db_migrate_base,
+    _db_migrate_hot_query_indexes,
+    _db_migrate_session_stats,
+    _db_migrate_listing_cursor_index,
+    _db_migrate_job_history,
+)
+
+
+def _db_schema_version(conn: sqlite3.Connection) -> int:
+    return int(conn.execute("PRAGMA user_version;").fetchone()[0])
+
+
 def _db_init() -> None:
-    # Small random delay to prevent simultaneous DB init from multiple workers
-    time.sleep(0.1 * (os.getpid() % 5))
-    with _db_connect() as conn:
-        conn.execute("PRAGMA journal_mode=WAL;")
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS jobs (
-              id TEXT PRIMARY KEY,
-              session_id TEXT NOT NULL,
-              media_type TEXT,
-              original_filename TEXT NOT NULL,
-              action TEXT NOT NULL,
-              target_format TEXT,
-              comp_mode TEXT,
-              comp_value TEXT,
-              status TEXT NOT NULL,
-              error TEXT,
-              created_at INTEGER NOT NULL,
-              started_at INTEGER,
-              done_at INTEGER,
-              expires_at INTEGER,
-              input_path TEXT NOT NULL,
-              output_path TEXT,
-              output_filename TEXT
-            );
-            """
-        )
-        try:
-            conn.execute("ALTER TABLE jobs ADD COLUMN media_type TEXT;")
-        except sqlite3.OperationalError:
-            pass
+    """Applique les migrations manquantes, sous verrou fichier partage par les workers."""
+    with open(f"{DB_PATH}.lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
         try:
-            conn.execute("ALTER TABLE jobs ADD COLUMN params TEXT;")
-        except sqlite3.OperationalError:
-            pass
-        conn.execute(
-            """
-            CREATE INDEX IF NOT EXISTS idx_jobs_session_created
-            ON jobs(session_id, created_at);
-            """
-        )
-        conn.execute(
-            """
-            CREATE INDEX IF NOT EXISTS idx_jobs_expires
-            ON jobs(expires_at);
-            """
-        )
+            conn = _db_open()
+            try:
+                conn.execute("PRAGMA journal_mode=WAL;")
+                for version, migrate in enumerate(_DB_MIGRATIONS, start=1):
+                    if _db_schema_version(conn) >= version:
+                        continue
+                    with conn:
+                        conn.execute("BEGIN IMMEDIATE;")
+                        migrate(conn)
+                        conn.execute(f"PRAGMA user_version = {version};")
+                    logging.info("db schema migrated to version %s", version)
+                conn.execute("PRAGMA optimize;")
+            finally:
+                conn.close()
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
 
 
 def _db_get_job(job_id: str) -> sqlite3.Row | None:
@@ -222,61 +616,93 @@ def _db_get_job_for_session(job_id: str, session_id: str) -> sqlite3.Row | None:
         return row
 
 
-def _db_count_active_for_session(session_id: str) -> int:
+_SQL_SESSION_STATS = """
+    SELECT queued, processing, done, error
+    FROM session_stats
+    WHERE session_id = ?
+"""
+
+
+def _db_session_stats(session_id: str) -> dict:
+    """Compteurs de jobs par statut pour une session (lecture O(1), tenus par triggers)."""
     with _db_connect() as conn:
-        row = conn.execute(
-            """
-            SELECT COUNT(*) AS n
-            FROM jobs
-            WHERE session_id = ?
-            AND status IN ('queued', 'processing')
-            """,
-            (session_id,),
-        ).fetchone()
-        return int(row["n"])
+        row = conn.execute(_SQL_SESSION_STATS, (session_id,)).fetchone()
+    if row is None:
+        return {"queued": 0, "processing": 0, "done": 0, "error": 0}
+    return {k: int(row[k]) for k in ("queued", "processing", "done", "error")}
 
 
-def _db_list_jobs_for_session(session_id: str, limit: int = 100) -> list[dict]:
-    now_ts = _now_ts()
+def _db_count_active_for_session(session_id: str) -> int:
+    stats = _db_session_stats(session_id)
+    return stats["queued"] + stats["processing"]
+
+
+# Champs exposes par le listing, dans l ordre de la reponse (download_url est derive)
+_JOB_LIST_FIELDS = (
+    "id", "media_type", "original_filename", "action", "target_format", "comp_mode", "comp_value",
+    "status", "error", "created_at", "started_at", "done_at", "expires_at", "output_filename",
+    "output_path", "input_path", "params", "download_url",
+)
+
+
+def _sql_list_for_session(columns: list[str], *, with_cursor: bool) -> str:
+    """Listing pagine par curseur (created_at, id) decroissant; columns vient de _JOB_LIST_FIELDS."""
+    cursor = "AND (created_at < ? OR (created_at = ? AND id < ?))" if with_cursor else ""
+    return f"""
+        SELECT {', '.join(columns)}
+        FROM jobs
+        WHERE session_id = ?
+        AND (expires_at IS NULL OR expires_at > ?)
+        {cursor}
+        ORDER BY created_at DESC, id DESC
+        LIMIT ?
+    """
+
+
+def _db_list_jobs_for_session(
+    session_id: str,
+    limit: int = 100,
+    *,
+    after: tuple[int, str] | None = None,
+    fields: set[str] | None = None,
+) -> tuple[list[dict], tuple[int, str] | None]:
+    """Une page de jobs (projection optionnelle) et le curseur de la page suivante."""
+    wanted = [f for f in _JOB_LIST_FIELDS if fields is None or f in fields]
+    columns = {"id", "created_at"} | {f for f in wanted if f != "download_url"}
+    if "download_url" in wanted:
+        columns.add("status")
+
+    args: list[object] = [session_id, _now_ts()]
+    if after is not None:
+        args.extend((after[0], after[0], after[1]))
+    args.append(limit)
+
+    sql = _sql_list_for_session(sorted(columns), with_cursor=after is not None)
     with _db_connect() as conn:
-        rows = conn.execute(
-            """
-            SELECT *
-            FROM jobs
-            WHERE session_id = ?
-            AND (expires_at IS NULL OR expires_at > ?)
-            ORDER BY created_at DESC
-            LIMIT ?
-            """,
-            (session_id, now_ts, limit),
-        ).fetchall()
+        rows = conn.execute(sql, args).fetchall()
 
     out: list[dict] = []
     for r in rows:
-        params_json = r["params"] if "params" in r.keys() else None
-        out.append(
-            {
-                "id": r["id"],
-                "media_type": r["media_type"],
-                "original_filename": r["original_filename"],
-                "action": r["action"],
-                "target_format": r["target_format"],
-                "comp_mode": r["comp_mode"],
-                "comp_value": r["comp_value"],
-                "status": r["status"],
-                "error": r["error"],
-                "created_at": r["created_at"],
-                "started_at": r["started_at"],
-                "done_at": r["done_at"],
-                "expires_at": r["expires_at"],
-                "output_filename": r["output_filename"],
-                "output_path": r["output_path"],
-                "input_path": r["input_path"],
-                "params": params_json,
-                "download_url": f"/download/{r['id']}" if r["status"] == "done" else None,
-            }
-        )
-    return out
+        job: dict = {}
+        for f in wanted:
+            if f == "download_url":
+                job[f] = f"/download/{r['id']}" if r["status"] == "done" else None
+            else:
+                job[f] = r[f]
+        out.append(job)
+
+    next_after = (rows[-1]["created_at"], rows[-1]["id"]) if len(rows) == limit else None
+    return out, next_after
+
+
+def _db_iter_jobs_for_session(session_id: str, *, fields: set[str] | None = None, page_size: int = 200):
+    """Tous les jobs non expires d une session, page par page."""
+    after: tuple[int, str] | None = None
+    while True:
+        jobs, after = _db_list_jobs_for_session(session_id, limit=page_size, after=after, fields=fields)
+        yield from jobs
+        if after is None:
+            return
 
 
 def _db_update_job(
@@ -289,7 +715,11 @@ def _db_update_job(
     expires_at: int | None = None,
     output_path: str | None = None,
     output_filename: str | None = None,
-) -> None:
+    params: dict | None = None,
+    if_status: str | None = None,
+) -> bool:
+    """Met a jour les champs fournis; avec if_status, seulement si le job a encore ce statut.
+    Retourne True si la ligne a ete modifiee."""
     fields: list[str] = []
     values: list[object] = []
 
@@ -321,13 +751,20 @@ def _db_update_job(
         fields.append("output_filename = ?")
         values.append(output_filename)
 
+    if params is not None:
+        fields.append("params = ?")
+        values.append(json.dumps(params))
+
     if not fields:
-        return
+        return False
 
     values.append(job_id)
     sql = f"UPDATE jobs SET {', '.join(fields)} WHERE id = ?"
+    if if_status is not None:
+        sql += " AND status = ?"
+        values.append(if_status)
     with _db_connect() as conn:
-        conn.execute(sql, tuple(values))
+        return conn.execute(sql, tuple(values)).rowcount > 0
 
 
 def _db_delete_job(job_id: str) -> None:
@@ -335,48 +772,390 @@ def _db_delete_job(job_id: str) -> None:
         conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
 
 
-def _db_collect_expired_jobs(now_ts: int) -> list[sqlite3.Row]:
+def _db_delete_jobs(job_ids: list[str]) -> None:
+    """Supprime un lot de jobs dans une seule transaction."""
+    if not job_ids:
+        return
+    with _db_connect() as conn:
+        conn.executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in job_ids])
+
+
+_SQL_COLLECT_EXPIRED = """
+    SELECT id, input_path, output_path
+    FROM jobs
+    WHERE (expires_at IS NOT NULL AND expires_at <= ?)
+    OR (created_at <= ?)
+    LIMIT ?
+"""
+
+
+def _db_collect_expired_jobs(now_ts: int, *, limit: int = 500) -> list[sqlite3.Row]:
+    """Lot borne de jobs expires; le lot suivant apparait une fois celui-ci supprime."""
     with _db_connect() as conn:
         rows = conn.execute(
-            """
-            SELECT *
-            FROM jobs
-            WHERE (expires_at IS NOT NULL AND expires_at <= ?)
-            OR (created_at <= ?)
-            """,
-            (now_ts, now_ts - 86400),  # Clean explicitly expired OR zombies older than 24h
+            _SQL_COLLECT_EXPIRED,
+            (now_ts, now_ts - 86400, limit),  # Clean explicitly expired OR zombies older than 24h
         ).fetchall()
         return rows
 
 
-def _cleanup_loop() -> None:
+def _db_record_job_history(record: dict) -> None:
+    columns = list(record)
+    with _db_connect() as conn:
+        conn.execute(
+            f"INSERT INTO job_history ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+            tuple(record[c] for c in columns),
+        )
+
+
+def _db_prune_job_history(now_ts: int, *, limit: int = 500) -> int:
+    cutoff = now_ts - JOB_HISTORY_RETENTION_DAYS * 86400
+    with _db_connect() as conn:
+        cur = conn.execute(
+            "DELETE FROM job_history WHERE rowid IN (SELECT rowid FROM job_history WHERE finished_at < ? LIMIT ?)",
+            (cutoff, limit),
+        )
+        return cur.rowcount
+
+
+_SQL_JOB_HISTORY_WINDOW = """
+    SELECT media_type, action, target_format, status,
+      queue_wait_ms, probe_ms, encode_ms, write_ms, total_ms, input_bytes
+    FROM job_history
+    WHERE finished_at >= ?
+"""
+
+
+def _db_job_history_window(since_ts: int, filters: dict[str, str]) -> list[sqlite3.Row]:
+    sql = _SQL_JOB_HISTORY_WINDOW
+    values: list[object] = [since_ts]
+    for column in ("media_type", "action", "target_format"):
+        if filters.get(column):
+            sql += f" AND {column} = ?"
+            values.append(filters[column])
+    with _db_connect() as conn:
+        return conn.execute(sql, tuple(values)).fetchall()
+
+
+def _archive_name_for_job(job: dict) -> str:
+    """Nom de l entree zip d un job, en conservant l arborescence d origine si fournie."""
+    out_path = job["output_path"]
+    filename = job.get("output_filename") or os.path.basename(out_path)
+
+    try:
+        params = json.loads(job.get("params") or "{}")
+    except json.JSONDecodeError:
+        params = {}
+    rel_path = _sanitize_relative_path(params.get("relative_path")) if isinstance(params, dict) else None
+
+    is_cover = isinstance(params, dict) and params.get("is_cover")
+
+    if rel_path:
+        rel_base, rel_ext = os.path.splitext(rel_path)
+        if job.get("action") == "convert" and job.get("target_format") and not is_cover:
+            fmt = job["target_format"].lstrip(".")
+            if fmt == "auto":
+                # format choisi a l encodage
+                fmt = os.path.splitext(filename)[1].lstrip(".")
+            return f"{rel_base}.{fmt}"
+        if job.get("action") == "srcset":
+            # meme nom que output_filename dans _run_job
+            return f"{rel_base}_srcset.zip"
+        return rel_path
+    return filename
+
+
+def _session_archive_paths(session_id: str) -> tuple[str, str]:
+    """(archive de travail alimentee par les jobs, copie publiee servie par download-all)"""
+    base = os.path.join(ARCHIVE_DIR, secure_filename(session_id))
+    return f"{base}.part.zip", f"{base}.zip"
+
+
+@contextlib.contextmanager
+def _session_archive_lock(session_id: str):
+    # flock: exclusion entre threads et entre workers gunicorn
+    lock_path = os.path.join(ARCHIVE_DIR, f"{secure_filename(session_id)}.lock")
     while True:
+        with open(lock_path, "a") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                # fichier de verrou supprime par la purge pendant l attente: reprendre sur le nouveau
+                try:
+                    current = os.stat(lock_path).st_ino == os.fstat(fh.fileno()).st_ino
+                except FileNotFoundError:
+                    current = False
+                if current:
+                    yield
+                    return
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def _session_archive_job_ids(zf: zipfile.ZipFile) -> set[str]:
+    # l id du job est stocke dans le commentaire de chaque entree
+    return {info.comment.decode("ascii", "ignore") for info in zf.infolist() if info.comment}
+
+
+def _session_archive_write(zf: zipfile.ZipFile, job: dict) -> None:
+    zf.write(job["output_path"], _archive_name_for_job(job))
+    zf.infolist()[-1].comment = job["id"].encode("ascii")
+
+
+def _session_archive_append(session_id: str, job: dict) -> None:
+    """Ajoute la sortie d un job termine; seul le repertoire central est reecrit."""
+    working, _ = _session_archive_paths(session_id)
+    with _session_archive_lock(session_id):
+        mode = "a" if os.path.exists(working) else "w"
+        with zipfile.ZipFile(working, mode, zipfile.ZIP_DEFLATED) as zf:
+            if job["id"] not in _session_archive_job_ids(zf):
+                _session_archive_write(zf, job)
+
+
+def _session_archive_publish(session_id: str, done_jobs: list[dict]) -> str:
+    """Met l archive de travail en phase avec les jobs termines et retourne la copie publiee."""
+    working, published = _session_archive_paths(session_id)
+    wanted = {j["id"]: j for j in done_jobs}
+
+    with _session_archive_lock(session_id):
+        present: set[str] | None = None
+        if os.path.exists(working):
+            try:
+                with zipfile.ZipFile(working) as zf:
+                    present = _session_archive_job_ids(zf)
+            except zipfile.BadZipFile:
+                present = None
+
+        if present is None or not present <= wanted.keys():
+            # jobs expires/supprimes ou archive abimee: on repart de zero
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(working)
+            present = set()
+
+        missing = [job for job_id, job in wanted.items() if job_id not in present]
+        if missing or not os.path.exists(working):
+            mode = "a" if os.path.exists(working) else "w"
+            with zipfile.ZipFile(working, mode, zipfile.ZIP_DEFLATED) as zf:
+                for job in missing:
+                    _session_archive_write(zf, job)
+
+        # Publication par copie noyau + rename atomique: un telechargement en cours
+        # garde l ancien inode et n est jamais corrompu par un ajout concurrent.
+        w_st = os.stat(working)
         try:
-            now_ts = _now_ts()
-            rows = _db_collect_expired_jobs(now_ts)
-            for r in rows:
-                in_path = r["input_path"]
-                out_path = r["output_path"]
+            p_st = os.stat(published)
+            up_to_date = (p_st.st_size, p_st.st_mtime_ns) == (w_st.st_size, w_st.st_mtime_ns)
+        except FileNotFoundError:
+            up_to_date = False
+        if not up_to_date:
+            tmp = f"{published}.{_new_id()}.tmp"
+            shutil.copy2(working, tmp)
+            os.replace(tmp, published)
+
+    return published
+
+
+def _session_archive_remove(session_id: str) -> None:
+    with _session_archive_lock(session_id):
+        for path in _session_archive_paths(session_id):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+
+
+def _session_archive_base(name: str) -> str | None:
+    # X.lock, X.part.zip, X.zip, X.zip.<id>.tmp (copie en cours de publication) -> X
+    if name.endswith(".tmp"):
+        name = name[: -len(".tmp")].rsplit(".", 1)[0]
+    for suffix in (".lock", ".part.zip", ".zip"):
+        if name.endswith(suffix):
+            return name[: -len(suffix)]
+    return None
 
-                if in_path and os.path.exists(in_path):
-                    try:
-                        os.remove(in_path)
-                    except OSError:
-                        pass
 
-                if out_path and os.path.exists(out_path):
+def _prune_session(base: str, paths: list[str], cutoff: int) -> None:
+    """Supprime les fichiers inactifs d une session sous son verrou, sans attendre: une session
+    en cours d ajout ou de publication est laissee pour le prochain passage."""
+    lock_path = f"{base}.lock"
+    try:
+        with open(lock_path, "a") as fh:
+            try:
+                fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return
+            try:
+                for path in paths:
                     try:
-                        os.remove(out_path)
-                    except OSError:
+                        st = os.stat(path)
+                        # copy2 reporte le mtime de l archive sur la copie: age d une copie = sa creation
+                        if (st.st_ctime if path.endswith(".tmp") else st.st_mtime) <= cutoff:
+                            os.remove(path)
+                    except FileNotFoundError:
                         pass
+                # verrou supprime en dernier: un nouvel arrivant revalide l inode et reprend
+                if not any(os.path.exists(f"{base}{suffix}") for suffix in (".part.zip", ".zip")):
+                    os.remove(lock_path)
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+    except OSError:
+        pass
+
+
+def _prune_session_archives(now_ts: int) -> None:
+    # archives de sessions inactives: tous leurs jobs ont expire
+    cutoff = now_ts - RETENTION_SECONDS
+    sessions: dict[str, list[str]] = {}
+    with os.scandir(ARCHIVE_DIR) as it:
+        for entry in it:
+            base = _session_archive_base(entry.name)
+            try:
+                if base is None or not entry.is_file() or entry.stat().st_mtime > cutoff:
+                    continue
+            except OSError:
+                continue
+            paths = sessions.setdefault(os.path.join(ARCHIVE_DIR, base), [])
+            if not entry.name.endswith(".lock"):
+                paths.append(entry.path)
+    for base, paths in sessions.items():
+        _prune_session(base, paths, cutoff)
+
+
+def _unlink_batch(paths: list[str | None]) -> int:
+    """Supprime les fichiers d un lot; un fichier deja absent n est pas une erreur."""
+    removed = 0
+    for path in paths:
+        if not path:
+            continue
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+        except OSError:
+            logging.warning("cleanup: suppression impossible %s", path)
+    return removed
+
 
-                _db_delete_job(r["id"])
+def _cleanup_sweep(now_ts: int) -> int:
+    """Purge les jobs expires par lots, une transaction par lot, dans un budget de temps."""
+    deadline = time.monotonic() + CLEANUP_SWEEP_BUDGET_SECONDS
+    deleted = 0
+    while time.monotonic() < deadline:
+        rows = _db_collect_expired_jobs(now_ts, limit=CLEANUP_BATCH_SIZE)
+        if not rows:
+            break
+
+        _unlink_batch([p for r in rows for p in (r["input_path"], r["output_path"])])
+        _db_delete_jobs([r["id"] for r in rows])
+        deleted += len(rows)
+        if len(rows) < CLEANUP_BATCH_SIZE:
+            break
+
+    if deleted:
+        logging.info("cleanup removed %s jobs", deleted)
+    return deleted
+
+
+def _cleanup_loop() -> None:
+    while True:
+        try:
+            now_ts = _now_ts()
+            _cleanup_sweep(now_ts)
+            _prune_session_archives(now_ts)
+            _db_prune_job_history(now_ts, limit=CLEANUP_BATCH_SIZE)
         except Exception as e:
             logging.exception("cleanup failed")
 
         time.sleep(CLEANUP_INTERVAL_SECONDS)
 
 
+_JOB_ID_PREFIX_RE = re.compile(r"^([0-9a-f]{32})")
+
+_orphan_stats = {"runs": 0, "files": 0, "bytes": 0, "last_run_at": None}
+
+
+def _db_existing_job_ids(job_ids: list[str]) -> set[str]:
+    found: set[str] = set()
+    with _db_connect() as conn:
+        for i in range(0, len(job_ids), 500):
+            chunk = job_ids[i:i + 500]
+            rows = conn.execute(
+                f"SELECT id FROM jobs WHERE id IN ({','.join('?' * len(chunk))})",
+                chunk,
+            ).fetchall()
+            found.update(r["id"] for r in rows)
+    return found
+
+
+def _remove_if_older(entry: os.DirEntry, cutoff: float) -> int | None:
+    """Supprime l entree si plus ancienne que cutoff; retourne les octets recuperes (None si conservee)."""
+    try:
+        st = entry.stat(follow_symlinks=False)
+        if not entry.is_file(follow_symlinks=False) or st.st_mtime > cutoff:
+            return None
+        os.remove(entry.path)
+        return st.st_size
+    except OSError:
+        return None
+
+
+def _reconcile_orphans(now_ts: int) -> tuple[int, int]:
+    """Parcourt uploads/, processed/ et les logs two-pass par lots et supprime les orphelins."""
+    cutoff = now_ts - ORPHAN_GRACE_SECONDS
+    files = 0
+    reclaimed = 0
+
+    def _reclaim(batch: list[tuple[str, os.DirEntry]]) -> None:
+        nonlocal files, reclaimed
+        known = _db_existing_job_ids(list({job_id for job_id, _ in batch}))
+        for job_id, entry in batch:
+            if job_id in known:
+                continue
+            size = _remove_if_older(entry, cutoff)
+            if size is not None:
+                files += 1
+                reclaimed += size
+
+    for directory in (UPLOAD_DIR, PROCESSED_DIR):
+        batch: list[tuple[str, os.DirEntry]] = []
+        with os.scandir(directory) as it:
+            for entry in it:
+                match = _JOB_ID_PREFIX_RE.match(entry.name)
+                if not match:
+                    continue
+                batch.append((match.group(1), entry))
+                if len(batch) >= ORPHAN_SCAN_BATCH:
+                    _reclaim(batch)
+                    batch = []
+        if batch:
+            _reclaim(batch)
+
+    # logs two-pass laisses par un crash ffmpeg/worker
+    with os.scandir(DATA_DIR) as it:
+        for entry in it:
+            if entry.name.startswith("ffpass_"):
+                size = _remove_if_older(entry, cutoff)
+                if size is not None:
+                    files += 1
+                    reclaimed += size
+
+    _orphan_stats["runs"] += 1
+    _orphan_stats["files"] += files
+    _orphan_stats["bytes"] += reclaimed
+    _orphan_stats["last_run_at"] = now_ts
+    if files:
+        logging.info("orphan reconciler removed %s files (%s bytes)", files, reclaimed)
+    return files, reclaimed
+
+
+def _orphan_reconciler_loop() -> None:
+    while True:
+        try:
+            _reconcile_orphans(_now_ts())
+        except Exception:
+            logging.exception("orphan reconciler failed")
+
+        time.sleep(ORPHAN_SCAN_INTERVAL_SECONDS)
+
+
 def _start_background_tasks_once() -> None:
     global _background_started
     if _background_started:
@@ -386,6 +1165,7 @@ def _start_background_tasks_once() -> None:
             return
         t = threading.Thread(target=_cleanup_loop, daemon=True)
         t.start()
+        threading.Thread(target=_orphan_reconciler_loop, daemon=True).start()
         _background_started = True
 
 
@@ -420,6 +1200,14 @@ def _save_session(response):
 
 
 def _get_video_info(path: str) -> dict | None:
+    with _job_phase("probe"):
+        info = _probe_video(path)
+    if info:
+        _job_note_media(**info)
+    return info
+
+
+def _probe_video(path: str) -> dict | None:
     try:
         cmd = [
             "ffprobe",
@@ -501,8 +1289,13 @@ def _process_video_to_gif(
         raise RuntimeError("ffmpeg gif conversion failed")
 
 
+def _natural_key(name: str) -> list:
+    # page2 avant page10
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r"(\d+)", name)]
+
+
 def _validate_action(action: str | None) -> str | None:
-    if action in {"convert", "compress"}:
+    if action in {"convert", "compress", "srcset"}:
         return action
     return None
 
@@ -517,9 +1310,12 @@ def _process_with_ffmpeg(
     comp_value: str | None,
     target_format: str | None = None,
     params: dict | None = None,
+    live_upload: "_IngestFile | None" = None,
 ) -> None:
     params = params or {}
-    cmd: list[str] = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y", "-i", input_path]
+    # upload encore en cours: ffmpeg lit stdin, alimente depuis le fichier qui grossit
+    input_arg = "pipe:0" if live_upload is not None else input_path
+    cmd: list[str] = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y", "-i", input_arg]
 
     is_video = ext in VIDEO_EXTENSIONS
     target_format = (target_format or "").lower().strip()
@@ -658,9 +1454,26 @@ def _process_with_ffmpeg(
 
     def _run(cmdline: list[str]) -> None:
         logging.info("FFmpeg command: %s", " ".join(cmdline))
-        result = subprocess.run(cmdline, capture_output=True, text=True, check=False)
-        if result.returncode != 0:
-            stderr = (result.stderr or "").strip()
+        if live_upload is None:
+            result = subprocess.run(cmdline, capture_output=True, text=True, check=False)
+            returncode, stderr = result.returncode, result.stderr
+        else:
+            proc = subprocess.Popen(
+                cmdline,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+                text=False,
+            )
+            feeder = threading.Thread(target=_feed_live_upload, args=(live_upload, proc.stdin), daemon=True)
+            feeder.start()
+            stderr = proc.stderr.read().decode("utf-8", "replace")
+            returncode = proc.wait()
+            feeder.join()
+            if live_upload.failed:
+                raise RuntimeError("upload interrompu")
+        if returncode != 0:
+            stderr = (stderr or "").strip()
             if stderr:
                 raise RuntimeError(stderr.splitlines()[-1])
             raise RuntimeError("ffmpeg a echoue")
@@ -682,6 +1495,23 @@ def _process_with_ffmpeg(
         _run([*cmd, output_path])
 
 
+def _feed_live_upload(upload: "_IngestFile", sink) -> None:
+    """Recopie l upload vers stdin de ffmpeg au rythme de sa reception."""
+    try:
+        with open(upload.path, "rb") as src:
+            while True:
+                chunk = src.read(1024 * 1024)
+                if chunk:
+                    sink.write(chunk)
+                elif not upload.wait_for_data(src.tell()):
+                    break
+    except (BrokenPipeError, OSError):
+        pass  # ffmpeg a quitte, son code retour fait foi
+    finally:
+        with contextlib.suppress(OSError):
+            sink.close()
+
+
 def _process_pdf(
     *,
     input_path: str,
@@ -731,141 +1561,1741 @@ def _process_pdf(
     raise ValueError("action non supportee")
 
 
-def _resize_preserve_aspect(img: Image.Image, max_dim: int) -> Image.Image:
-    """Downscale image to fit within max_dim while keeping aspect ratio. No upscaling."""
-    if not max_dim or max_dim <= 0:
-        return img
+# resolution par defaut des pages image -> PDF (ancien save Pillow resolution=100.0)
+_PDF_DEFAULT_DPI = 100.0
+# orientation EXIF -> /Rotate de la page (les orientations miroir passent par un decodage)
+_PDF_ORIENT_ROTATE = {3: 180, 6: 90, 8: 270}
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+class _PdfImage:
+    """Image d une page PDF: entrees du dictionnaire XObject et lecture differee du flux."""
+
+    def __init__(
+        self,
+        *,
+        width: int,
+        height: int,
+        entries: dict[str, str],
+        length: int,
+        chunks,
+        dpi: tuple[float, float],
+        rotate: int = 0,
+        method: str = "",
+    ) -> None:
+        self.width = width
+        self.height = height
+        self.entries = entries
+        self.length = length
+        self.chunks = chunks  # callable -> iterable de bytes, appele a l ecriture de la page
+        self.dpi = dpi
+        self.rotate = rotate
+        self.method = method
+
+
+def _pdf_dpi(info: dict) -> tuple[float, float]:
+    dpi = info.get("dpi")
+    try:
+        x, y = float(dpi[0]), float(dpi[1])
+    except (TypeError, ValueError, IndexError):
+        return (_PDF_DEFAULT_DPI, _PDF_DEFAULT_DPI)
+    # densite JFIF 1:1 sans unite et valeurs aberrantes: resolution par defaut
+    if x < 10 or y < 10:
+        return (_PDF_DEFAULT_DPI, _PDF_DEFAULT_DPI)
+    return (x, y)
+
+
+def _file_chunks(path: str, ranges: list[tuple[int, int]]):
+    def read():
+        with open(path, "rb") as f:
+            for offset, length in ranges:
+                f.seek(offset)
+                remaining = length
+                while remaining:
+                    chunk = f.read(min(remaining, 1024 * 1024))
+                    if not chunk:
+                        raise ValueError("fichier tronque")
+                    remaining -= len(chunk)
+                    yield chunk
+    return read
+
+
+def _read_jpeg_header(path: str) -> bytes | None:
+    """Segments d un JPEG jusqu au marqueur SOS (exclu); None si la structure est illisible."""
+    with open(path, "rb") as f:
+        data = f.read(2)
+        if data != b"\xff\xd8":
+            return None
+        while True:
+            head = f.read(2)
+            if len(head) < 2 or head[0] != 0xFF:
+                return None
+            if head[1] == 0xFF:  # octet de remplissage
+                data += head[:1]
+                f.seek(-1, os.SEEK_CUR)
+                continue
+            if head[1] == 0xDA:
+                return data
+            size = f.read(2)
+            if len(size) < 2:
+                return None
+            payload = f.read(int.from_bytes(size, "big") - 2)
+            data += head + size + payload
+
+
+def _pdf_jpeg_source(img: Image.Image, path: str, rotate: int) -> _PdfImage | None:
+    """JPEG insere sans recompression (DCTDecode), en-tete nettoye de ses metadonnees."""
+    colorspaces = {"L": "/DeviceGray", "RGB": "/DeviceRGB", "CMYK": "/DeviceCMYK"}
+    if img.mode not in colorspaces or img.info.get("bits", 8) != 8:
+        return None
+    entries = {"ColorSpace": colorspaces[img.mode], "BitsPerComponent": "8", "Filter": "/DCTDecode"}
+    if img.mode == "CMYK" and "adobe" in img.info:
+        # CMYK Adobe stocke inverse
+        entries["Decode"] = "[1 0 1 0 1 0 1 0]"
+    header = _read_jpeg_header(path)
+    if header is None:
+        return None
+    # en-tete sans EXIF/XMP/IPTC/commentaires (ni vignette), comme l ancien re-encodage Pillow
+    stripped = _rewrite_jpeg_segments(header, strip=True)
+    scan = _file_chunks(path, [(len(header), os.path.getsize(path) - len(header))])
+
+    def chunks():
+        yield stripped
+        yield from scan()
+
+    return _PdfImage(
+        width=img.width,
+        height=img.height,
+        entries=entries,
+        length=len(stripped) + os.path.getsize(path) - len(header),
+        chunks=chunks,
+        dpi=_pdf_dpi(img.info),
+        rotate=rotate,
+        method="jpeg",
+    )
 
-    width, height = img.size
-    if width <= max_dim and height <= max_dim:
-        return img
 
-    target = (max_dim, max_dim)
-    resized = ImageOps.contain(img, target, method=_LANCZOS)
-    return resized
+def _pdf_png_source(img: Image.Image, path: str, rotate: int) -> _PdfImage | None:
+    """Donnees IDAT d un PNG non entrelace, sans alpha, inserees telles quelles (FlateDecode + predicteur PNG)."""
+    header = palette = None
+    idat: list[tuple[int, int]] = []
+    with open(path, "rb") as f:
+        if f.read(8) != _PNG_SIGNATURE:
+            return None
+        while True:
+            head = f.read(8)
+            if len(head) < 8:
+                return None
+            length = int.from_bytes(head[:4], "big")
+            kind = head[4:]
+            if kind == b"IDAT":
+                idat.append((f.tell(), length))
+                f.seek(length + 4, os.SEEK_CUR)
+                continue
+            if kind == b"IEND":
+                break
+            if kind == b"tRNS":
+                return None  # transparence: pas d equivalent sans masque
+            data = f.read(length)
+            f.seek(4, os.SEEK_CUR)  # CRC
+            if kind == b"IHDR":
+                header = data
+            elif kind == b"PLTE":
+                palette = data
+    if header is None or not idat:
+        return None
 
+    width, height = int.from_bytes(header[0:4], "big"), int.from_bytes(header[4:8], "big")
+    bit_depth, color_type, interlace = header[8], header[9], header[12]
+    if interlace or color_type not in (0, 2, 3):
+        return None
+    if color_type == 0:
+        colorspace, colors = "/DeviceGray", 1
+    elif color_type == 2:
+        colorspace, colors = "/DeviceRGB", 3
+    else:
+        if not palette:
+            return None
+        colorspace, colors = f"[/Indexed /DeviceRGB {len(palette) // 3 - 1} <{palette.hex()}>]", 1
+    entries = {
+        "ColorSpace": colorspace,
+        "BitsPerComponent": str(bit_depth),
+        "Filter": "/FlateDecode",
+        "DecodeParms": f"<< /Predictor 15 /Colors {colors} /BitsPerComponent {bit_depth} /Columns {width} >>",
+    }
+    return _PdfImage(
+        width=width,
+        height=height,
+        entries=entries,
+        length=sum(length for _, length in idat),
+        chunks=_file_chunks(path, idat),
+        dpi=_pdf_dpi(img.info),
+        rotate=rotate,
+        method="png",
+    )
 
-def _encode_image_bytes(
-    *,
-    img: Image.Image,
-    out_ext: str,
-    quality: int,
-    lossless: bool,
-    has_alpha: bool,
-) -> bytes:
-    buffer = io.BytesIO()
 
-    if out_ext in (".jpg", ".jpeg"):
-        save_img = img.convert("RGB") if has_alpha else img
-        save_img.save(buffer, format="JPEG", quality=quality, optimize=True)
-        return buffer.getvalue()
+def _pdf_passthrough_source(img: Image.Image, path: str, params: dict) -> _PdfImage | None:
+    """Page sans recompression si le flux du fichier est directement utilisable par un lecteur PDF."""
+    rotate = 0
+    if _param_flag(params, "image_auto_orient"):
+        orientation = img.getexif().get(0x0112, 1)
+        if orientation != 1:
+            if orientation not in _PDF_ORIENT_ROTATE:
+                return None
+            rotate = _PDF_ORIENT_ROTATE[orientation]
+    if img.format == "JPEG":
+        return _pdf_jpeg_source(img, path, rotate)
+    if img.format == "PNG" and not getattr(img, "is_animated", False):
+        return _pdf_png_source(img, path, rotate)
+    return None
 
-    if out_ext == ".webp":
-        img.save(buffer, format="WEBP", quality=quality, lossless=lossless, method=6)
-        return buffer.getvalue()
 
-    if out_ext == ".png":
-        if has_alpha:
-            save_img = img.convert("RGBA")
-        else:
-            save_img = img.convert("RGB") if img.mode not in ("RGB", "L") else img
-        save_img.save(
-            buffer,
-            format="PNG",
-            optimize=True,
-            compress_level=9,
+def _pdf_encoded_source(img: Image.Image, *, dpi: tuple[float, float], effort: str = IMAGE_EFFORT) -> _PdfImage:
+    """Page depuis une image decodee: bitonal en Flate, le reste en JPEG q95."""
+    if img.mode == "1":
+        data = zlib.compress(img.tobytes(), 6)
+        entries = {"ColorSpace": "/DeviceGray", "BitsPerComponent": "1", "Filter": "/FlateDecode", "Decode": "[0 1]"}
+        method = "flate"
+    else:
+        if img.mode not in ("L", "RGB"):
+            img = img.convert("RGB")
+        data = _encode_image_bytes(img=img, out_ext=".jpg", quality=95, lossless=False, has_alpha=False, effort=effort)
+        colorspace = "/DeviceGray" if img.mode == "L" else "/DeviceRGB"
+        entries = {"ColorSpace": colorspace, "BitsPerComponent": "8", "Filter": "/DCTDecode"}
+        method = "encoded"
+    return _PdfImage(
+        width=img.width,
+        height=img.height,
+        entries=entries,
+        length=len(data),
+        chunks=lambda: (data,),
+        dpi=dpi,
+        method=method,
+    )
+
+
+class _PdfImageWriter:
+    """PDF ecrit page par page: chaque image est copiee dans le fichier des qu elle est ajoutee.
+
+    Objets 1 (catalogue) et 2 (arbre des pages) reserves, ecrits a la fermeture avec la table xref.
+    """
+
+    def __init__(self, f) -> None:
+        self._f = f
+        self._offsets: dict[int, int] = {}
+        self._kids: list[int] = []
+        self._next_id = 3
+        # 1.5: BitsPerComponent 16 des PNG 16 bits
+        f.write(b"%PDF-1.5\n%\xe2\xe3\xcf\xd3\n")
+
+    def _new_id(self) -> int:
+        obj_id = self._next_id
+        self._next_id += 1
+        return obj_id
+
+    def _begin(self, obj_id: int) -> None:
+        self._offsets[obj_id] = self._f.tell()
+        self._f.write(f"{obj_id} 0 obj\n".encode())
+
+    def _write_obj(self, obj_id: int, body: str) -> None:
+        self._begin(obj_id)
+        self._f.write(body.encode("latin-1") + b"\nendobj\n")
+
+    def _write_stream(self, obj_id: int, entries: str, length: int, chunks) -> None:
+        self._begin(obj_id)
+        self._f.write(f"<< {entries} /Length {length} >>\nstream\n".encode("latin-1"))
+        written = 0
+        for chunk in chunks:
+            self._f.write(chunk)
+            written += len(chunk)
+        if written != length:
+            raise ValueError("flux image incomplet")
+        self._f.write(b"\nendstream\nendobj\n")
+
+    def add_page(self, image: _PdfImage) -> None:
+        width_pt = image.width * 72.0 / image.dpi[0]
+        height_pt = image.height * 72.0 / image.dpi[1]
+
+        image_id = self._new_id()
+        entries = " ".join(f"/{key} {value}" for key, value in image.entries.items())
+        self._write_stream(
+            image_id,
+            f"/Type /XObject /Subtype /Image /Width {image.width} /Height {image.height} {entries}",
+            image.length,
+            image.chunks(),
         )
-        return buffer.getvalue()
 
-    if out_ext == ".gif":
-        gif_img = img.convert("P", palette=Image.ADAPTIVE, colors=max(16, min(256, quality * 2)))
-        gif_img.save(buffer, format="GIF", optimize=True)
-        return buffer.getvalue()
+        content = f"q {width_pt:.4f} 0 0 {height_pt:.4f} 0 0 cm /Im0 Do Q".encode()
+        content_id = self._new_id()
+        self._write_stream(content_id, "", len(content), (content,))
 
-    # Best effort fallback for other image formats.
+        page_id = self._new_id()
+        rotate = f" /Rotate {image.rotate}" if image.rotate else ""
+        self._write_obj(
+            page_id,
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width_pt:.4f} {height_pt:.4f}]{rotate}"
+            f" /Resources << /XObject << /Im0 {image_id} 0 R >> >> /Contents {content_id} 0 R >>",
+        )
+        self._kids.append(page_id)
+
+    def close(self) -> None:
+        kids = " ".join(f"{kid} 0 R" for kid in self._kids)
+        self._write_obj(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(self._kids)} >>")
+        self._write_obj(1, "<< /Type /Catalog /Pages 2 0 R >>")
+        xref_at = self._f.tell()
+        size = self._next_id
+        lines = [f"xref\n0 {size}\n", "0000000000 65535 f \n"]
+        lines.extend(f"{self._offsets[obj_id]:010d} 00000 n \n" for obj_id in range(1, size))
+        lines.append(f"trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{xref_at}\n%%EOF\n")
+        self._f.write("".join(lines).encode())
+
+
+def _write_pdf_pages(output_path: str, pages) -> int:
+    """Ecrit les pages (iterable de _PdfImage) dans l ordre; retourne le nombre de pages."""
+    count = 0
+    with open(output_path, "wb") as f:
+        writer = _PdfImageWriter(f)
+        for page in pages:
+            writer.add_page(page)
+            count += 1
+        if not count:
+            raise ValueError("aucune page")
+        writer.close()
+    return count
+
+
+def _pdf_page_source(path: str, params: dict, effort: str, result: Future, abandoned: threading.Event) -> None:
+    """Une page du PDF assemble: flux copie si possible, sinon decodage differe jusqu a sa reserve
+    sur le budget memoire image (file commune avec les jobs image, aucun thread bloque)."""
+    if not result.set_running_or_notify_cancel():
+        return
     try:
-        img.save(buffer, quality=quality, optimize=True)
-    except TypeError:
-        img.save(buffer, optimize=True)
-    return buffer.getvalue()
+        with Image.open(path) as img:
+            if _requested_resize(params, img.size) is None:
+                source = _pdf_passthrough_source(img, path, params)
+                if source is not None:
+                    result.set_result(source)
+                    return
+        probe = _estimate_image_memory(path, params) or {}
+    except BaseException as e:
+        result.set_exception(e)
+        return
 
+    def start(reserved: int) -> None:
+        try:
+            pdf_page_executor.submit(_pdf_page_decoded, path, params, effort, result, abandoned, reserved)
+        except BaseException as e:  # pool arrete
+            image_memory_budget.release(reserved)
+            result.set_exception(e)
 
-def _save_image_with_target_size(
-    *,
-    img: Image.Image,
-    output_path: str,
-    target_size_mb: float,
-    has_alpha: bool,
-) -> bool:
-    if target_size_mb <= 0:
-        return False
+    image_memory_budget.submit(probe.get("mem_bytes") or 0, start)
 
-    target_bytes = int(target_size_mb * 1024 * 1024)
-    if target_bytes <= 0:
-        return False
 
-    _, out_ext = os.path.splitext(output_path)
-    out_ext = out_ext.lower()
+def _pdf_page_decoded(
+    path: str, params: dict, effort: str, result: Future, abandoned: threading.Event, reserved: int
+) -> None:
+    """Page decodee (reduite au besoin) et re-encodee; la reserve est rendue une fois les octets encodes."""
+    try:
+        if abandoned.is_set():
+            result.set_exception(RuntimeError("assemblage abandonne"))
+            return
+        with Image.open(path) as img:
+            _check_decode_pixels(img.width, img.height)
+            dpi = _pdf_dpi(img.info)
+            orientation = img.getexif().get(0x0112, 1) if _param_flag(params, "image_auto_orient") else 1
+            size = _requested_resize(params, img.size)
+            if size is not None:
+                # meme format physique de page: la resolution suit la reduction
+                dpi = (dpi[0] * size[0] / img.width, dpi[1] * size[1] / img.height)
+                img = _resize_with_draft(img, size)
+            if orientation in _EXIF_TRANSPOSE:
+                # apres la reduction, comme _process_image
+                img = img.transpose(_EXIF_TRANSPOSE[orientation])
+                if orientation >= 5:
+                    dpi = (dpi[1], dpi[0])
+            result.set_result(_pdf_encoded_source(img, dpi=dpi, effort=effort))
+    except BaseException as e:
+        result.set_exception(e)
+    finally:
+        image_memory_budget.release(reserved)
 
-    if out_ext in (".jpg", ".jpeg", ".webp", ".gif"):
-        lo, hi = 10, 95
-        best: bytes | None = None
-
-        while lo <= hi:
-            mid = (lo + hi) // 2
-            encoded = _encode_image_bytes(
-                img=img,
-                out_ext=out_ext,
-                quality=mid,
-                lossless=False,
-                has_alpha=has_alpha,
+
+def _pdf_pages_in_order(paths: list[str], params: dict, effort: str, window: int):
+    """Pages preparees en parallele, rendues dans l ordre; au plus window pages en preparation ou pretes
+    en plus de celle en cours d ecriture."""
+    pending: collections.deque = collections.deque()
+    remaining = iter(paths)
+    abandoned = threading.Event()
+
+    def submit_next() -> None:
+        path = next(remaining, None)
+        if path is not None:
+            result: Future = Future()
+            pending.append(result)
+            pdf_page_executor.submit(_pdf_page_source, path, params, effort, result, abandoned)
+
+    try:
+        for _ in range(window):
+            submit_next()
+        while pending:
+            page = pending.popleft().result()
+            submit_next()
+            yield page
+    finally:
+        # erreur ou abandon: les pages pas encore demarrees ou en attente de memoire ne sont pas decodees
+        abandoned.set()
+        for future in pending:
+            future.cancel()
+
+
+def _assemble_pdf(*, output_path: str, params: dict) -> None:
+    """Plusieurs images (sorties de jobs) -> un PDF, une page par image, dans l ordre de params["pdf_pages"]."""
+    paths = [page["path"] for page in params.get("pdf_pages") or []]
+    for path in paths:
+        if not path or not os.path.exists(path):
+            raise ValueError("page manquante (job expire ou supprime)")
+    effort = _image_effort(params)
+    window = PDF_PAGE_WINDOW if PDF_PAGE_WINDOW > 0 else 2 * PDF_PAGE_WORKERS
+
+    methods: collections.Counter = collections.Counter()
+
+    def counted(pages):
+        for page in pages:
+            methods[page.method] += 1
+            yield page
+
+    _write_pdf_pages(output_path, counted(_pdf_pages_in_order(paths, params, effort, window)))
+    _job_note_media(pages=len(paths), pdf_embed=dict(methods), page_window=window)
+
+
+# decodage reduit: au moins 2x la cible, reduce() entier puis LANCZOS sur le dernier facteur
+_DRAFT_REDUCING_GAP = 2
+
+
+def _contain_size(width: int, height: int, max_dim: int) -> tuple[int, int]:
+    # meme arrondi que ImageOps.contain dans une boite max_dim x max_dim
+    if width == height:
+        return (max_dim, max_dim)
+    if width > height:
+        return (max_dim, round(height / width * max_dim))
+    return (round(width / height * max_dim), max_dim)
+
+
+def _resize_with_draft(img: Image.Image, size: tuple[int, int]) -> Image.Image:
+    """LANCZOS vers size; en reduction, decode d abord a l echelle la plus proche (DCT jpeg, miniature heif)."""
+    if size[0] >= img.width or size[1] >= img.height:
+        return img.resize(size, resample=_LANCZOS)
+
+    # sans effet si l image est deja decodee ou si le format n a pas de decodage reduit
+    img.draft(img.mode, (size[0] * _DRAFT_REDUCING_GAP, size[1] * _DRAFT_REDUCING_GAP))
+    return img.resize(size, resample=_LANCZOS, reducing_gap=_DRAFT_REDUCING_GAP)
+
+
+_BANDABLE_MODES = {"L", "LA", "RGB", "RGBA", "CMYK"}
+
+
+def _raw_band_tiles(img: Image.Image) -> list[tuple[tuple[int, int, int, int], int, int]] | None:
+    """(extents, offset, stride) des tuiles non compressees, lisibles ligne a ligne; None sinon.
+
+    Couvre les TIFF (bandes ou tuiles) et autres formats bruts 8 bits.
+    """
+    if img.mode not in _BANDABLE_MODES or not img.tile:
+        return None
+    channels = len(img.getbands())
+    tiles = []
+    for tile in img.tile:
+        codec, extents, offset, args = tile
+        if codec != "raw" or not args or args[0] != img.mode:
+            return None
+        stride = (args[1] if len(args) > 1 else 0) or (extents[2] - extents[0]) * channels
+        if (args[2] if len(args) > 2 else 1) != 1:
+            return None  # lignes de bas en haut (bmp)
+        tiles.append((extents, offset, stride))
+    return tiles
+
+
+def _decode_raw_band(path: str, tiles: list, mode: str, width: int, top: int, bottom: int) -> Image.Image:
+    """Decode uniquement les lignes [top, bottom) en redirigeant les tuiles brutes vers cette bande."""
+    band_tiles = []
+    for (x0, y0, x1, y1), offset, stride in tiles:
+        r0, r1 = max(y0, top), min(y1, bottom)
+        if r0 < r1:
+            band_tiles.append(
+                ImageFile._Tile("raw", (x0, r0 - top, x1, r1 - top), offset + (r0 - y0) * stride, (mode, stride, 1))
+            )
+    with Image.open(path) as band:
+        band._size = (width, bottom - top)
+        if hasattr(band, "_tile_size"):
+            band._tile_size = band._size  # TiffImageFile alloue le raster d apres _tile_size
+        band.tile = band_tiles
+        band.load()
+        return band.copy()
+
+
+# TIFF compresses par bandes (strips) decodables une a une par libtiff: LZW, deflate, packbits
+_TIFF_BAND_COMPRESSIONS = {5, 8, 32946, 32773}
+# tags recopies dans le TIFF d une bande: BitsPerSample, Compression, Photometric, SamplesPerPixel,
+# PlanarConfiguration, Predictor, ExtraSamples
+_TIFF_BAND_TAGS = (258, 259, 262, 277, 284, 317, 338)
+
+
+def _tiff_band_layout(img: Image.Image) -> dict | None:
+    """Bandes d un TIFF compresse, si chacune tient dans IMAGE_TILED_BAND_BYTES une fois decodee."""
+    tags = getattr(img, "tag_v2", None)
+    if tags is None or 322 in tags or tags.get(259) not in _TIFF_BAND_COMPRESSIONS:
+        return None  # tuiles TIFF ou compression non prise en charge
+    channels = len(img.getbands())
+    bits = tags.get(258)
+    if tags.get(284, 1) != 1 or tags.get(262) not in (1, 2, 5) or tuple(bits or ()) != (8,) * channels:
+        return None
+    offsets, counts = tags.get(273), tags.get(279)
+    rows_per_strip = min(int(tags.get(278, img.height)), img.height)
+    if not offsets or not counts or len(offsets) != len(counts) or len(offsets) != -(-img.height // rows_per_strip):
+        return None
+    if rows_per_strip * img.width * channels > IMAGE_TILED_BAND_BYTES:
+        return None  # bande unique (ou trop haute): rien a gagner
+    copied = []
+    for tag in _TIFF_BAND_TAGS:
+        if tag in tags:
+            values = tags[tag]
+            copied.append((tag, list(values) if isinstance(values, tuple) else [int(values)]))
+    return {
+        "width": img.width,
+        "height": img.height,
+        "rows_per_strip": rows_per_strip,
+        "offsets": offsets,
+        "counts": counts,
+        "tags": copied,
+    }
+
+
+def _tiff_header(width: int, height: int, rows_per_strip: int, tags: list, strip_lengths: list[int]) -> bytes:
+    """En-tete + IFD d un TIFF little-endian minimal (tags en SHORT), bandes placees juste apres."""
+    entries = [(tag, 3, values) for tag, values in tags]
+    entries += [
+        (256, 4, [width]),
+        (257, 4, [height]),
+        (273, 4, [0] * len(strip_lengths)),
+        (278, 4, [rows_per_strip]),
+        (279, 4, strip_lengths),
+    ]
+    entries.sort()
+    extra_at = 8 + 2 + 12 * len(entries) + 4
+    sizes = [len(values) * (2 if kind == 3 else 4) for _, kind, values in entries]
+    strip_at = extra_at + sum(size for size in sizes if size > 4)  # valeurs hors de l IFD
+    offsets = []
+    for length in strip_lengths:
+        offsets.append(strip_at)
+        strip_at += length
+    if strip_at > 0xFFFFFFFF:
+        raise ValueError("TIFF de plus de 4 Go non pris en charge")
+    ifd = [len(entries).to_bytes(2, "little")]
+    extra = []
+    for tag, kind, values in entries:
+        if tag == 273:
+            values = offsets
+        packed = b"".join(int(v).to_bytes(2 if kind == 3 else 4, "little") for v in values)
+        if len(packed) <= 4:
+            field = packed.ljust(4, b"\x00")
+        else:
+            field = (extra_at + sum(len(e) for e in extra)).to_bytes(4, "little")
+            extra.append(packed)
+        ifd.append(tag.to_bytes(2, "little") + kind.to_bytes(2, "little") + len(values).to_bytes(4, "little") + field)
+    ifd.append(b"\x00\x00\x00\x00")
+    return b"".join([b"II*\x00", (8).to_bytes(4, "little"), *ifd, *extra])
+
+
+def _decode_tiff_band(path: str, layout: dict, top: int, bottom: int) -> Image.Image:
+    """Lignes [top, bottom) d un TIFF compresse: seules les bandes concernees, relues dans un TIFF en memoire."""
+    rows_per_strip = layout["rows_per_strip"]
+    first, last = top // rows_per_strip, (bottom - 1) // rows_per_strip
+    strips = []
+    with open(path, "rb") as f:
+        for i in range(first, last + 1):
+            f.seek(layout["offsets"][i])
+            strips.append(f.read(layout["counts"][i]))
+    first_row = first * rows_per_strip
+    rows = min(layout["height"], (last + 1) * rows_per_strip) - first_row
+    header = _tiff_header(layout["width"], rows, rows_per_strip, layout["tags"], [len(strip) for strip in strips])
+    with Image.open(io.BytesIO(header + b"".join(strips))) as band:
+        band.load()
+        return band.crop((0, top - first_row, layout["width"], bottom - first_row))
+
+
+def _psd_rle_rows(path: str, img: Image.Image) -> list[tuple[list[int], str]] | None:
+    """PSD compose en RLE (packbits ligne par ligne): (debut de chaque ligne, mode brut) par canal."""
+    tiles = img.tile
+    full = (0, 0, img.width, img.height)
+    if not tiles or any(t[0] != "packbits" or tuple(t[1]) != full for t in tiles):
+        return None
+    # table des tailles de lignes (16 bits, canal par canal) juste avant les donnees du premier canal
+    table_size = len(tiles) * img.height * 2
+    with open(path, "rb") as f:
+        f.seek(tiles[0][2] - table_size)
+        table = f.read(table_size)
+    if len(table) != table_size:
+        return None
+    channels = []
+    offset = tiles[0][2]
+    for c, tile in enumerate(tiles):
+        if tile[2] != offset:
+            return None
+        starts = []
+        for y in range(img.height):
+            starts.append(offset)
+            offset += int.from_bytes(table[(c * img.height + y) * 2:(c * img.height + y) * 2 + 2], "big")
+        channels.append((starts, tile[3] if isinstance(tile[3], str) else tile[3][0]))
+    return channels
+
+
+def _decode_psd_band(path: str, channels: list, mode: str, width: int, top: int, bottom: int) -> Image.Image:
+    """Lignes [top, bottom) d un PSD RLE: chaque canal reprend a la ligne top (lignes codees independamment)."""
+    extents = (0, 0, width, bottom - top)
+    with Image.open(path) as band:
+        band._size = (width, bottom - top)
+        band.tile = [ImageFile._Tile("packbits", extents, starts[top], rawmode) for starts, rawmode in channels]
+        band.load()
+        return band.copy()
+
+
+def _band_reader(path: str, img: Image.Image):
+    """Lecteur read_band(top, bottom) des lignes d un raster sans le decoder en entier; None si
+    le format l impose (jpeg, tuiles compressees, modes hors _BANDABLE_MODES...)."""
+    if img.mode not in _BANDABLE_MODES or not img.tile:
+        return None
+    tiles = _raw_band_tiles(img)
+    if tiles is not None:
+        return functools.partial(_decode_raw_band, path, tiles, img.mode, img.width)
+    if img.format == "TIFF":
+        layout = _tiff_band_layout(img)
+        if layout is not None:
+            return functools.partial(_decode_tiff_band, path, layout)
+    if img.format == "PSD":
+        channels = _psd_rle_rows(path, img)
+        if channels is not None:
+            return functools.partial(_decode_psd_band, path, channels, img.mode, img.width)
+    return None
+
+
+def _banded_resize(img: Image.Image, read_band, size: tuple[int, int]) -> Image.Image:
+    """Reduction LANCZOS par bandes; chaque bande deborde du support du filtre pour des raccords exacts."""
+    width, height = img.size
+    out_width, out_height = size
+    scale_y = height / out_height
+    margin = math.ceil(3 * scale_y) + 1  # LANCZOS: 3 pixels de sortie de chaque cote
+    rows_per_band = max(1, IMAGE_TILED_BAND_BYTES // (width * len(img.getbands())))
+    out_rows_per_band = max(1, int(rows_per_band / scale_y))
+
+    out = Image.new(img.mode, size)
+    for oy0 in range(0, out_height, out_rows_per_band):
+        oy1 = min(out_height, oy0 + out_rows_per_band)
+        sy0, sy1 = oy0 * scale_y, oy1 * scale_y
+        top = max(0, math.floor(sy0) - margin)
+        bottom = min(height, math.ceil(sy1) + margin)
+        band = read_band(top, bottom)
+        part = band.resize(
+            (out_width, oy1 - oy0),
+            resample=_LANCZOS,
+            box=(0, sy0 - top, width, sy1 - top),
+            reducing_gap=_DRAFT_REDUCING_GAP,
+        )
+        out.paste(part, (0, oy0))
+    return out
+
+
+# conversion pleine taille ecrite bande par bande: format -> modes acceptes par l encodeur
+_BANDED_OUTPUT_MODES = {"png": {"L", "LA", "RGB", "RGBA"}, "tif": _BANDABLE_MODES, "tiff": _BANDABLE_MODES}
+_PNG_COLOR_TYPES = {"L": 0, "LA": 4, "RGB": 2, "RGBA": 6}
+_TIFF_PHOTOMETRIC = {"L": 1, "LA": 1, "RGB": 2, "RGBA": 2, "CMYK": 5}
+
+
+def _banded_output_format(action: str | None, target_format: str | None, mode: str) -> str | None:
+    """Conversion sans redimensionnement encodable par bandes (PNG, TIFF non compresse); None sinon."""
+    tf = (target_format or "").lower().strip()
+    if action != "convert" or mode not in _BANDED_OUTPUT_MODES.get(tf, ()):
+        return None
+    return "png" if tf == "png" else "tiff"
+
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return len(data).to_bytes(4, "big") + kind + data + zlib.crc32(kind + data).to_bytes(4, "big")
+
+
+def _png_filter_rows(raw: bytes, row_bytes: int, previous: bytes | None) -> bytes | memoryview:
+    # filtre Up (difference avec la ligne du dessus) si numpy est la, sinon lignes brutes
+    if np is None:
+        return b"".join(b"\x00" + raw[i:i + row_bytes] for i in range(0, len(raw), row_bytes))
+    rows = np.frombuffer(raw, dtype=np.uint8).reshape(-1, row_bytes)
+    out = np.empty((rows.shape[0], row_bytes + 1), dtype=np.uint8)
+    out[:, 0] = 2
+    np.subtract(rows[1:], rows[:-1], out=out[1:, 1:])
+    if previous:
+        np.subtract(rows[0], np.frombuffer(previous, dtype=np.uint8), out=out[0, 1:])
+    else:
+        out[0, 1:] = rows[0]
+    return out.data
+
+
+def _save_banded(img: Image.Image, read_band, output_path: str, out_fmt: str, effort: str = IMAGE_EFFORT) -> None:
+    """Conversion pleine taille sans raster complet: chaque bande decodee est encodee puis liberee."""
+    width, height = img.size
+    row_bytes = width * len(img.getbands())
+    if out_fmt == "tiff":
+        # bandes TIFF de ~64 Ko, un multiple par bande decodee
+        rows_per_strip = max(1, min(height, 65536 // row_bytes))
+        rows_per_band = max(1, IMAGE_TILED_BAND_BYTES // (row_bytes * rows_per_strip)) * rows_per_strip
+        tags = [(258, [8] * len(img.getbands())), (259, [1]), (262, [_TIFF_PHOTOMETRIC[img.mode]])]
+        tags += [(277, [len(img.getbands())]), (284, [1])]
+        if img.mode in ("LA", "RGBA"):
+            tags.append((338, [2]))  # alpha non premultiplie
+        lengths = [min(rows_per_strip, height - y) * row_bytes for y in range(0, height, rows_per_strip)]
+        with open(output_path, "wb") as f:
+            f.write(_tiff_header(width, height, rows_per_strip, tags, lengths))
+            for top in range(0, height, rows_per_band):
+                f.write(read_band(top, min(height, top + rows_per_band)).tobytes())
+        return
+
+    rows_per_band = max(1, IMAGE_TILED_BAND_BYTES // row_bytes)
+    compressor = zlib.compressobj(_effort_kwargs("PNG", effort).get("compress_level", 6))
+    previous = None
+    with open(output_path, "wb") as f:
+        f.write(_PNG_SIGNATURE)
+        ihdr = width.to_bytes(4, "big") + height.to_bytes(4, "big") + bytes([8, _PNG_COLOR_TYPES[img.mode], 0, 0, 0])
+        f.write(_png_chunk(b"IHDR", ihdr))
+        for top in range(0, height, rows_per_band):
+            raw = read_band(top, min(height, top + rows_per_band)).tobytes()
+            data = compressor.compress(_png_filter_rows(raw, row_bytes, previous))
+            previous = raw[-row_bytes:]
+            if data:
+                f.write(_png_chunk(b"IDAT", data))
+        f.write(_png_chunk(b"IDAT", compressor.flush()))
+        f.write(_png_chunk(b"IEND", b""))
+
+
+def _requested_resize(params: dict, size: tuple[int, int]) -> tuple[int, int] | None:
+    """Taille de sortie demandee par image_resize_mode / image_max_size / image_resize_percent."""
+    width, height = size
+    resize_mode_raw = (str(params.get("image_resize_mode") or "").strip().lower())
+    if not resize_mode_raw and params.get("image_max_size"):
+        resize_mode_raw = "dimension"
+
+    if resize_mode_raw == "dimension":
+        target_max = None
+        if params.get("image_max_size") is not None:
+            try:
+                target_max = int(str(params.get("image_max_size")).strip())
+            except ValueError:
+                target_max = None
+
+        # pas d agrandissement
+        if target_max and target_max > 0 and (width > target_max or height > target_max):
+            return _contain_size(width, height, target_max)
+    elif resize_mode_raw == "percent":
+        percent_value = None
+        if params.get("image_resize_percent") is not None:
+            try:
+                percent_value = float(str(params.get("image_resize_percent")).strip())
+            except ValueError:
+                percent_value = None
+
+        if percent_value and percent_value > 0:
+            scale = max(0.05, min(3.0, percent_value / 100.0))
+            return (max(1, int(width * scale)), max(1, int(height * scale)))
+    return None
+
+
+# octets par pixel du stockage Pillow (RGB et LA sont sur 32 bits)
+_MODE_PIXEL_BYTES = {"1": 1, "L": 1, "P": 1, "I;16": 2, "I;16B": 2, "I;16L": 2}
+# copies de travail simultanees (conversion de mode, redimensionnement, tampon d encodage)
+_IMAGE_WORKING_COPIES = 2
+
+
+def _estimate_image_memory(
+    path: str, params: dict, *, action: str | None = None, target_format: str | None = None
+) -> dict | None:
+    """Dimensions lues dans l en-tete et memoire de pointe estimee du traitement; None si illisible."""
+    try:
+        with Image.open(path) as img:
+            width, height = img.size
+            mode = img.mode
+            frames = getattr(img, "n_frames", 1)
+            pixel_bytes = _MODE_PIXEL_BYTES.get(mode, 4)
+            target = _requested_resize(params, img.size)
+            pixels = width * height
+            streamed = target is None and _banded_output_format(action, target_format, mode) is not None
+            banded = (
+                pixels >= IMAGE_TILED_MIN_PIXELS
+                and (streamed or (target is not None and target[0] * target[1] < pixels))
+                and _band_reader(path, img) is not None
             )
+            decoded = pixels * pixel_bytes
+            if banded:
+                decoded = IMAGE_TILED_BAND_BYTES * 2
+            elif target is not None and img.format in {"JPEG", "HEIF"}:
+                # draft: decodage au plus a 1/8, en gardant 2x la cible
+                ratio = min(width / max(1, 2 * target[0]), height / max(1, 2 * target[1]))
+                scale = 1
+                while scale < 8 and scale * 2 <= ratio:
+                    scale *= 2
+                decoded //= scale * scale
+    except Exception:
+        return None
+
+    output = (target[0] * target[1] if target else pixels) * pixel_bytes
+    if banded and target is None:
+        output = 0  # bandes encodees au fil de l eau
+    if frames > 1:
+        # animation: toutes les frames (RGB/RGBA) restent en memoire jusqu a l ecriture
+        output = (target[0] * target[1] if target else pixels) * 4 * frames
+    return {
+        "width": width,
+        "height": height,
+        "mode": mode,
+        "frames": frames,
+        "mem_bytes": decoded * _IMAGE_WORKING_COPIES + output,
+    }
+
+
+def _resize_preserve_aspect(img: Image.Image, max_dim: int) -> Image.Image:
+    """Downscale image to fit within max_dim while keeping aspect ratio. No upscaling."""
+    if not max_dim or max_dim <= 0:
+        return img
+
+    width, height = img.size
+    if width <= max_dim and height <= max_dim:
+        return img
+
+    return _resize_with_draft(img, _contain_size(width, height, max_dim))
+
+
+# reglages encodeur par palier d effort (voir scripts/bench_image_effort.py pour le compromis temps/taille)
+_IMAGE_EFFORT_SETTINGS = {
+    "fast": {
+        # optimize JPEG (tables de Huffman) coute peu et gagne 5 a 35%: garde a tous les paliers
+        "JPEG": {"optimize": True},
+        "WEBP": {"method": 2},
+        "PNG": {"compress_level": 1},
+        "GIF": {"optimize": False},
+        "AVIF": {"speed": 8},
+    },
+    "balanced": {
+        "JPEG": {"optimize": True},
+        "WEBP": {"method": 4},
+        "PNG": {"compress_level": 6},
+        "GIF": {"optimize": True},
+        "AVIF": {"speed": 6},
+    },
+    "max": {
+        "JPEG": {"optimize": True},
+        "WEBP": {"method": 6},
+        "PNG": {"optimize": True, "compress_level": 9},
+        "GIF": {"optimize": True},
+        # vitesse par defaut de Pillow, comme avant les paliers (4 coute ~3x le temps pour ~5%)
+        "AVIF": {"speed": 6},
+    },
+}
+
+
+def _image_effort(params: dict) -> str:
+    effort = str(params.get("image_effort") or IMAGE_EFFORT).strip().lower()
+    return effort if effort in _IMAGE_EFFORT_SETTINGS else IMAGE_EFFORT
+
+
+def _effort_kwargs(pil_format: str, effort: str) -> dict:
+    """Options save() de Pillow pour ce format au palier d effort donne."""
+    return dict(_IMAGE_EFFORT_SETTINGS.get(effort, _IMAGE_EFFORT_SETTINGS[IMAGE_EFFORT]).get(pil_format, {}))
+
+
+def _encode_image_bytes(
+    *,
+    img: Image.Image,
+    out_ext: str,
+    quality: int,
+    lossless: bool,
+    has_alpha: bool,
+    effort: str = IMAGE_EFFORT,
+) -> bytes:
+    buffer = io.BytesIO()
+
+    if out_ext in (".jpg", ".jpeg"):
+        save_img = img.convert("RGB") if has_alpha else img
+        save_img.save(buffer, format="JPEG", quality=quality, **_effort_kwargs("JPEG", effort))
+        return buffer.getvalue()
+
+    if out_ext == ".webp":
+        img.save(buffer, format="WEBP", quality=quality, lossless=lossless, **_effort_kwargs("WEBP", effort))
+        return buffer.getvalue()
+
+    if out_ext == ".png":
+        if has_alpha:
+            save_img = img.convert("RGBA")
+        else:
+            save_img = img.convert("RGB") if img.mode not in ("RGB", "L") else img
+        save_img.save(buffer, format="PNG", **_effort_kwargs("PNG", effort))
+        return buffer.getvalue()
+
+    if out_ext == ".avif":
+        img.save(buffer, format="AVIF", quality=quality, **_effort_kwargs("AVIF", effort))
+        return buffer.getvalue()
+
+    if out_ext == ".gif":
+        gif_img = img.convert("P", palette=Image.ADAPTIVE, colors=max(16, min(256, quality * 2)))
+        gif_img.save(buffer, format="GIF", **_effort_kwargs("GIF", effort))
+        return buffer.getvalue()
+
+    # Best effort fallback for other image formats.
+    try:
+        img.save(buffer, quality=quality, optimize=True)
+    except TypeError:
+        img.save(buffer, optimize=True)
+    return buffer.getvalue()
+
+
+_TARGET_QUALITY_MIN = 10
+_TARGET_QUALITY_MAX = 95
+_PROXY_QUALITIES = (10, 30, 55, 85)
+# pente par defaut de log(taille) en fonction de la qualite (jpeg/webp: x2 entre q50 et q85)
+_DEFAULT_LOG_SIZE_SLOPE = 0.02
+
+
+def _log_size_at(points: list[tuple[int, float]], quality: int) -> float:
+    """log(taille) interpolee lineairement entre points (qualite, log taille), pentes extremes au-dela."""
+    if len(points) == 1:
+        q0, y0 = points[0]
+        return y0 + _DEFAULT_LOG_SIZE_SLOPE * (quality - q0)
+
+    for (q0, y0), (q1, y1) in zip(points, points[1:]):
+        if quality <= q1:
+            break
+    return y0 + (y1 - y0) * (quality - q0) / (q1 - q0)
+
+
+def _predict_log_size(points: list[tuple[int, float]], model: list[tuple[int, float]], quality: int) -> float:
+    # entre deux essais pleine resolution: interpolation; au-dela: forme du proxy recalee sur l essai le plus proche
+    if not model:
+        return _log_size_at(points, quality)
+    if not points:
+        return _log_size_at(model, quality)
+    if len(points) >= 2 and points[0][0] <= quality <= points[-1][0]:
+        return _log_size_at(points, quality)
+    q0, y0 = points[0] if quality < points[0][0] else points[-1]
+    return _log_size_at(model, quality) + y0 - _log_size_at(model, q0)
+
+
+def _target_size_proxy_model(
+    *,
+    img: Image.Image,
+    out_ext: str,
+    has_alpha: bool,
+    stats: dict,
+    width: int = 1,
+    effort: str = IMAGE_EFFORT,
+) -> list[tuple[int, float]]:
+    """Courbe taille/qualite estimee sur une reduction de l image, rapportee a la pleine resolution."""
+    pixels = img.width * img.height
+    if pixels <= 2 * TARGET_SIZE_PROXY_PIXELS:
+        return []
+
+    factor = math.ceil(math.sqrt(pixels / TARGET_SIZE_PROXY_PIXELS))
+    try:
+        proxy = img.reduce(factor)
+    except ValueError:
+        return []  # mode non supporte par reduce (palette...)
+
+    scale = math.log(pixels / (proxy.width * proxy.height))
+    qualities = list(_PROXY_QUALITIES)
+    if width > 1:
+        results = _encode_trials(img=proxy, out_ext=out_ext, qualities=qualities, has_alpha=has_alpha, effort=effort)
+    else:
+        results = [
+            _encode_image_bytes(img=proxy, out_ext=out_ext, quality=q, lossless=False, has_alpha=has_alpha, effort=effort)
+            for q in qualities
+        ]
+    stats["proxy_encodes"] += len(results)
+    return [(q, math.log(len(encoded)) + scale) for q, encoded in zip(qualities, results)]
+
+
+def _trial_qualities(predicted: int, lo: int, hi: int, width: int) -> list[int]:
+    """Qualites a essayer dans le tour: la prediction puis, alternativement au-dessus et en dessous."""
+    # ecart serre: apres calibrage, l erreur de prediction tient en quelques points de qualite
+    step = max(1, min(3, (hi - lo) // (2 * width)))
+    qualities = [predicted]
+    offset = 1
+    while len(qualities) < width and offset <= hi - lo:
+        for q in (predicted + offset * step, predicted - offset * step):
+            if lo <= q <= hi and q not in qualities and len(qualities) < width:
+                qualities.append(q)
+        offset += 1
+    return qualities
+
+
+def _encode_trials(
+    *,
+    img: Image.Image,
+    out_ext: str,
+    qualities: list[int],
+    has_alpha: bool,
+    effort: str = IMAGE_EFFORT,
+) -> list[bytes]:
+    """Encode les qualites demandees; la premiere sur ce thread, les autres sur trial_encode_executor."""
+    encode = functools.partial(_encode_image_bytes, out_ext=out_ext, lossless=False, has_alpha=has_alpha, effort=effort)
+    if len(qualities) == 1:
+        return [encode(img=img, quality=qualities[0])]
+
+    # save() ecrit encoderinfo sur l objet Image: une vue par essai, pixels partages
+    futures = [trial_encode_executor.submit(encode, img=img._new(img.im), quality=q) for q in qualities[1:]]
+    first = encode(img=img._new(img.im), quality=qualities[0])
+    return [first] + [f.result() for f in futures]
+
+
+def _search_quality_for_size(
+    *,
+    img: Image.Image,
+    out_ext: str,
+    target_bytes: int,
+    has_alpha: bool,
+    effort: str = IMAGE_EFFORT,
+) -> tuple[bytes, dict]:
+    """Plus haute qualite sous target_bytes, a TARGET_SIZE_TOLERANCE pres.
+
+    La courbe du proxy donne la premiere qualite; chaque encodage pleine resolution recale le
+    modele (interpolation entre les essais) et resserre l intervalle [lo, hi]. Quand des coeurs
+    sont libres, chaque tour encode en parallele plusieurs qualites autour de la prediction.
+    """
+    stats = {"encodes": 0, "proxy_encodes": 0, "rounds": 0, "width": 1, "quality": None}
+    # le coeur du job courant plus les coeurs qu aucun autre job n occupe
+    own = 1 if getattr(_job_timing_local, "current", None) is not None else 0
+    width = max(1, min(TRIAL_ENCODE_WORKERS, _idle_cpu_threads() + own))
+    if width > 1:
+        img.load()  # decodage unique avant les lectures concurrentes
+        stats["width"] = width
+    model = _target_size_proxy_model(
+        img=img, out_ext=out_ext, has_alpha=has_alpha, stats=stats, width=width, effort=effort
+    )
+    log_target = math.log(target_bytes)
+    floor_bytes = target_bytes * (1 - TARGET_SIZE_TOLERANCE)
+
+    lo, hi = _TARGET_QUALITY_MIN, _TARGET_QUALITY_MAX
+    tried: dict[int, float] = {}
+    best: bytes | None = None
+    smallest: tuple[int, bytes] | None = None
+
+    while lo <= hi and stats["rounds"] < TARGET_SIZE_MAX_ENCODES:
+        points = sorted(tried.items())
+        if not points and not model:
+            quality = min(hi, 75)
+        else:
+            quality = next(
+                (q for q in range(hi, lo - 1, -1) if _predict_log_size(points, model, q) <= log_target),
+                lo,
+            )
+            if best is not None and hi < _TARGET_QUALITY_MAX:
+                # encadre: l interpolation seule converge d un seul cote; reduire l intervalle d un quart au moins
+                margin = (hi - lo) // 4
+                quality = max(lo + margin, min(hi - margin, quality))
+
+        qualities = _trial_qualities(quality, lo, hi, width)
+        results = _encode_trials(img=img, out_ext=out_ext, qualities=qualities, has_alpha=has_alpha, effort=effort)
+        stats["rounds"] += 1
+        stats["encodes"] += len(qualities)
+
+        for quality, encoded in sorted(zip(qualities, results)):
             size = len(encoded)
+            tried[quality] = math.log(size)
+            if smallest is None or size < len(smallest[1]):
+                smallest = (quality, encoded)
 
             if size <= target_bytes:
-                best = encoded
-                lo = mid + 1
+                if quality >= lo:
+                    best = encoded
+                    stats["quality"] = quality
+                    lo = quality + 1
             else:
-                hi = mid - 1
+                hi = min(hi, quality - 1)
+
+        if best is not None and len(best) >= floor_bytes:
+            break
 
-        if best is None:
-            # Nothing reached the target, keep smallest trial at quality 10.
+    if best is None:
+        # rien sous la cible: qualite minimale, reprise de l essai si deja encodee
+        if smallest is not None and smallest[0] == _TARGET_QUALITY_MIN:
+            best = smallest[1]
+        else:
             best = _encode_image_bytes(
-                img=img,
-                out_ext=out_ext,
-                quality=10,
-                lossless=False,
-                has_alpha=has_alpha,
+                img=img, out_ext=out_ext, quality=_TARGET_QUALITY_MIN, lossless=False, has_alpha=has_alpha, effort=effort
             )
+            stats["encodes"] += 1
+        stats["quality"] = _TARGET_QUALITY_MIN
+
+    return best, stats
+
+
+_PNG_PALETTE_LADDER = (256, 128, 64, 32, 16)
+# marge sur l estimation rapide avant de payer un encodage final
+_PNG_ESTIMATE_MARGIN = 1.05
+
+
+def _png_bytes(img: Image.Image, *, fast: bool = False, effort: str = IMAGE_EFFORT) -> bytes:
+    buffer = io.BytesIO()
+    if fast:
+        img.save(buffer, format="PNG", compress_level=1)
+    else:
+        img.save(buffer, format="PNG", **_effort_kwargs("PNG", effort))
+    return buffer.getvalue()
+
+
+def _reduce_palette(palette_img: Image.Image, colors: int) -> Image.Image:
+    """Ramene une image P a `colors` couleurs en quantifiant sa palette seule, puis remap des indices par LUT."""
+    mode = palette_img.palette.mode
+    channels = len(mode)
+    palette = palette_img.getpalette(rawmode=mode)
+    used = palette_img.getcolors(256) or []
+    total = sum(count for count, _ in used) or 1
+
+    # echantillon des couleurs de palette pondere par leur usage
+    indices: list[int] = []
+    for count, index in used:
+        indices.extend([index] * max(1, round(count * 4096 / total)))
+    samples = bytes(v for index in indices for v in palette[index * channels:(index + 1) * channels])
+    reduced = Image.frombytes(mode, (len(indices), 1), samples).quantize(colors=colors, method=Image.FASTOCTREE)
+
+    lut = list(range(256))
+    for position, index in enumerate(indices):
+        lut[index] = reduced.getpixel((position, 0))
+    out = palette_img.point(lut)
+    out.putpalette(reduced.getpalette(rawmode=mode), rawmode=mode)
+    return out
+
+
+def _search_png_palette_for_size(
+    *, img: Image.Image, target_bytes: int, has_alpha: bool, effort: str = IMAGE_EFFORT
+) -> tuple[bytes, dict]:
+    """Plus grande palette dont le PNG (au palier d effort) tient sous target_bytes.
+
+    Une seule conversion et une seule quantification pleine image (256 couleurs); les palettes
+    plus petites sont derivees par quantification de la palette. Chaque candidat est d abord
+    estime avec un encodage compress_level=1, recale par le rapport final/rapide observe.
+    """
+    stats = {"colors": None, "fast_encodes": 0, "encodes": 0}
+    source = img.convert("RGBA") if has_alpha else img.convert("RGB")
+    base = source.quantize(colors=256, method=Image.FASTOCTREE)
+    del source
+
+    candidates: dict[int, Image.Image] = {256: base}
+    fast_sizes: dict[int, int] = {}
+    encoded_by_colors: dict[int, bytes] = {}
+    ratio = 1.0  # taille finale / compress_level=1, recale a chaque encodage final
+
+    def candidate(colors: int) -> Image.Image:
+        if colors not in candidates:
+            # echelle: depuis le palier precedent; dichotomie: depuis la base 256
+            parent = 256 if PNG_TARGET_BISECT else min(c for c in candidates if c > colors)
+            candidates[colors] = _reduce_palette(candidates[parent], colors)
+        return candidates[colors]
+
+    def estimate(colors: int) -> float:
+        if colors not in fast_sizes:
+            fast_sizes[colors] = len(_png_bytes(candidate(colors), fast=True))
+            stats["fast_encodes"] += 1
+        return fast_sizes[colors] * ratio
+
+    def fits(colors: int) -> bool:
+        nonlocal ratio
+        estimate(colors)
+        encoded = _png_bytes(candidate(colors), effort=effort)
+        stats["encodes"] += 1
+        ratio = len(encoded) / fast_sizes[colors]
+        encoded_by_colors[colors] = encoded
+        return len(encoded) <= target_bytes
+
+    chosen: int | None = None
+    if fits(256):
+        chosen = 256
+    elif PNG_TARGET_BISECT:
+        # dichotomie sur l estimation seule, encodage final du meilleur candidat, reprise si refus
+        hi = 255
+        while chosen is None and hi >= _PNG_PALETTE_LADDER[-1]:
+            lo, best = _PNG_PALETTE_LADDER[-1], None
+            while lo <= hi:
+                mid = (lo + hi) // 2
+                if estimate(mid) <= target_bytes:
+                    best, lo = mid, mid + 1
+                else:
+                    hi = mid - 1
+            if best is None:
+                break
+            if fits(best):
+                chosen = best
+            hi = best - 1
+    else:
+        for colors in _PNG_PALETTE_LADDER[1:]:
+            if estimate(colors) <= target_bytes * _PNG_ESTIMATE_MARGIN and fits(colors):
+                chosen = colors
+                break
+
+    if chosen is None:
+        # rien sous la cible: la plus petite palette au meilleur effort
+        chosen = _PNG_PALETTE_LADDER[-1]
+        if chosen not in encoded_by_colors:
+            encoded_by_colors[chosen] = _png_bytes(candidate(chosen), effort=effort)
+            stats["encodes"] += 1
+
+    stats["colors"] = chosen
+    return encoded_by_colors[chosen], stats
+
+
+def _save_image_with_target_size(
+    *,
+    img: Image.Image,
+    output_path: str,
+    target_size_mb: float,
+    has_alpha: bool,
+    effort: str = IMAGE_EFFORT,
+) -> bool:
+    if target_size_mb <= 0:
+        return False
+
+    target_bytes = int(target_size_mb * 1024 * 1024)
+    if target_bytes <= 0:
+        return False
+
+    _, out_ext = os.path.splitext(output_path)
+    out_ext = out_ext.lower()
+
+    if out_ext in (".jpg", ".jpeg", ".webp", ".gif"):
+        best, stats = _search_quality_for_size(
+            img=img,
+            out_ext=out_ext,
+            target_bytes=target_bytes,
+            has_alpha=has_alpha,
+            effort=effort,
+        )
+        _job_note_media(target_search=stats)
+        logging.info(
+            "target size q=%s rounds=%s encodes=%s proxy_encodes=%s width=%s bytes=%s/%s",
+            stats["quality"], stats["rounds"], stats["encodes"], stats["proxy_encodes"], stats["width"],
+            len(best), target_bytes,
+        )
 
         with open(output_path, "wb") as f:
             f.write(best)
         return True
 
-    if out_ext == ".png":
-        # PNG has no traditional quality slider; reduce palette progressively.
-        for colors in (256, 128, 64, 32, 16):
-            palette_img = img.convert("RGBA") if has_alpha else img.convert("RGB")
-            quantized = palette_img.quantize(colors=colors, method=Image.FASTOCTREE)
-            if has_alpha and "transparency" in img.info:
-                quantized.info["transparency"] = img.info.get("transparency")
-
-            buffer = io.BytesIO()
-            quantized.save(buffer, format="PNG", optimize=True, compress_level=9)
-            encoded = buffer.getvalue()
-            if len(encoded) <= target_bytes:
-                with open(output_path, "wb") as f:
-                    f.write(encoded)
-                return True
-
-        # Fallback to best effort even if target not reached.
-        buffer = io.BytesIO()
-        img.save(buffer, format="PNG", optimize=True, compress_level=9)
-        with open(output_path, "wb") as f:
-            f.write(buffer.getvalue())
-        return True
+    if out_ext == ".png":
+        # PNG has no traditional quality slider; reduce the palette.
+        encoded, stats = _search_png_palette_for_size(
+            img=img, target_bytes=target_bytes, has_alpha=has_alpha, effort=effort
+        )
+        _job_note_media(target_search=stats)
+        logging.info(
+            "target size png colors=%s fast_encodes=%s encodes=%s bytes=%s/%s",
+            stats["colors"], stats["fast_encodes"], stats["encodes"], len(encoded), target_bytes,
+        )
+        with open(output_path, "wb") as f:
+            f.write(encoded)
+        return True
+
+    return False
+
+
+# segments APPn gardes par image_strip_metadata: JFIF, profil ICC, Adobe (transformee couleur)
+_JPEG_KEEP_APP = {0xE0: b"JFIF", 0xE2: b"ICC_PROFILE", 0xEE: b"Adobe"}
+# orientation EXIF -> operation jpegtran qui la rend a 1
+_JPEGTRAN_ORIENT = {
+    2: ["-flip", "horizontal"],
+    3: ["-rotate", "180"],
+    4: ["-flip", "vertical"],
+    5: ["-transpose"],
+    6: ["-rotate", "90"],
+    7: ["-transverse"],
+    8: ["-rotate", "270"],
+}
+# orientation EXIF -> transposition Pillow equivalente (comme ImageOps.exif_transpose)
+_EXIF_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+
+def _param_flag(params: dict, name: str) -> bool:
+    return str(params.get(name) or "").lower() in {"1", "true", "yes", "on"}
+
+
+@functools.lru_cache(maxsize=1)
+def _jpegtran_path() -> str | None:
+    return shutil.which(JPEGTRAN_BIN)
+
+
+def _rewrite_jpeg_segments(data: bytes, *, strip: bool, exif: bytes | None = None) -> bytes:
+    """Reecrit les segments d en-tete d un JPEG sans toucher aux donnees entropiques.
+
+    strip: retire EXIF/XMP/IPTC/commentaires (garde JFIF, ICC, Adobe); exif: remplace le segment EXIF.
+    """
+    if data[:2] != b"\xff\xd8":
+        raise ValueError("JPEG invalide")
+    out = [data[:2]]
+    pos = 2
+    exif_written = exif is None
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            raise ValueError("JPEG invalide")
+        marker = data[pos + 1]
+        if marker == 0xFF:  # octet de remplissage
+            pos += 1
+            continue
+        if marker == 0xDA:  # SOS: la suite est le flux compresse, copie telle quelle
+            break
+        length = int.from_bytes(data[pos + 2:pos + 4], "big")
+        segment = data[pos:pos + 2 + length]
+        payload = segment[4:]
+        pos += 2 + length
+        is_exif = marker == 0xE1 and payload.startswith(b"Exif\x00\x00")
+        if is_exif and exif is not None:
+            if not exif_written:
+                out.append(b"\xff\xe1" + (len(exif) + 8).to_bytes(2, "big") + b"Exif\x00\x00" + exif)
+                exif_written = True
+            continue
+        if strip and (marker == 0xFE or (0xE0 <= marker <= 0xEF and not payload.startswith(_JPEG_KEEP_APP.get(marker, b"\x00")))):
+            continue
+        if not exif_written and marker not in range(0xE0, 0xF0):
+            # pas de segment EXIF dans la source: insere apres les APPn
+            out.append(b"\xff\xe1" + (len(exif) + 8).to_bytes(2, "big") + b"Exif\x00\x00" + exif)
+            exif_written = True
+        out.append(segment)
+    out.append(data[pos:])
+    return b"".join(out)
+
+
+def _jpeg_lossless_requested(
+    img: Image.Image,
+    *,
+    action: str,
+    out_ext: str,
+    comp_mode: str | None,
+    comp_value: str | None,
+    params: dict,
+    target_size: tuple[int, int] | None,
+) -> bool:
+    """JPEG -> JPEG sans changement de pixels: conversion, ou compression "lossless"."""
+    if img.format != "JPEG" or out_ext not in (".jpg", ".jpeg") or target_size is not None:
+        return False
+    if action == "convert":
+        return True
+    return action == "compress" and comp_mode not in ("size", "quality", "percent") and (
+        params.get("image_quality", comp_value) == "lossless"
+    )
+
+
+def _save_jpeg_lossless(img: Image.Image, *, input_path: str, output_path: str, params: dict) -> str:
+    """Metadonnees, orientation EXIF, Huffman optimise, progressif: sans decodage si possible.
+
+    jpegtran travaille sur les coefficients DCT; sans lui, seul le retrait de metadonnees se fait
+    au niveau des segments. Sinon (ou rotation imparfaite, taille non multiple du MCU): re-encodage
+    avec les tables de quantification et le sous-echantillonnage d origine (quality="keep").
+    Retourne la methode employee.
+    """
+    strip = _param_flag(params, "image_strip_metadata")
+    progressive = _param_flag(params, "image_progressive")
+    exif = img.getexif()
+    orientation = exif.get(0x0112, 1) if _param_flag(params, "image_auto_orient") else 1
+    if orientation not in _JPEGTRAN_ORIENT:
+        orientation = 1
+    new_exif = None
+    if orientation != 1 and not strip:
+        exif[0x0112] = 1
+        new_exif = exif.tobytes()[6:]  # sans l en-tete "Exif\0\0"
+
+    with open(input_path, "rb") as f:
+        data = f.read()
+
+    encoded = None
+    method = None
+    jpegtran = _jpegtran_path()
+    if jpegtran:
+        cmd = [jpegtran, "-copy", "all", "-optimize"]
+        if progressive:
+            cmd.append("-progressive")
+        if orientation != 1:
+            cmd.extend([*_JPEGTRAN_ORIENT[orientation], "-perfect"])
+        result = subprocess.run(cmd, input=data, capture_output=True, check=False)
+        if result.returncode == 0 and result.stdout:
+            encoded, method = result.stdout, "jpegtran"
+        else:
+            logging.info("jpegtran failed (%s), re-encode keep", (result.stderr or b"").decode("utf-8", "replace").strip())
+    elif orientation == 1 and not progressive:
+        encoded, method = data, "segments"
+
+    if encoded is not None:
+        encoded = _rewrite_jpeg_segments(encoded, strip=strip, exif=new_exif)
+        with open(output_path, "wb") as f:
+            f.write(encoded)
+        return method
+
+    # re-encodage: decodage complet
+    _check_decode_pixels(img.width, img.height)
+
+    from PIL import JpegImagePlugin
+
+    save_kwargs = {
+        "qtables": img.quantization,
+        "subsampling": JpegImagePlugin.get_sampling(img),
+        "optimize": True,
+        "progressive": progressive,
+    }
+    if img.info.get("icc_profile"):
+        save_kwargs["icc_profile"] = img.info["icc_profile"]
+    if strip:
+        # Pillow recopie sinon le commentaire de la source (img.info)
+        save_kwargs["comment"] = b""
+    else:
+        if orientation != 1:
+            exif[0x0112] = 1
+        save_kwargs["exif"] = exif.tobytes()
+    out = img.transpose(_EXIF_TRANSPOSE[orientation]) if orientation != 1 else img
+    out.save(output_path, format="JPEG", **save_kwargs)
+    return "keep"
+
+
+# format=auto: qualites a rendu visuel comparable d un encodeur a l autre (echelle JPEG 85)
+_AUTO_FORMAT_QUALITY = {".avif": 64, ".webp": 82, ".jpg": 85}
+
+
+def _auto_format_candidates(img: Image.Image, has_alpha: bool) -> list[tuple[str, int, bool]]:
+    """(extension, qualite, lossless) a essayer pour format=auto."""
+    Image.init()
+    candidates = [(".webp", _AUTO_FORMAT_QUALITY[".webp"], False)]
+    if "AVIF" in Image.SAVE:
+        candidates.insert(0, (".avif", _AUTO_FORMAT_QUALITY[".avif"], False))
+    if not has_alpha:
+        candidates.append((".jpg", _AUTO_FORMAT_QUALITY[".jpg"], False))
+    if img.getcolors(256) is not None:
+        # peu de couleurs (aplats, logos): PNG palette sans perte, souvent le plus petit
+        candidates.append((".png", 100, True))
+    return candidates
+
+
+def _exact_palette(img: Image.Image) -> Image.Image | None:
+    """Image palette identique pixel a pixel a img (<= 256 couleurs), None si introuvable."""
+    quantized = img.quantize(colors=256, method=Image.FASTOCTREE)
+    if img.mode == "RGB" and ImageChops.difference(quantized.convert("RGB"), img).getbbox() is not None:
+        # octree fusionne des couleurs proches; median cut garde une boite par couleur sous 256
+        quantized = img.quantize(colors=256, method=Image.MEDIANCUT)
+    if ImageChops.difference(quantized.convert(img.mode), img).getbbox() is not None:
+        return None
+    return quantized
+
+
+def _save_image_auto(
+    *, img: Image.Image, output_base: str, has_alpha: bool, effort: str
+) -> tuple[str, dict]:
+    """Encode les formats candidats (en parallele si des coeurs sont libres), garde le plus petit.
+
+    Retourne (extension ecrite, tailles par extension).
+    """
+    candidates = _auto_format_candidates(img, has_alpha)
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if has_alpha else "RGB")
+    img.load()
+
+    def encode(view: Image.Image, out_ext: str, quality: int, lossless: bool) -> bytes:
+        if out_ext == ".png":
+            # candidat sans perte: palette exacte, sinon PNG plein
+            return _png_bytes(_exact_palette(view) or view, effort=effort)
+        return _encode_image_bytes(
+            img=view, out_ext=out_ext, quality=quality, lossless=lossless, has_alpha=has_alpha, effort=effort
+        )
+
+    own = 1 if getattr(_job_timing_local, "current", None) is not None else 0
+    width = max(1, min(TRIAL_ENCODE_WORKERS, _idle_cpu_threads() + own))
+    # save() ecrit encoderinfo sur l objet Image: une vue par candidat, pixels partages
+    futures = [
+        trial_encode_executor.submit(encode, img._new(img.im), *candidate) if width > 1 else None
+        for candidate in candidates[1:]
+    ]
+    results = [encode(img._new(img.im), *candidates[0])]
+    for candidate, future in zip(candidates[1:], futures):
+        results.append(future.result() if future is not None else encode(img._new(img.im), *candidate))
+
+    sizes = {candidate[0]: len(encoded) for candidate, encoded in zip(candidates, results)}
+    chosen, encoded = min(zip((c[0] for c in candidates), results), key=lambda item: len(item[1]))
+    with open(f"{output_base}{chosen}", "wb") as f:
+        f.write(encoded)
+    return chosen, sizes
+
+
+def _parse_ssim_target(comp_value: str | None) -> float:
+    """SSIM vise depuis comp_value ("0.95" ou "95"); ValueError si hors ]0.5, 1[."""
+    if not (comp_value or "").strip():
+        return SSIM_TARGET_DEFAULT
+    target = float(comp_value)
+    if target > 1:
+        target /= 100
+    if not 0.5 < target < 1:
+        raise ValueError("SSIM cible invalide (0.5 a 0.999)")
+    return target
+
+
+# fenetre SSIM (carree, moyenne uniforme) et constantes de stabilite pour une dynamique 8 bits
+_SSIM_WINDOW = 7
+_SSIM_C1 = (0.01 * 255) ** 2
+_SSIM_C2 = (0.03 * 255) ** 2
+
+
+def _ssim_plane(img: Image.Image, factor: int):
+    """Luma reduite d un facteur entier (moyenne par blocs), en float64 sur l echelle video 16-235."""
+    if img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info:
+        # premultipliee par l alpha: la couleur sous un pixel transparent ne compte pas
+        la = img.convert("LA")
+        luma = ImageChops.multiply(la.getchannel("L"), la.getchannel("A"))
+    else:
+        luma = img.convert("L")
+    if factor > 1:
+        luma = luma.reduce(factor)
+    # noir a 16 comme le SSIM des codecs video: un decalage d un niveau dans les aplats noirs
+    # (arrondi DC JPEG) ne fait plus chuter le terme de luminance
+    return np.asarray(luma, dtype=np.float64) * (219 / 255) + 16
+
+
+def _box_mean(plane, size: int):
+    """Moyenne sur fenetre size x size (zone valide) par image integrale."""
+    integral = np.pad(plane, ((1, 0), (1, 0))).cumsum(axis=0).cumsum(axis=1)
+    return (
+        integral[size:, size:] - integral[:-size, size:] - integral[size:, :-size] + integral[:-size, :-size]
+    ) / (size * size)
+
+
+class _SsimReference:
+    """Reference decodee et statistiques locales calculees une fois, reutilisees a chaque essai."""
+
+    def __init__(self, img: Image.Image) -> None:
+        # reduction par blocs, au moins 512 px sur le petit cote pour garder le detail du texte
+        self.factor = max(1, min(img.size) // 512)
+        self.x = _ssim_plane(img, self.factor)
+        self.mu_x = _box_mean(self.x, _SSIM_WINDOW)
+        self.var_x = _box_mean(self.x * self.x, _SSIM_WINDOW) - self.mu_x * self.mu_x
+
+    def score(self, encoded: bytes) -> float:
+        with Image.open(io.BytesIO(encoded)) as decoded:
+            y = _ssim_plane(decoded, self.factor)
+        mu_y = _box_mean(y, _SSIM_WINDOW)
+        var_y = _box_mean(y * y, _SSIM_WINDOW) - mu_y * mu_y
+        cov = _box_mean(self.x * y, _SSIM_WINDOW) - self.mu_x * mu_y
+        ssim_map = ((2 * self.mu_x * mu_y + _SSIM_C1) * (2 * cov + _SSIM_C2)) / (
+            (self.mu_x * self.mu_x + mu_y * mu_y + _SSIM_C1) * (self.var_x + var_y + _SSIM_C2)
+        )
+        return float(ssim_map.mean())
+
+
+def _search_quality_for_ssim(
+    *,
+    img: Image.Image,
+    out_ext: str,
+    target_ssim: float,
+    has_alpha: bool,
+    effort: str = IMAGE_EFFORT,
+) -> tuple[bytes, dict]:
+    """Plus basse qualite dont le SSIM luma atteint target_ssim (dichotomie sur la qualite)."""
+    stats = {"encodes": 0, "quality": None, "ssim": None}
+    # tailles trop petites pour une fenetre apres reduction: pas de mesure possible
+    if min(img.size) < _SSIM_WINDOW:
+        raise ValueError("image trop petite pour une mesure SSIM")
+    # reference = ce que recoit l encodeur (JPEG perd l alpha)
+    reference = _SsimReference(img.convert("RGB") if has_alpha and out_ext in (".jpg", ".jpeg") else img)
+
+    lo, hi = _TARGET_QUALITY_MIN, _TARGET_QUALITY_MAX
+    best: tuple[int, bytes, float] | None = None
+    top: tuple[int, bytes, float] | None = None
+    while lo <= hi and stats["encodes"] < SSIM_MAX_ENCODES:
+        quality = (lo + hi) // 2
+        encoded = _encode_image_bytes(
+            img=img, out_ext=out_ext, quality=quality, lossless=False, has_alpha=has_alpha, effort=effort
+        )
+        stats["encodes"] += 1
+        score = reference.score(encoded)
+        if top is None or quality > top[0]:
+            top = (quality, encoded, score)
+        if score >= target_ssim:
+            best = (quality, encoded, score)
+            hi = quality - 1
+        else:
+            lo = quality + 1
+
+    if best is None:
+        # cible hors d atteinte dans le budget d essais: la plus haute qualite essayee
+        best = top
+    stats["quality"], stats["ssim"] = best[0], round(best[2], 5)
+    return best[1], stats
+
+
+def _save_image_with_target_ssim(
+    *,
+    img: Image.Image,
+    output_path: str,
+    target_ssim: float,
+    has_alpha: bool,
+    effort: str = IMAGE_EFFORT,
+) -> bool:
+    if np is None:
+        raise ValueError("compression a qualite visuelle indisponible (numpy absent)")
+
+    out_ext = os.path.splitext(output_path)[1].lower()
+    if out_ext not in (".jpg", ".jpeg", ".webp", ".avif", ".gif"):
+        # formats sans perte (PNG...): rien a chercher
+        return False
+    if min(img.size) < _SSIM_WINDOW:
+        # trop petite pour une fenetre SSIM: reglages par defaut
+        return False
+
+    encoded, stats = _search_quality_for_ssim(
+        img=img, out_ext=out_ext, target_ssim=target_ssim, has_alpha=has_alpha, effort=effort
+    )
+    _job_note_media(ssim_search=stats)
+    logging.info(
+        "target ssim q=%s ssim=%s/%s encodes=%s bytes=%s",
+        stats["quality"], stats["ssim"], target_ssim, stats["encodes"], len(encoded),
+    )
+    with open(output_path, "wb") as f:
+        f.write(encoded)
+    return True
+
+
+def _compress_quality(params: dict, comp_mode: str | None, comp_value: str | None) -> tuple[int, bool]:
+    """(qualite, lossless) d un job compress."""
+    # Quality mapping: "lossless", "90", "80", "70", "60", "50"
+    quality_val = params.get("image_quality", comp_value or "80")
+
+    # Handle old CRF-style values
+    if quality_val in ("low", "medium", "high"):
+        q_map = {"low": 90, "medium": 70, "high": 50}
+        quality = q_map.get(quality_val, 70)
+        lossless = False
+    elif quality_val == "lossless":
+        quality = 100
+        lossless = True
+    else:
+        try:
+            quality = int(quality_val)
+            quality = max(10, min(100, quality))
+        except ValueError:
+            quality = 80
+        lossless = False
+
+    if comp_mode == "percent":
+        try:
+            p_val = float(comp_value or 0)
+            quality = max(10, 100 - int(p_val))
+        except ValueError:
+            pass
+        lossless = False
+    return quality, lossless
+
+
+# sortie animee -> format Pillow; les autres cibles gardent la premiere frame
+_ANIMATED_OUTPUTS = {".gif": "GIF", ".webp": "WEBP", ".png": "PNG", ".apng": "PNG"}
+# disposal APNG (none, background, previous) -> disposal GIF
+_APNG_TO_GIF_DISPOSAL = {0: 1, 1: 2, 2: 2}
+
+
+def _animated_output_format(img: Image.Image, out_ext: str) -> str | None:
+    if not getattr(img, "is_animated", False) or getattr(img, "n_frames", 1) < 2:
+        return None
+    return _ANIMATED_OUTPUTS.get(out_ext)
+
+
+def _frame_gif_disposal(img: Image.Image, has_alpha: bool) -> int:
+    """Disposal GIF de la frame courante; les frames ecrites sont des canevas complets."""
+    if img.format == "GIF":
+        disposal = getattr(img, "disposal_method", 0)
+    elif img.format == "PNG":
+        disposal = _APNG_TO_GIF_DISPOSAL.get(img.info.get("disposal", 0), 1)
+    else:
+        disposal = 2 if has_alpha else 1
+    # "restore to previous" n est pas gere par l optimiseur de Pillow: un fond vide est equivalent ici
+    return 2 if disposal == 3 else disposal
+
+
+def _animated_frame(frame: Image.Image, size: tuple[int, int] | None, out_fmt: str, has_alpha: bool) -> Image.Image:
+    if size is not None and frame.size != size:
+        frame = frame.resize(size, resample=_LANCZOS)
+    if out_fmt != "GIF":
+        return frame
+    if not has_alpha:
+        return frame.quantize(colors=256)
+    # palette 255 couleurs + index 255 transparent (alpha GIF binaire)
+    quantized = frame.convert("RGB").quantize(colors=255)
+    quantized.paste(255, mask=frame.getchannel("A").point(lambda a: 255 if a < 128 else 0))
+    quantized.info["transparency"] = 255
+    return quantized
+
+
+def _process_animated_image(
+    img: Image.Image,
+    *,
+    output_path: str,
+    out_fmt: str,
+    size: tuple[int, int] | None,
+    quality: int,
+    lossless: bool,
+    effort: str = IMAGE_EFFORT,
+) -> None:
+    """Animation -> animation: durees, boucle et disposal conserves, frames en parallele si longues."""
+    n_frames = img.n_frames
+    if n_frames > ANIMATION_MAX_FRAMES:
+        raise ValueError(f"animation trop longue ({n_frames} frames, max {ANIMATION_MAX_FRAMES})")
+    loop = img.info.get("loop")
+
+    own = 1 if getattr(_job_timing_local, "current", None) is not None else 0
+    parallel = n_frames >= ANIMATION_PARALLEL_MIN_FRAMES and min(FRAME_WORKERS, _idle_cpu_threads() + own) > 1
+    _job_note_media(frames=n_frames, frame_parallel=parallel)
+
+    frames: list = []
+    durations: list[int] = []
+    disposals: list[int] = []
+    has_alpha = False
+    for index in range(n_frames):
+        # decodage sequentiel (chaque frame depend des precedentes), copie avant la frame suivante
+        img.seek(index)
+        img.load()
+        durations.append(int(img.info.get("duration") or 100))
+        frame = img.convert("RGBA" if img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info else "RGB")
+        disposals.append(_frame_gif_disposal(img, frame.mode == "RGBA"))
+        # alpha decide sur les pixels de chaque frame: la transparence peut n apparaitre qu apres la premiere
+        has_alpha = has_alpha or (frame.mode == "RGBA" and frame.getchannel("A").getextrema()[0] < 255)
+        frames.append(frame)
+        if index == 0 and img.format == "GIF" and img.disposal_method == 2 and "transparency" not in img.info:
+            # premiere frame opaque effacee: Pillow peindrait la couleur de fond (souvent noire) sous les
+            # frames suivantes; comme les navigateurs, la zone effacee devient transparente
+            img.info["transparency"] = img.info.get("background", 0)
+    # meme mode pour toutes les frames: l APNG prend celui de la premiere
+    mode = "RGBA" if has_alpha else "RGB"
+    frames = [frame if frame.mode == mode else frame.convert(mode) for frame in frames]
+
+    if parallel:
+        futures = [frame_executor.submit(_animated_frame, frame, size, out_fmt, has_alpha) for frame in frames]
+        frames = [f.result() for f in futures]
+    else:
+        frames = [_animated_frame(frame, size, out_fmt, has_alpha) for frame in frames]
 
-    return False
+    save_kwargs: dict = {"save_all": True, "append_images": frames[1:], "duration": durations}
+    if out_fmt == "GIF":
+        if loop is not None:
+            save_kwargs["loop"] = loop
+        save_kwargs.update(disposal=disposals, **_effort_kwargs("GIF", effort))
+    else:
+        # sans boucle dans la source: lecture unique
+        save_kwargs["loop"] = 1 if loop is None else loop
+        if out_fmt == "WEBP":
+            save_kwargs.update(quality=quality, lossless=lossless, **_effort_kwargs("WEBP", effort))
+        else:
+            # canevas complets: chaque zone modifiee remplace la precedente (APNG_BLEND_OP_SOURCE)
+            save_kwargs.update(disposal=0, blend=0, **_effort_kwargs("PNG", effort))
+    frames[0].save(output_path, format=out_fmt, **save_kwargs)
 
 
 def _process_image(
@@ -877,38 +3307,99 @@ def _process_image(
     comp_mode: str | None,
     comp_value: str | None,
     params: dict | None = None,
-) -> None:
+) -> str | None:
+    """Traite une image vers output_path; avec format=auto, retourne l extension choisie
+    (fichier ecrit a cote de output_path avec cette extension)."""
     params = params or {}
-    
-    with Image.open(input_path) as img:
-        # Optional resize (applies to both convert & compress)
-        resize_mode_raw = (str(params.get("image_resize_mode") or "").strip().lower())
-        if not resize_mode_raw and params.get("image_max_size"):
-            resize_mode_raw = "dimension"
-
-        if resize_mode_raw == "dimension":
-            target_max = None
-            if params.get("image_max_size") is not None:
-                try:
-                    target_max = int(str(params.get("image_max_size")).strip())
-                except ValueError:
-                    target_max = None
+    effort = _image_effort(params)
 
-            if target_max and target_max > 0:
-                img = _resize_preserve_aspect(img, target_max)
-        elif resize_mode_raw == "percent":
-            percent_value = None
-            if params.get("image_resize_percent") is not None:
-                try:
-                    percent_value = float(str(params.get("image_resize_percent")).strip())
-                except ValueError:
-                    percent_value = None
+    with _job_phase("probe"):
+        img = Image.open(input_path)
+    _job_note_media(width=img.width, height=img.height, mode=img.mode, format=img.format)
 
-            if percent_value and percent_value > 0:
-                scale = max(0.05, min(3.0, percent_value / 100.0))
-                new_width = max(1, int(img.width * scale))
-                new_height = max(1, int(img.height * scale))
-                img = img.resize((new_width, new_height), resample=_LANCZOS)
+    with img:
+        # Optional resize (applies to both convert & compress)
+        target_size = _requested_resize(params, img.size)
+
+        out_ext = os.path.splitext(output_path)[1].lower()
+        if _jpeg_lossless_requested(
+            img,
+            action=action,
+            out_ext=out_ext,
+            comp_mode=comp_mode,
+            comp_value=comp_value,
+            params=params,
+            target_size=target_size,
+        ):
+            method = _save_jpeg_lossless(img, input_path=input_path, output_path=output_path, params=params)
+            _job_note_media(jpeg_lossless=method)
+            return None
+
+        if action == "convert" and (target_format or "").lower().strip() == "pdf" and target_size is None:
+            source = _pdf_passthrough_source(img, input_path, params)
+            if source is not None:
+                _write_pdf_pages(output_path, [source])
+                _job_note_media(pdf_embed=source.method)
+                return None
+
+        # orientation lue dans l en-tete, appliquee apres la reduction (draft / bandes)
+        orientation = img.getexif().get(0x0112, 1) if _param_flag(params, "image_auto_orient") else 1
+
+        auto_ext = None
+        if action == "convert" and (target_format or "").lower().strip() == "auto":
+            # animation en format auto: WebP anime, seul candidat qui garde les frames avec perte
+            auto_ext = ".webp" if _animated_output_format(img, ".webp") else None
+            if auto_ext:
+                output_path = f"{os.path.splitext(output_path)[0]}{auto_ext}"
+                out_ext = auto_ext
+        animated_fmt = _animated_output_format(img, out_ext)
+
+        pixels = img.width * img.height
+        read_band = None
+        # conversion pleine taille en PNG/TIFF: ecrite par bandes si l orientation ne change pas
+        banded_out = None if target_size is not None or orientation in _EXIF_TRANSPOSE else (
+            _banded_output_format(action, target_format, img.mode)
+        )
+        if not animated_fmt and pixels >= IMAGE_TILED_MIN_PIXELS and (
+            banded_out or (target_size is not None and target_size[0] * target_size[1] < pixels)
+        ):
+            read_band = _band_reader(input_path, img)
+
+        if read_band is None:
+            # animation: chaque frame est decodee
+            _check_decode_pixels(img.width, img.height, img.n_frames if animated_fmt else 1)
+        elif banded_out:
+            _save_banded(img, read_band, output_path, banded_out, effort)
+            _job_note_media(banded=True)
+            return None
+
+        if animated_fmt:
+            if action == "compress":
+                # pas de recherche a taille cible sur une animation: qualite seule
+                if comp_mode in ("size", "quality"):
+                    quality, lossless = _compress_quality(params, None, None)
+                else:
+                    quality, lossless = _compress_quality(params, comp_mode, comp_value)
+            else:
+                quality, lossless = 95, False
+            _process_animated_image(
+                img,
+                output_path=output_path,
+                out_fmt=animated_fmt,
+                size=target_size,
+                quality=quality,
+                lossless=lossless,
+                effort=effort,
+            )
+            return auto_ext
+        if read_band is not None:
+            img = _banded_resize(img, read_band, target_size)
+            _job_note_media(banded=True)
+        elif target_size is not None:
+            img = _resize_with_draft(img, target_size)
+        if orientation in _EXIF_TRANSPOSE:
+            # les tailles demandees sont symetriques: reduire puis tourner donne la taille orientee
+            img = img.transpose(_EXIF_TRANSPOSE[orientation])
 
         # Check if image has transparency
         has_alpha = img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info)
@@ -926,35 +3417,22 @@ def _process_image(
                         output_path=output_path,
                         target_size_mb=target_size_mb,
                         has_alpha=has_alpha,
+                        effort=effort,
                     ):
                         return
 
-            # Quality mapping: "lossless", "90", "80", "70", "60", "50"
-            quality_val = params.get("image_quality", comp_value or "80")
-            
-            # Handle old CRF-style values
-            if quality_val in ("low", "medium", "high"):
-                q_map = {"low": 90, "medium": 70, "high": 50}
-                quality = q_map.get(quality_val, 70)
-                lossless = False
-            elif quality_val == "lossless":
-                quality = 100
-                lossless = True
-            else:
-                try:
-                    quality = int(quality_val)
-                    quality = max(10, min(100, quality))
-                except ValueError:
-                    quality = 80
-                lossless = False
+            if comp_mode == "quality":
+                if _save_image_with_target_ssim(
+                    img=img,
+                    output_path=output_path,
+                    target_ssim=_parse_ssim_target(comp_value),
+                    has_alpha=has_alpha,
+                    effort=effort,
+                ):
+                    return
+                comp_value = None  # PNG, image minuscule: reglages par defaut
 
-            if comp_mode == "percent":
-                try:
-                    p_val = float(comp_value or 0)
-                    quality = max(10, 100 - int(p_val))
-                except ValueError:
-                    pass
-                lossless = False
+            quality, lossless = _compress_quality(params, comp_mode, comp_value)
 
             # Determine output format from path
             _, out_ext = os.path.splitext(output_path)
@@ -962,25 +3440,21 @@ def _process_image(
             
             # Handle transparency preservation
             if out_ext in ('.png',):
-                # PNG supports transparency and lossless
-                if lossless:
-                    img.save(output_path, optimize=True, compress_level=9)
-                else:
-                    # PNG doesn't have quality, use compression level
-                    img.save(output_path, optimize=True, compress_level=6)
+                # PNG supports transparency and lossless; effort sets the zlib level
+                img.save(output_path, **_effort_kwargs("PNG", effort))
             elif out_ext in ('.webp',):
                 # WebP supports both transparency and quality
                 if lossless:
-                    img.save(output_path, lossless=True)
+                    img.save(output_path, lossless=True, **_effort_kwargs("WEBP", effort))
                 else:
-                    img.save(output_path, quality=quality, lossless=False)
+                    img.save(output_path, quality=quality, lossless=False, **_effort_kwargs("WEBP", effort))
             elif out_ext in ('.jpg', '.jpeg'):
                 # JPEG doesn't support transparency - convert to RGB
                 save_img = img.convert("RGB") if has_alpha else img
-                save_img.save(output_path, quality=quality, optimize=True)
+                save_img.save(output_path, quality=quality, **_effort_kwargs("JPEG", effort))
             elif out_ext in ('.gif',):
                 # GIF - keep palette and transparency
-                img.save(output_path, optimize=True)
+                img.save(output_path, **_effort_kwargs("GIF", effort))
             else:
                 # Default: try with quality if supported
                 try:
@@ -997,6 +3471,13 @@ def _process_image(
                 rgb_img.save(output_path, "PDF", resolution=100.0)
                 return
 
+            if tf == "auto":
+                chosen, sizes = _save_image_auto(
+                    img=img, output_base=os.path.splitext(output_path)[0], has_alpha=has_alpha, effort=effort
+                )
+                _job_note_media(auto_format=chosen.lstrip("."), auto_sizes=sizes)
+                return chosen
+
             if tf == "ico":
                 ico_raw = params.get("ico_size")
                 ico_size: int | None
@@ -1019,19 +3500,21 @@ def _process_image(
             if tf in {"jpg", "jpeg"}:
                 # JPEG doesn't support transparency
                 save_img = img.convert("RGB") if has_alpha else img
-                save_img.save(output_path, quality=95)
+                save_img.save(output_path, quality=95, **_effort_kwargs("JPEG", effort))
             elif tf in {"png"}:
                 # PNG preserves transparency
-                img.save(output_path, optimize=True)
+                img.save(output_path, **_effort_kwargs("PNG", effort))
             elif tf in {"webp"}:
                 # WebP preserves transparency
-                img.save(output_path, quality=95, lossless=False)
+                img.save(output_path, quality=95, lossless=False, **_effort_kwargs("WEBP", effort))
             elif tf in {"gif"}:
                 # GIF - convert to palette mode
                 if img.mode == 'RGBA':
                     # Convert RGBA to P mode with transparency
                     img = img.convert('P', palette=Image.ADAPTIVE, colors=255)
-                img.save(output_path, optimize=True)
+                img.save(output_path, **_effort_kwargs("GIF", effort))
+            elif tf in {"avif"}:
+                img.save(output_path, **_effort_kwargs("AVIF", effort))
             else:
                 img.save(output_path)
             return
@@ -1039,6 +3522,115 @@ def _process_image(
         raise ValueError("action non supportee")
 
 
+SRCSET_DEFAULT_WIDTHS = (320, 640, 960, 1280, 1920)
+SRCSET_DEFAULT_FORMATS = ("webp", "jpg")
+SRCSET_MAX_VARIANTS = 48
+# format demande -> (format Pillow, extension)
+_SRCSET_FORMATS = {
+    "jpg": ("JPEG", "jpg"),
+    "jpeg": ("JPEG", "jpg"),
+    "webp": ("WEBP", "webp"),
+    "avif": ("AVIF", "avif"),
+    "png": ("PNG", "png"),
+}
+
+
+def _parse_srcset_spec(form) -> tuple[list[int], list[str]]:
+    """Largeurs et formats d un job srcset ("320,640,1280" / "webp,avif,jpg"); ValueError si invalide."""
+    widths_raw = (form.get("srcset_widths") or "").strip()
+    formats_raw = (form.get("srcset_formats") or "").strip().lower()
+    try:
+        widths = sorted({int(w) for w in widths_raw.split(",") if w.strip()}) if widths_raw else list(SRCSET_DEFAULT_WIDTHS)
+    except ValueError:
+        raise ValueError("largeurs srcset invalides")
+    if not widths or any(w < 16 or w > 8192 for w in widths):
+        raise ValueError("largeurs srcset invalides (16 a 8192 px)")
+
+    Image.init()  # Image.SAVE ne liste WEBP/AVIF qu une fois tous les plugins charges
+    formats = []
+    for fmt in (f.strip() for f in formats_raw.split(",")) if formats_raw else SRCSET_DEFAULT_FORMATS:
+        if not fmt:
+            continue
+        if fmt not in _SRCSET_FORMATS or _SRCSET_FORMATS[fmt][0] not in Image.SAVE:
+            raise ValueError(f"format srcset non supporte: {fmt}")
+        if _SRCSET_FORMATS[fmt][1] not in formats:
+            formats.append(_SRCSET_FORMATS[fmt][1])
+    if not formats:
+        raise ValueError("formats srcset manquants")
+
+    if len(widths) * len(formats) > SRCSET_MAX_VARIANTS:
+        raise ValueError(f"trop de variantes srcset (max {SRCSET_MAX_VARIANTS})")
+    return widths, formats
+
+
+def _encode_srcset_variant(img: Image.Image, fmt: str, quality: int, has_alpha: bool, effort: str) -> bytes:
+    buffer = io.BytesIO()
+    if fmt == "jpg":
+        save_img = img.convert("RGB") if has_alpha else img
+        save_img.save(buffer, format="JPEG", quality=quality, progressive=True, **_effort_kwargs("JPEG", effort))
+    elif fmt == "webp":
+        img.save(buffer, format="WEBP", quality=quality, **_effort_kwargs("WEBP", effort))
+    elif fmt == "avif":
+        img.save(buffer, format="AVIF", quality=quality, **_effort_kwargs("AVIF", effort))
+    else:
+        img.save(buffer, format="PNG", **_effort_kwargs("PNG", effort))
+    return buffer.getvalue()
+
+
+def _process_srcset(*, input_path: str, output_path: str, base_name: str, params: dict) -> dict:
+    """Un decodage, une pyramide de reductions (chaque palier depuis le precedent), une archive + manifest."""
+    widths = params.get("srcset_widths") or list(SRCSET_DEFAULT_WIDTHS)
+    formats = params.get("srcset_formats") or list(SRCSET_DEFAULT_FORMATS)
+    effort = _image_effort(params)
+    try:
+        quality = max(10, min(100, int(params.get("image_quality") or 82)))
+    except ValueError:
+        quality = 82
+
+    with _job_phase("probe"):
+        img = Image.open(input_path)
+    _job_note_media(width=img.width, height=img.height, mode=img.mode, format=img.format)
+
+    with img:
+        src_width, src_height = img.size
+        _check_decode_pixels(src_width, src_height)
+
+        # pas d agrandissement: les largeurs au-dela de la source sont ramenees a la source
+        levels = sorted({min(w, src_width) for w in widths}, reverse=True)
+
+        def level_size(width: int) -> tuple[int, int]:
+            return (width, max(1, round(src_height * width / src_width)))
+
+        level = _resize_with_draft(img, level_size(levels[0])) if levels[0] < src_width else img
+        has_alpha = level.mode in ("RGBA", "LA", "PA") or (level.mode == "P" and "transparency" in level.info)
+        if level.mode not in ("RGB", "RGBA", "L", "LA"):
+            level = level.convert("RGBA" if has_alpha else "RGB")
+
+        entries = []
+        working = f"{output_path}.part"
+        try:
+            with zipfile.ZipFile(working, "w", zipfile.ZIP_STORED) as zf:
+                for width in levels:
+                    if level.size != level_size(width):
+                        level = level.resize(level_size(width), resample=_LANCZOS)
+                    for fmt in formats:
+                        data = _encode_srcset_variant(level, fmt, quality, has_alpha, effort)
+                        name = f"{base_name}-{width}w.{fmt}"
+                        zf.writestr(name, data)
+                        entries.append(
+                            {"file": name, "width": level.width, "height": level.height, "format": fmt, "bytes": len(data)}
+                        )
+
+                manifest = {"source": {"width": src_width, "height": src_height}, "images": entries}
+                zf.writestr("manifest.json", json.dumps(manifest, indent=2))
+            os.replace(working, output_path)
+        finally:
+            if os.path.exists(working):
+                os.remove(working)
+
+    return manifest
+
+
 def _media_type_from_filename(name: str) -> str:
     _, ext = os.path.splitext(name)
     ext = (ext or "").lower()
@@ -1055,6 +3647,384 @@ def _media_type_from_filename(name: str) -> str:
     return "unknown"
 
 
+SNIFF_BYTES = 4096
+
+_FTYP_IMAGE_BRANDS = {
+    b"heic", b"heix", b"hevc", b"hevx", b"heim", b"heis", b"mif1", b"mif2", b"msf1", b"miaf",
+    b"avif", b"avis", b"MA1A", b"MA1B",
+}
+_QT_ATOMS = {b"ftyp", b"moov", b"mdat", b"wide", b"free", b"skip", b"pnot"}
+
+# Extensions dont la signature est fiable: un contenu non reconnu est refuse
+_STRICT_MAGIC_EXTENSIONS = {
+    ".pdf", ".png", ".jpg", ".jpeg", ".gif", ".webp", ".bmp", ".psd", ".heic", ".heif", ".avif",
+    ".mp4", ".m4v", ".m4a", ".mov", ".mkv", ".webm", ".mka", ".avi", ".flac", ".wav", ".ogg",
+    ".oga", ".ogv", ".opus",
+}
+
+
+def _ftyp_brands(head: bytes) -> set[bytes]:
+    """Marque majeure + marques compatibles de la boite ftyp (AVIF MA1B, HEIF miaf...)."""
+    end = min(int.from_bytes(head[:4], "big"), len(head))
+    brands = {head[8:12]}
+    brands.update(head[i:i + 4] for i in range(16, end - 3, 4))
+    return brands
+
+
+def _sniff_media(head: bytes) -> tuple[str, set[str]] | None:
+    """Devine le conteneur/codec depuis les premiers octets: (nom, types media compatibles)."""
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png", {"image"}
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg", {"image"}
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif", {"image"}
+    if head[:4] in (b"II*\x00", b"MM\x00*", b"IIRO", b"IIU\x00"):
+        return "tiff", {"image"}
+    if head.startswith(b"8BPS"):
+        return "psd", {"image"}
+    if head.startswith(b"BM"):
+        return "bmp", {"image"}
+    if head.startswith(b"\x00\x00\x01\x00"):
+        return "ico", {"image"}
+    if head.startswith(b"icns"):
+        return "icns", {"image"}
+    if head.startswith(b"\x00\x00\x00\x0cjP  ") or head.startswith(b"\xff\x4f\xff\x51"):
+        return "jpeg2000", {"image"}
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp", {"image"}
+    if head[:4] in (b"RIFF", b"RF64", b"BW64") and head[8:12] == b"WAVE":
+        return "wav", {"audio"}  # RF64/BW64: wav de plus de 4 Go
+    if head[:4] == b"RIFF" and head[8:12] == b"AVI ":
+        return "avi", {"video"}
+    if b"%PDF-" in head[:1024]:
+        return "pdf", {"pdf"}
+    if head[4:8] == b"ftyp":
+        if _ftyp_brands(head) & _FTYP_IMAGE_BRANDS:
+            return "heif", {"image"}
+        return "mp4", {"video", "audio"}
+    if head[4:8] in _QT_ATOMS:
+        return "quicktime", {"video", "audio"}
+    if head.startswith(b"\x1a\x45\xdf\xa3"):
+        return "matroska", {"video", "audio"}
+    if head.startswith(b"OggS"):
+        return "ogg", {"audio", "video"}
+    if head.startswith(b"fLaC"):
+        return "flac", {"audio"}
+    if head.startswith(b"ID3"):
+        return "mp3", {"audio"}
+    if head[:4] == b"FORM" and head[8:12] in (b"AIFF", b"AIFC"):
+        return "aiff", {"audio"}
+    if head.startswith(b"#!AMR"):
+        return "amr", {"audio"}
+    if head.startswith(b"MThd"):
+        return "midi", {"audio"}
+    if head.startswith(b"MAC "):
+        return "ape", {"audio"}
+    if head.startswith(b".snd"):
+        return "au", {"audio"}
+    if head.startswith(b"0&\xb2u\x8ef\xcf\x11"):
+        return "asf", {"video", "audio"}
+    if head.startswith(b"FLV"):
+        return "flv", {"video"}
+    if head.startswith(b".RMF"):
+        return "realmedia", {"video", "audio"}
+    if head.startswith(b"\x00\x00\x01\xba"):
+        return "mpeg-ps", {"video"}
+    if len(head) > 376 and head[0] == 0x47 and head[188] == 0x47:
+        return "mpeg-ts", {"video"}
+    if len(head) > 196 and head[4] == 0x47 and head[196] == 0x47:
+        return "mpeg-ts", {"video"}  # m2ts: paquets de 192 octets
+    if head.startswith(b"\x0b\x77"):
+        return "ac3", {"audio"}
+    if head.startswith(b"\x7f\xfe\x80\x01"):
+        return "dts", {"audio"}
+    if len(head) >= 2 and head[0] == 0xFF and head[1] & 0xF6 == 0xF0:
+        return "aac", {"audio"}
+    if len(head) >= 2 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0:
+        return "mpeg-audio", {"audio"}
+    return None
+
+
+def _verify_upload_content(original_filename: str, media_type: str, head: bytes) -> str | None:
+    """Controle l extension par la signature; retourne le format detecte ou leve ValueError."""
+    if not head:
+        raise ValueError("fichier vide")
+
+    sniffed = _sniff_media(head)
+    if sniffed is None:
+        ext = os.path.splitext(original_filename)[1].lower()
+        if ext in _STRICT_MAGIC_EXTENSIONS:
+            raise ValueError("contenu du fichier non reconnu")
+        return None
+
+    name, media_types = sniffed
+    if media_type != "unknown" and media_type not in media_types:
+        raise ValueError(f"contenu du fichier ({name}) incompatible avec son extension")
+    return name
+
+
+class _IngestFile:
+    """Fichier d upload ecrit directement a sa place finale, hache et sniffe au passage."""
+
+    def __init__(self, filename: str | None) -> None:
+        self.job_id = _new_id()
+        self.path = os.path.join(UPLOAD_DIR, f"{self.job_id}__{secure_filename(filename or '') or 'upload'}")
+        self.head = b""
+        self.size = 0
+        self.claimed = False
+        self.params: dict = {}
+        self.finished = False
+        self.failed = False
+        self._cond = threading.Condition()
+        self._sha = hashlib.sha256()
+        self._fh = open(self.path, "w+b")
+
+    def write(self, data: bytes) -> int:
+        self._sha.update(data)
+        if len(self.head) < SNIFF_BYTES:
+            self.head += bytes(data[: SNIFF_BYTES - len(self.head)])
+        n = self._fh.write(data)
+        # visible sur disque pour un lecteur concurrent (transcodage en direct)
+        self._fh.flush()
+        with self._cond:
+            self.size += len(data)
+            self._cond.notify_all()
+        return n
+
+    def finish(self, *, failed: bool = False) -> None:
+        with self._cond:
+            self.finished = True
+            self.failed = failed
+            self._cond.notify_all()
+
+    def wait_for_data(self, offset: int) -> bool:
+        """Bloque jusqu a ce que des octets existent au-dela de offset; False en fin d upload."""
+        with self._cond:
+            while self.size <= offset and not self.finished:
+                self._cond.wait()
+            return self.size > offset
+
+    def sha256(self) -> str:
+        return self._sha.hexdigest()
+
+    def discard(self) -> None:
+        self._fh.close()
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.path)
+
+    def __getattr__(self, name: str):
+        return getattr(self._fh, name)
+
+
+class _IngestRequest(Request):
+    """Les fichiers multipart vont directement dans uploads/ (pas de fichier temporaire spoole)."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        stream = _IngestFile(filename)
+        self.__dict__.setdefault("_ingested", []).append(stream)
+        return stream
+
+
+app.request_class = _IngestRequest
+
+_live_uploads: dict[str, _IngestFile] = {}
+_live_uploads_lock = threading.Lock()
+
+# Conteneurs lisibles sans seek depuis un pipe (mp4/mov seulement si moov est en tete)
+_PIPE_STREAMABLE_EXTENSIONS = {
+    ".mp3", ".wav", ".flac", ".aac", ".ogg", ".opus", ".ac3", ".eac3", ".mka", ".mpa", ".amr", ".au",
+    ".mkv", ".webm", ".ts", ".mts", ".m2ts", ".mpeg", ".mpg", ".vob", ".flv", ".ogv",
+    ".mp4", ".m4a", ".m4v", ".mov", ".3gp", ".3g2",
+}
+
+
+def _mp4_moov_first(head: bytes) -> bool:
+    offset = 0
+    while offset + 8 <= len(head):
+        size = int.from_bytes(head[offset:offset + 4], "big")
+        kind = head[offset + 4:offset + 8]
+        if kind == b"moov":
+            return True
+        if kind == b"mdat":
+            return False
+        if size == 1 and offset + 16 <= len(head):
+            size = int.from_bytes(head[offset + 8:offset + 16], "big")
+        if size < 8:
+            return False
+        offset += size
+    return False
+
+
+def _live_transcode_eligible(form, filename: str | None, head: bytes) -> bool:
+    """Le job peut-il lire l upload en cours via un pipe ? Sinon on attend le fichier complet."""
+    ext = os.path.splitext(secure_filename(filename or ""))[1].lower()
+    if ext not in _PIPE_STREAMABLE_EXTENSIONS:
+        return False
+
+    # les champs doivent preceder le fichier dans le multipart
+    action = _validate_action(form.get("action"))
+    target_format = (form.get("format") or "").strip().lower()
+    if action not in {"convert", "compress"} or (action == "convert" and not target_format):
+        return False
+
+    if ext in VIDEO_EXTENSIONS:
+        if action == "convert" and target_format == "gif":
+            return False
+        if str(form.get("two_pass") or "").lower() in {"1", "true", "yes", "on"}:
+            return False
+        quality_mode = form.get("video_quality_mode") or "auto"
+        comp_mode = (form.get("comp_mode") or "").strip()
+        if action == "compress" and quality_mode not in {"bitrate", "crf"} and comp_mode in {"size", "percent"}:
+            return False  # ffprobe sur le fichier complet
+
+    if head[4:8] in _QT_ATOMS and not _mp4_moov_first(head):
+        return False
+    return True
+
+
+def _fail_live_job(live: _IngestFile, msg: str) -> None:
+    """Upload en direct interrompu: job en erreur s il n a pas demarre, sinon le job echoue de lui-meme."""
+    if _db_update_job(live.job_id, status="error", error=msg, expires_at=_now_ts() + RETENTION_SECONDS, if_status="queued"):
+        live.close()
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(live.path)
+
+
+def _ingest_multipart_live():
+    """Parse le multipart au fil de l eau et soumet le job des que l entete du fichier est recu.
+
+    Retourne None quand le transcodage en direct ne s applique pas: le formulaire
+    est alors expose via request.form/request.files pour le chemin normal.
+    """
+    boundary = request.mimetype_params.get("boundary")
+    if not boundary:
+        return None
+
+    decoder = MultipartDecoder(
+        boundary.encode("latin-1"),
+        max_form_memory_size=request.max_form_memory_size,
+        max_parts=request.max_form_parts,
+    )
+    src = request.stream
+    fields: list[tuple[str, str]] = []
+    files: list[tuple[str, FileStorage]] = []
+    part: Field | File | None = None
+    container: list[bytes] = []
+    stream: _IngestFile | None = None
+    live: _IngestFile | None = None
+    response = None
+
+    try:
+        complete = False
+        while not complete:
+            chunk = src.read(64 * 1024)
+            decoder.receive_data(chunk or None)
+            event = decoder.next_event()
+            while not isinstance(event, (Epilogue, NeedData)):
+                if isinstance(event, Field):
+                    if live is not None:
+                        # job deja admis avec le formulaire recu jusque-la
+                        raise ValueError("champs du formulaire apres le fichier")
+                    part = event
+                    container = []
+                elif isinstance(event, File):
+                    part = event
+                    stream = request._get_file_stream(None, event.headers.get("content-type"), event.filename)
+                elif isinstance(event, Data) and isinstance(part, Field):
+                    container.append(event.data)
+                    if not event.more_data:
+                        fields.append((part.name, b"".join(container).decode("utf-8", "replace")))
+                elif isinstance(event, Data) and stream is not None:
+                    stream.write(event.data)
+                    if (
+                        response is None
+                        and part.name == "file"
+                        and (stream.size >= SNIFF_BYTES or not event.more_data)
+                        and _live_transcode_eligible(MultiDict(fields), part.filename, stream.head)
+                    ):
+                        response = _admit_upload(
+                            MultiDict(fields),
+                            FileStorage(stream, part.filename, part.name),
+                            live=True,
+                        )
+                        if response[1] >= 400:
+                            return response
+                        live = stream
+                    if not event.more_data:
+                        stream.seek(0)
+                        files.append((part.name, FileStorage(stream, part.filename, part.name, headers=part.headers)))
+                event = decoder.next_event()
+            complete = isinstance(event, Epilogue)
+            if not chunk and not complete:
+                raise ValueError("upload incomplet")
+
+        if live is not None:
+            live.close()
+            live.finish()
+    except ValueError as e:
+        # corps tronque (client deconnecte), multipart invalide ou champ apres le fichier
+        msg = "upload incomplet"
+        if str(e) == "champs du formulaire apres le fichier":
+            msg = str(e)
+        if live is not None:
+            live.finish(failed=True)
+            _fail_live_job(live, msg)
+        return jsonify({"error": msg}), 400
+    except BaseException:
+        if live is not None:
+            live.finish(failed=True)
+            _fail_live_job(live, "upload incomplet")
+        raise
+    finally:
+        if live is not None:
+            with _live_uploads_lock:
+                _live_uploads.pop(live.job_id, None)
+
+    if live is not None:
+        _db_update_job(live.job_id, params={**live.params, "sha256": live.sha256()})
+        return response
+
+    request.__dict__["form"] = ImmutableMultiDict(fields)
+    request.__dict__["files"] = ImmutableMultiDict(files)
+    return None
+
+
+@app.teardown_request
+def _discard_unclaimed_uploads(exc) -> None:
+    for stream in request.__dict__.get("_ingested", ()):
+        if not stream.claimed:
+            stream.discard()
+
+
+def _executor_for_job(media_type: str, params: dict) -> ThreadPoolExecutor:
+    if params.get("live_transcode"):
+        # attend surtout le reseau: hors du pool video a 1 worker
+        return live_transcode_executor
+    if media_type == "image":
+        mem_bytes = (params.get("image_probe") or {}).get("mem_bytes") or 0
+        if mem_bytes >= IMAGE_HUGE_JOB_MB * 1024 * 1024:
+            return huge_image_executor
+    return _executor_for_media_type(media_type)
+
+
+def _submit_job(job_id: str, media_type: str, params: dict) -> None:
+    """Soumet le job a son pool; un job image attend d abord sa reservation memoire, sans thread de pool."""
+    ex = _executor_for_job(media_type, params)
+    if media_type != "image":
+        ex.submit(_run_job, job_id)
+        return
+    mem_bytes = (params.get("image_probe") or {}).get("mem_bytes") or 0
+    image_memory_budget.submit(mem_bytes, lambda reserved: ex.submit(_run_reserved_job, job_id, reserved))
+
+
+def _run_reserved_job(job_id: str, reserved: int) -> None:
+    try:
+        _run_job(job_id)
+    finally:
+        image_memory_budget.release(reserved)
+
+
 def _executor_for_media_type(media_type: str) -> ThreadPoolExecutor:
     if media_type == "video":
         return video_executor
@@ -1079,11 +4049,112 @@ def _maybe_test_sleep(media_type: str) -> None:
         time.sleep(sec)
 
 
+_job_timing_local = threading.local()
+
+# jobs en cours dans ce process, pour estimer les coeurs libres
+_running_jobs = 0
+_running_jobs_lock = threading.Lock()
+
+
+def _idle_cpu_threads() -> int:
+    with _running_jobs_lock:
+        return max(0, CPU_THREADS - _running_jobs)
+
+
+class _JobTimings:
+    """Durees par phase (secondes) et parametres media du job en cours sur ce thread."""
+
+    def __init__(self) -> None:
+        self.phases: dict[str, float] = {}
+        self.media: dict[str, object] = {}
+
+
+@contextlib.contextmanager
+def _job_phase(name: str):
+    timings = getattr(_job_timing_local, "current", None)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings.phases[name] = timings.phases.get(name, 0.0) + time.perf_counter() - start
+
+
+def _job_note_media(**fields) -> None:
+    timings = getattr(_job_timing_local, "current", None)
+    if timings is not None:
+        timings.media.update({k: v for k, v in fields.items() if v})
+
+
+def _file_size(path: str | None) -> int | None:
+    try:
+        return os.path.getsize(path) if path else None
+    except OSError:
+        return None
+
+
+def _record_job_history(
+    job: sqlite3.Row,
+    *,
+    status: str,
+    timings: _JobTimings,
+    run_start: float,
+    input_bytes: int | None,
+    output_path: str | None,
+) -> None:
+    """Ajoute la ligne d historique du job; une erreur ici ne doit pas faire echouer le job."""
+    total = time.perf_counter() - run_start
+    probe = timings.phases.get("probe", 0.0)
+    admission = timings.phases.get("admission", 0.0)
+    process = timings.phases.get("process", total)
+    _, input_ext = os.path.splitext(job["original_filename"])
+    target_format = job["target_format"]
+    if not target_format and output_path:
+        target_format = os.path.splitext(output_path)[1].lstrip(".")
+    media = dict(timings.media)
+    if job["comp_mode"]:
+        media["comp_mode"] = job["comp_mode"]
+
+    def ms(seconds: float) -> int:
+        return int(round(seconds * 1000))
+
+    try:
+        _db_record_job_history(
+            {
+                "job_id": job["id"],
+                "media_type": job["media_type"] or "unknown",
+                "action": job["action"],
+                "target_format": (target_format or "").lower(),
+                "input_ext": input_ext.lower() or None,
+                "status": status,
+                "finished_at": _now_ts(),
+                "queue_wait_ms": ms(timings.phases.get("queue_wait", 0.0) + admission),
+                "probe_ms": ms(probe),
+                "encode_ms": ms(max(0.0, process - probe - admission)),
+                "write_ms": ms(timings.phases.get("write", 0.0)),
+                "total_ms": ms(total),
+                "input_bytes": input_bytes,
+                "output_bytes": _file_size(output_path) if status == "done" else None,
+                "media": json.dumps(media) if media else None,
+            }
+        )
+    except Exception:
+        logging.exception("job history record failed %s", job["id"])
+
+
 def _run_job(job_id: str) -> None:
     job = _db_get_job(job_id)
     if not job:
         return
 
+    run_start = time.perf_counter()
+    timings = _JobTimings()
+    timings.phases["queue_wait"] = max(0.0, time.time() - job["created_at"])
+    _job_timing_local.current = timings
+    status = "error"
+    output_path = None
+    input_bytes = None
+
     input_path = job["input_path"]
     action = job["action"]
     target_format = job["target_format"]
@@ -1093,12 +4164,24 @@ def _run_job(job_id: str) -> None:
     media_type = job["media_type"] or "unknown"
     rel_path = _sanitize_relative_path(params.get("relative_path")) if isinstance(params, dict) else None
 
+    # reference prise avant le passage a processing: un echec d upload ulterieur reste visible
+    with _live_uploads_lock:
+        ingest = _live_uploads.get(job_id)
+    live_upload = ingest if ingest is not None and not ingest.finished else None
+
     started_at = _now_ts()
-    _db_update_job(job_id, status="processing", started_at=started_at)
+    if not _db_update_job(job_id, status="processing", started_at=started_at, if_status="queued"):
+        # job deja en erreur (upload en direct interrompu avant le demarrage)
+        return
     logging.info("job start %s type=%s", job_id, media_type)
 
+    global _running_jobs
+    with _running_jobs_lock:
+        _running_jobs += 1
+
     try:
         _maybe_test_sleep(media_type)
+        process_start = time.perf_counter()
         _, ext = os.path.splitext(job["original_filename"])
         ext = (ext or "").lower()
 
@@ -1108,6 +4191,10 @@ def _run_job(job_id: str) -> None:
             out_ext = f".{(target_format or '').lower().strip()}"
             output_filename = f"{base_name}{out_ext}"
             storage_filename = f"{job_id}{out_ext}"
+        elif action == "srcset":
+            out_ext = ".zip"
+            output_filename = f"{base_name}_srcset.zip"
+            storage_filename = f"{job_id}.zip"
         else:
             out_ext = ext
             output_filename = f"{base_name}{ext}"
@@ -1115,7 +4202,10 @@ def _run_job(job_id: str) -> None:
 
         output_path = os.path.join(PROCESSED_DIR, storage_filename)
 
-        if ext in VIDEO_EXTENSIONS:
+        if action == "assemble_pdf":
+            _assemble_pdf(output_path=output_path, params=params)
+
+        elif ext in VIDEO_EXTENSIONS:
             # Special case for GIF conversion from video with advanced options
             if action == "convert" and target_format == "gif":
                  # Check if we have specialized gif params or just standard
@@ -1135,6 +4225,7 @@ def _run_job(job_id: str) -> None:
                     comp_value=comp_value,
                           target_format=target_format,
                     params=params,
+                    live_upload=live_upload,
                 )
 
         elif ext in AUDIO_EXTENSIONS:
@@ -1147,6 +4238,7 @@ def _run_job(job_id: str) -> None:
                 comp_value=comp_value,
                 target_format=target_format,
                 params=params,
+                live_upload=live_upload,
             )
 
         elif ext == ".pdf":
@@ -1159,18 +4251,37 @@ def _run_job(job_id: str) -> None:
             )
 
         elif ext in IMAGE_EXTENSIONS:
-            _process_image(
-                input_path=input_path,
-                output_path=output_path,
-                action=action,
-                target_format=target_format,
-                comp_mode=comp_mode,
-                comp_value=comp_value,
-                params=params,
-            )
+            # budget memoire deja reserve a la soumission (_submit_job)
+            if action == "srcset":
+                manifest = _process_srcset(
+                    input_path=input_path,
+                    output_path=output_path,
+                    base_name=base_name,
+                    params=params,
+                )
+                params["srcset_manifest"] = manifest
+                _db_update_job(job_id, params=params)
+            else:
+                chosen_ext = _process_image(
+                    input_path=input_path,
+                    output_path=output_path,
+                    action=action,
+                    target_format=target_format,
+                    comp_mode=comp_mode,
+                    comp_value=comp_value,
+                    params=params,
+                )
+                if chosen_ext:
+                    output_path = os.path.join(PROCESSED_DIR, f"{job_id}{chosen_ext}")
+                    output_filename = f"{base_name}{chosen_ext}"
         else:
             raise ValueError("format non supporte")
 
+        if ingest is not None and ingest.failed:
+            raise ValueError("upload incomplet")
+
+        timings.phases["process"] = time.perf_counter() - process_start
+        write_start = time.perf_counter()
         done_at = _now_ts()
         expires_at = done_at + RETENTION_SECONDS
         _db_update_job(
@@ -1184,6 +4295,25 @@ def _run_job(job_id: str) -> None:
         )
         logging.info("job done %s type=%s", job_id, media_type)
 
+        if SESSION_ARCHIVE_ENABLED:
+            try:
+                _session_archive_append(
+                    job["session_id"],
+                    {
+                        "id": job_id,
+                        "output_path": output_path,
+                        "output_filename": output_filename,
+                        "params": job["params"],
+                        "action": action,
+                        "target_format": target_format,
+                    },
+                )
+            except Exception:
+                logging.exception("session archive append failed %s", job_id)
+
+        timings.phases["write"] = time.perf_counter() - write_start
+        status = "done"
+
     except Exception as e:
         msg = _safe_error_message(e)
         expires_at = _now_ts() + RETENTION_SECONDS
@@ -1191,6 +4321,18 @@ def _run_job(job_id: str) -> None:
         logging.info("job error %s type=%s %s", job_id, media_type, msg)
 
     finally:
+        with _running_jobs_lock:
+            _running_jobs -= 1
+        _job_timing_local.current = None
+        input_bytes = _file_size(input_path)
+        _record_job_history(
+            job,
+            status=status,
+            timings=timings,
+            run_start=run_start,
+            input_bytes=input_bytes,
+            output_path=output_path,
+        )
         if input_path and os.path.exists(input_path):
             try:
                 os.remove(input_path)
@@ -1236,12 +4378,77 @@ def health():
                 "audio": AUDIO_WORKERS,
                 "image": IMAGE_WORKERS,
                 "pdf": PDF_WORKERS,
+                "image_huge": HUGE_IMAGE_WORKERS,
+            },
+            "image_memory": {
+                "budget_bytes": image_memory_budget.capacity,
+                "reserved_bytes": image_memory_budget.reserved,
             },
             "retention_seconds": RETENTION_SECONDS,
+            "orphans_reclaimed": {
+                "files": _orphan_stats["files"],
+                "bytes": _orphan_stats["bytes"],
+                "last_run_at": _orphan_stats["last_run_at"],
+            },
         }
     )
 
 
+def _percentile(sorted_values: list[float], pct: float) -> float | None:
+    # rang le plus proche: valeur reellement observee, pas d interpolation
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def _summarize(values: list[float]) -> dict:
+    values = sorted(v for v in values if v is not None)
+    return {
+        "p50": _percentile(values, 50),
+        "p90": _percentile(values, 90),
+        "p99": _percentile(values, 99),
+        "max": values[-1] if values else None,
+    }
+
+
+@app.route("/stats/jobs", methods=["GET"])
+def job_stats():
+    """Percentiles de duree par (media_type, action, target_format) sur une fenetre glissante."""
+    try:
+        days = int(request.args.get("days", "7"))
+    except ValueError:
+        return jsonify({"error": "days invalide"}), 400
+    days = max(1, min(JOB_STATS_MAX_DAYS, days))
+
+    filters = {k: (request.args.get(k) or "").strip().lower() for k in ("media_type", "action", "target_format")}
+    rows = _db_job_history_window(_now_ts() - days * 86400, filters)
+
+    groups: dict[tuple[str, str, str], list[sqlite3.Row]] = {}
+    for row in rows:
+        groups.setdefault((row["media_type"], row["action"], row["target_format"]), []).append(row)
+
+    out = []
+    for (media_type, action, target_format), group in sorted(groups.items()):
+        done = [r for r in group if r["status"] == "done"]
+        entry = {
+            "media_type": media_type,
+            "action": action,
+            "target_format": target_format,
+            "count": len(done),
+            "errors": len(group) - len(done),
+        }
+        for column in ("queue_wait_ms", "probe_ms", "encode_ms", "write_ms", "total_ms"):
+            entry[column] = _summarize([r[column] for r in done])
+        # debit d encodage: octets d entree par seconde de traitement
+        entry["input_bytes_per_s"] = _summarize(
+            [r["input_bytes"] * 1000 / r["encode_ms"] for r in done if r["input_bytes"] and r["encode_ms"]]
+        )
+        out.append(entry)
+
+    return jsonify({"days": days, "groups": out})
+
+
 def build_ffmpeg_command_pro(input_path, output_path, params):
     """Build FFmpeg command with Handbrake-level precision."""
     cmd = ['ffmpeg', '-y', '-i', input_path]
@@ -1320,20 +4527,43 @@ def list_jobs():
     except ValueError:
         limit = 100
     limit = max(1, min(200, limit))
-    return jsonify({"jobs": _db_list_jobs_for_session(g.session_id, limit=limit)})
+
+    # ?after=<created_at>,<id> : curseur renvoye par la page precedente
+    after = None
+    after_raw = (request.args.get("after") or "").strip()
+    if after_raw:
+        created_raw, _, after_id = after_raw.partition(",")
+        try:
+            after = (int(created_raw), after_id)
+        except ValueError:
+            return jsonify({"error": "curseur invalide"}), 400
+
+    # ?fields=id,status,download_url : projection, champs inconnus ignores
+    fields = None
+    fields_raw = (request.args.get("fields") or "").strip()
+    if fields_raw:
+        fields = {f.strip() for f in fields_raw.split(",") if f.strip()}
+
+    jobs, next_after = _db_list_jobs_for_session(g.session_id, limit=limit, after=after, fields=fields)
+    return jsonify(
+        {
+            "jobs": jobs,
+            "counts": _db_session_stats(g.session_id),
+            "next_after": f"{next_after[0]},{next_after[1]}" if next_after else None,
+        }
+    )
 
 
 app.add_url_rule("/jobs", view_func=list_jobs, methods=["GET"])
 
 
-@app.route("/jobs", methods=["POST"])
-def create_job():
-    file = request.files.get("file")
-    action = _validate_action(request.form.get("action"))
-    target_format = (request.form.get("format") or "").strip().lower()
+def _admit_upload(form, file, *, live: bool = False):
+    """Valide le formulaire, enregistre le job et le soumet au pool de son type."""
+    action = _validate_action(form.get("action"))
+    target_format = (form.get("format") or "").strip().lower()
 
-    comp_mode = (request.form.get("comp_mode") or "").strip()
-    comp_value = (request.form.get("comp_value") or "").strip()
+    comp_mode = (form.get("comp_mode") or "").strip()
+    comp_value = (form.get("comp_value") or "").strip()
 
     if not file or not file.filename:
         return jsonify({"error": "aucun fichier fourni"}), 400
@@ -1347,73 +4577,84 @@ def create_job():
             "missing target format: action=%s filename=%s form_keys=%s",
             action,
             getattr(file, "filename", None),
-            list(request.form.keys()),
+            list(form.keys()),
         )
         return jsonify({"error": "format de destination manquant"}), 400
 
     params = {}
-    if request.form.get("fps"):
-        params["fps"] = request.form.get("fps")
-    if request.form.get("video_preset"):
-        params["video_preset"] = request.form.get("video_preset")
-    if request.form.get("video_codec"):
-        params["video_codec"] = request.form.get("video_codec")
-    if request.form.get("video_profile"):
-        params["video_profile"] = request.form.get("video_profile")
-    if request.form.get("video_tune"):
-        params["video_tune"] = request.form.get("video_tune")
-    if request.form.get("video_quality_mode"):
-        params["video_quality_mode"] = request.form.get("video_quality_mode")
-    if request.form.get("video_crf"):
-        params["video_crf"] = request.form.get("video_crf")
-    if request.form.get("video_bitrate_k"):
-        params["video_bitrate_k"] = request.form.get("video_bitrate_k")
-    if request.form.get("video_pixel_format"):
-        params["video_pixel_format"] = request.form.get("video_pixel_format")
-    if request.form.get("two_pass"):
-        params["two_pass"] = request.form.get("two_pass")
-    if request.form.get("faststart"):
-        params["faststart"] = request.form.get("faststart")
-    if request.form.get("deinterlace"):
-        params["deinterlace"] = request.form.get("deinterlace")
-    if request.form.get("audio_codec"):
-        params["audio_codec"] = request.form.get("audio_codec")
-    if request.form.get("audio_bitrate"):
-        params["audio_bitrate"] = request.form.get("audio_bitrate")
-    if request.form.get("audio_channels"):
-        params["audio_channels"] = request.form.get("audio_channels")
-    if request.form.get("audio_sample_rate"):
-        params["audio_sample_rate"] = request.form.get("audio_sample_rate")
+    if form.get("fps"):
+        params["fps"] = form.get("fps")
+    if form.get("video_preset"):
+        params["video_preset"] = form.get("video_preset")
+    if form.get("video_codec"):
+        params["video_codec"] = form.get("video_codec")
+    if form.get("video_profile"):
+        params["video_profile"] = form.get("video_profile")
+    if form.get("video_tune"):
+        params["video_tune"] = form.get("video_tune")
+    if form.get("video_quality_mode"):
+        params["video_quality_mode"] = form.get("video_quality_mode")
+    if form.get("video_crf"):
+        params["video_crf"] = form.get("video_crf")
+    if form.get("video_bitrate_k"):
+        params["video_bitrate_k"] = form.get("video_bitrate_k")
+    if form.get("video_pixel_format"):
+        params["video_pixel_format"] = form.get("video_pixel_format")
+    if form.get("two_pass"):
+        params["two_pass"] = form.get("two_pass")
+    if form.get("faststart"):
+        params["faststart"] = form.get("faststart")
+    if form.get("deinterlace"):
+        params["deinterlace"] = form.get("deinterlace")
+    if form.get("audio_codec"):
+        params["audio_codec"] = form.get("audio_codec")
+    if form.get("audio_bitrate"):
+        params["audio_bitrate"] = form.get("audio_bitrate")
+    if form.get("audio_channels"):
+        params["audio_channels"] = form.get("audio_channels")
+    if form.get("audio_sample_rate"):
+        params["audio_sample_rate"] = form.get("audio_sample_rate")
 
     # GIF Params
-    if request.form.get("gif_speed"):
-        params["gif_speed"] = request.form.get("gif_speed")
-    if request.form.get("gif_fps"):
-        params["gif_fps"] = request.form.get("gif_fps")
-    if request.form.get("gif_resolution"):
-        params["gif_resolution"] = request.form.get("gif_resolution")
-    if request.form.get("image_quality"):
-        params["image_quality"] = request.form.get("image_quality")
-    if request.form.get("image_max_size"):
-        params["image_max_size"] = request.form.get("image_max_size")
-    if request.form.get("ico_size"):
-        params["ico_size"] = request.form.get("ico_size")
-    if request.form.get("image_resize_mode"):
-        params["image_resize_mode"] = request.form.get("image_resize_mode")
-    if request.form.get("image_resize_percent"):
-        params["image_resize_percent"] = request.form.get("image_resize_percent")
-    if request.form.get("trim_start"):
-        params["trim_start"] = request.form.get("trim_start")
-    if request.form.get("trim_end"):
-        params["trim_end"] = request.form.get("trim_end")
-    if request.form.get("overlay_text"):
-        params["overlay_text"] = request.form.get("overlay_text")
-    if request.form.get("overlay_text_x"):
-        params["overlay_text_x"] = request.form.get("overlay_text_x")
-    if request.form.get("overlay_text_y"):
-        params["overlay_text_y"] = request.form.get("overlay_text_y")
-
-    rel_path_raw = request.form.get("relative_path")
+    if form.get("gif_speed"):
+        params["gif_speed"] = form.get("gif_speed")
+    if form.get("gif_fps"):
+        params["gif_fps"] = form.get("gif_fps")
+    if form.get("gif_resolution"):
+        params["gif_resolution"] = form.get("gif_resolution")
+    if form.get("image_quality"):
+        params["image_quality"] = form.get("image_quality")
+    if form.get("image_max_size"):
+        params["image_max_size"] = form.get("image_max_size")
+    if form.get("image_effort"):
+        effort = form.get("image_effort").strip().lower()
+        if effort not in _IMAGE_EFFORT_SETTINGS:
+            return jsonify({"error": "image_effort invalide (fast, balanced, max)"}), 400
+        params["image_effort"] = effort
+    for flag in ("image_strip_metadata", "image_auto_orient", "image_progressive"):
+        raw = (form.get(flag) or "").strip().lower()
+        if raw:
+            if raw not in {"1", "true", "yes", "on", "0", "false", "no", "off"}:
+                return jsonify({"error": f"{flag} invalide (booleen)"}), 400
+            params[flag] = raw
+    if form.get("ico_size"):
+        params["ico_size"] = form.get("ico_size")
+    if form.get("image_resize_mode"):
+        params["image_resize_mode"] = form.get("image_resize_mode")
+    if form.get("image_resize_percent"):
+        params["image_resize_percent"] = form.get("image_resize_percent")
+    if form.get("trim_start"):
+        params["trim_start"] = form.get("trim_start")
+    if form.get("trim_end"):
+        params["trim_end"] = form.get("trim_end")
+    if form.get("overlay_text"):
+        params["overlay_text"] = form.get("overlay_text")
+    if form.get("overlay_text_x"):
+        params["overlay_text_x"] = form.get("overlay_text_x")
+    if form.get("overlay_text_y"):
+        params["overlay_text_y"] = form.get("overlay_text_y")
+
+    rel_path_raw = form.get("relative_path")
     rel_path = _sanitize_relative_path(rel_path_raw)
     if rel_path:
         params["relative_path"] = rel_path
@@ -1421,7 +4662,6 @@ def create_job():
     if _db_count_active_for_session(g.session_id) >= MAX_ENQUEUED_JOBS:
         return jsonify({"error": "trop de jobs en attente"}), 429
 
-    job_id = _new_id()
     original_filename = secure_filename(file.filename)
     lower_name = original_filename.lower()
 
@@ -1430,9 +4670,59 @@ def create_job():
 
     is_cover = lower_name in {"cover.jpg", "cover.jpeg", "cover.png"}
     media_type = _media_type_from_filename(original_filename)
-    input_filename = f"{job_id}__{original_filename}"
-    input_path = os.path.join(UPLOAD_DIR, input_filename)
-    file.save(input_path)
+
+    if action == "compress" and comp_mode == "quality":
+        if media_type != "image":
+            return jsonify({"error": "comp_mode quality reserve aux images"}), 400
+        if np is None:
+            return jsonify({"error": "compression a qualite visuelle indisponible (numpy absent)"}), 400
+        try:
+            _parse_ssim_target(comp_value)
+        except ValueError:
+            return jsonify({"error": "SSIM cible invalide (0.5 a 0.999)"}), 400
+
+    if action == "convert" and target_format == "auto" and media_type != "image":
+        return jsonify({"error": "format auto reserve aux images"}), 400
+
+    if action == "srcset":
+        if media_type != "image":
+            return jsonify({"error": "srcset reserve aux images"}), 400
+        try:
+            params["srcset_widths"], params["srcset_formats"] = _parse_srcset_spec(form)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        is_cover = False
+
+    stream = file.stream
+    if isinstance(stream, _IngestFile):
+        # Deja ecrit dans uploads/ pendant le parsing multipart
+        try:
+            sniffed = _verify_upload_content(original_filename, media_type, stream.head)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 415
+        stream.claimed = True
+        job_id = stream.job_id
+        input_path = stream.path
+        if sniffed:
+            params["sniffed_format"] = sniffed
+        if live:
+            # le hash est complete en fin d upload
+            params["live_transcode"] = True
+            stream.params = params
+        else:
+            stream.close()
+            params["sha256"] = stream.sha256()
+    else:
+        job_id = _new_id()
+        input_filename = f"{job_id}__{original_filename}"
+        input_path = os.path.join(UPLOAD_DIR, input_filename)
+        file.save(input_path)
+
+    if media_type == "image" and not is_cover:
+        # en-tete seulement: dimensions et memoire estimee pour l admission
+        probe = _estimate_image_memory(input_path, params, action=action, target_format=target_format)
+        if probe:
+            params["image_probe"] = probe
 
     created_at = _now_ts()
     status = 'queued'
@@ -1483,13 +4773,123 @@ def create_job():
                 )
 
     if is_cover:
+        if SESSION_ARCHIVE_ENABLED:
+            try:
+                _session_archive_append(
+                    g.session_id,
+                    {
+                        "id": job_id,
+                        "output_path": output_path,
+                        "output_filename": output_filename,
+                        "params": json.dumps(params),
+                        "action": action,
+                        "target_format": target_format,
+                    },
+                )
+            except Exception:
+                logging.exception("session archive append failed %s", job_id)
         return jsonify({"job_id": job_id, "status": "done"}), 200
 
-    ex = _executor_for_media_type(media_type)
-    ex.submit(_run_job, job_id)
+    if live:
+        with _live_uploads_lock:
+            _live_uploads[job_id] = stream
+
+    _submit_job(job_id, media_type, params)
     return jsonify({"job_id": job_id}), 202
 
 
+@app.route("/jobs", methods=["POST"])
+def create_job():
+    if LIVE_TRANSCODE_ENABLED and request.mimetype == "multipart/form-data":
+        resp = _ingest_multipart_live()
+        if resp is not None:
+            return resp
+    return _admit_upload(request.form, request.files.get("file"))
+
+
+def _pdf_page_jobs(form) -> tuple[list[dict] | None, tuple | None]:
+    """Jobs image retenus comme pages, dans l ordre: job_ids tel quel, ou dossier relative_path (tri naturel)."""
+    job_ids = [j.strip() for j in (form.get("job_ids") or "").split(",") if j.strip()]
+    folder = _sanitize_relative_path(form.get("relative_path"))
+    if bool(job_ids) == bool(folder):
+        return None, (jsonify({"error": "job_ids ou relative_path requis (un seul des deux)"}), 400)
+
+    fields = {"id", "media_type", "status", "output_path", "output_filename", "params"}
+    if job_ids:
+        jobs = []
+        for job_id in job_ids:
+            row = _db_get_job_for_session(job_id, g.session_id)
+            if not row:
+                return None, (jsonify({"error": f"job introuvable: {job_id}"}), 404)
+            jobs.append({f: row[f] for f in fields})
+    else:
+        prefix = folder.rstrip("/") + "/"
+        jobs = []
+        for job in _db_iter_jobs_for_session(g.session_id, fields=fields):
+            params = json.loads(job["params"] or "{}")
+            rel_path = _sanitize_relative_path(params.get("relative_path"))
+            if job["media_type"] == "image" and rel_path and rel_path.startswith(prefix):
+                jobs.append({**job, "relative_path": rel_path})
+        jobs.sort(key=lambda job: _natural_key(job["relative_path"]))
+        if not jobs:
+            return None, (jsonify({"error": "aucune image dans ce dossier"}), 404)
+
+    if len(jobs) > PDF_ASSEMBLE_MAX_PAGES:
+        return None, (jsonify({"error": f"trop de pages (max {PDF_ASSEMBLE_MAX_PAGES})"}), 400)
+    for job in jobs:
+        if job["status"] in {"queued", "processing"}:
+            return None, (jsonify({"error": "pages en cours de traitement"}), 409)
+        out_path = job["output_path"] or ""
+        if job["status"] != "done" or _media_type_from_filename(out_path) != "image" or not os.path.exists(out_path):
+            name = job["output_filename"] or job["id"]
+            return None, (jsonify({"error": f"page inutilisable (image terminee requise): {name}"}), 400)
+    return jobs, None
+
+
+@app.route("/jobs/assemble-pdf", methods=["POST"])
+def assemble_pdf_job():
+    """Un job PDF a partir d images deja traitees de la session, une page par image."""
+    form = request.form
+    jobs, error = _pdf_page_jobs(form)
+    if error:
+        return error
+
+    params: dict = {"pdf_pages": [{"job_id": job["id"], "path": job["output_path"]} for job in jobs]}
+    for key in ("image_max_size", "image_resize_mode", "image_resize_percent", "image_auto_orient"):
+        if form.get(key):
+            params[key] = form.get(key)
+    if form.get("image_effort"):
+        effort = form.get("image_effort").strip().lower()
+        if effort not in _IMAGE_EFFORT_SETTINGS:
+            return jsonify({"error": "image_effort invalide (fast, balanced, max)"}), 400
+        params["image_effort"] = effort
+
+    if _db_count_active_for_session(g.session_id) >= MAX_ENQUEUED_JOBS:
+        return jsonify({"error": "trop de jobs en attente"}), 429
+
+    folder = _sanitize_relative_path(form.get("relative_path"))
+    name = secure_filename(form.get("filename") or "") or secure_filename(os.path.basename(folder or "")) or "document"
+    original_filename = f"{os.path.splitext(name)[0]}.pdf"
+
+    # pas de fichier d entree propre: les pages restent celles des jobs sources
+    job_id = _new_id()
+    with _db_connect() as conn:
+        conn.execute(
+            """
+            INSERT INTO jobs (
+                id, session_id, media_type, original_filename,
+                action, target_format, comp_mode, comp_value,
+                status, error, created_at, input_path, params
+            )
+            VALUES (?, ?, 'pdf', ?, 'assemble_pdf', NULL, NULL, NULL, 'queued', '', ?, '', ?)
+            """,
+            (job_id, g.session_id, original_filename, _now_ts(), json.dumps(params)),
+        )
+
+    pdf_executor.submit(_run_job, job_id)
+    return jsonify({"job_id": job_id, "pages": len(jobs)}), 202
+
+
 @app.route("/jobs/<job_id>", methods=["GET"])
 def get_job(job_id: str):
     row = _db_get_job_for_session(job_id, g.session_id)
@@ -1509,10 +4909,50 @@ def get_job(job_id: str):
             "expires_at": row["expires_at"],
             "output_filename": row["output_filename"],
             "download_url": f"/download/{row['id']}" if row["status"] == "done" else None,
+            "srcset": json.loads(row["params"] or "{}").get("srcset_manifest"),
         }
     )
 
 
+def _offload_internal_uri(path: str) -> str | None:
+    """URI interne du proxy pour un fichier stocke, None hors des repertoires exposes."""
+    real = os.path.realpath(path)
+    for name, root in (("processed", PROCESSED_DIR), ("archives", ARCHIVE_DIR)):
+        root = os.path.realpath(root)
+        if real.startswith(root + os.sep):
+            rel = os.path.relpath(real, root).replace(os.sep, "/")
+            return f"{DOWNLOAD_OFFLOAD_PREFIX}/{name}/{urllib.parse.quote(rel)}"
+    return None
+
+
+def _send_stored_file(path: str, *, download_name: str, mimetype: str | None = None):
+    """send_file, ou en-tete de redirection interne quand le proxy sert le fichier (sendfile)."""
+    internal_uri = _offload_internal_uri(path) if DOWNLOAD_OFFLOAD in {"x-accel", "x-sendfile"} else None
+    if internal_uri is None:
+        return make_response(send_file(
+            path,
+            mimetype=mimetype,
+            as_attachment=True,
+            download_name=download_name,
+        ))
+
+    # Range / conditionnels sont geres par le proxy, le corps est vide cote python
+    resp = _wz_send_file(
+        path,
+        request.environ,
+        mimetype=mimetype,
+        as_attachment=True,
+        download_name=download_name,
+        conditional=False,
+        use_x_sendfile=True,
+    )
+    resp.headers.pop("Content-Length", None)
+    if DOWNLOAD_OFFLOAD == "x-accel":
+        del resp.headers["X-Sendfile"]
+        resp.headers["X-Accel-Redirect"] = internal_uri
+    return resp
+
+
 @app.route("/download/<job_id>", methods=["GET"])
 def download_job(job_id: str):
     row = _db_get_job_for_session(job_id, g.session_id)
@@ -1532,7 +4972,7 @@ def download_job(job_id: str):
         return jsonify({"error": "fichier manquant"}), 404
 
     download_name = row["output_filename"] or os.path.basename(out_path)
-    resp = make_response(send_file(out_path, as_attachment=True, download_name=download_name))
+    resp = _send_stored_file(out_path, download_name=download_name)
     resp.headers["Cache-Control"] = "no-store"
     return resp
 
@@ -1540,44 +4980,32 @@ def download_job(job_id: str):
 @app.route("/download-all", methods=["GET"])
 def download_all():
     """Download all completed jobs as a ZIP file."""
-    rows = _db_list_jobs_for_session(g.session_id, limit=500)
-    
     # Filter only done jobs with valid output paths
     done_jobs = []
-    for r in rows:
+    for r in _db_iter_jobs_for_session(g.session_id):
         if r["status"] == "done" and r["output_path"] and os.path.exists(r["output_path"]):
             done_jobs.append(r)
     
     if not done_jobs:
         return jsonify({"error": "aucun fichier à télécharger"}), 404
     
+    if SESSION_ARCHIVE_ENABLED:
+        archive_path = _session_archive_publish(g.session_id, done_jobs)
+        # envoi direct du fichier: Range / If-Range geres par send_file ou le proxy
+        resp = _send_stored_file(
+            archive_path,
+            mimetype='application/zip',
+            download_name='converted_files.zip',
+        )
+        resp.headers["Cache-Control"] = "no-cache"
+        return resp
+
     # Create ZIP in memory
     zip_buffer = io.BytesIO()
     with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
         for job in done_jobs:
-            out_path = job["output_path"]
-            filename = job["output_filename"] or os.path.basename(out_path)
-
-            try:
-                params = json.loads(job.get("params") or "{}")
-            except json.JSONDecodeError:
-                params = {}
-            rel_path = _sanitize_relative_path(params.get("relative_path")) if isinstance(params, dict) else None
-
-            is_cover = isinstance(params, dict) and params.get("is_cover")
-
-            # Build archive name preserving folder structure when provided
-            if rel_path:
-                rel_base, rel_ext = os.path.splitext(rel_path)
-                if job.get("action") == "convert" and job.get("target_format") and not is_cover:
-                    arcname = f"{rel_base}.{job['target_format'].lstrip('.')}"
-                else:
-                    arcname = rel_path
-            else:
-                arcname = filename
-
             # Fallback to prefixing on duplicates handled by ZipFile implicitly via unique arcname
-            zf.write(out_path, arcname)
+            zf.write(job["output_path"], _archive_name_for_job(job))
     
     zip_buffer.seek(0)
     
@@ -1594,7 +5022,7 @@ def download_all():
 @app.route("/clear-all", methods=["DELETE"])
 def clear_all_jobs():
     """Delete all jobs and their files for the current session."""
-    rows = _db_list_jobs_for_session(g.session_id, limit=500)
+    rows = list(_db_iter_jobs_for_session(g.session_id, fields={"id", "input_path", "output_path"}))
     
     deleted_count = 0
     for r in rows:
@@ -1619,6 +5047,9 @@ def clear_all_jobs():
         # Delete from database
         _db_delete_job(job_id)
         deleted_count += 1
+
+    if SESSION_ARCHIVE_ENABLED:
+        _session_archive_remove(g.session_id)
     
     return jsonify({"deleted": deleted_count})
 
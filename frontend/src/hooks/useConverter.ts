@@ -16,6 +16,8 @@ import { useCallback, useEffect, useRef, useState } from "react";
 
 const MAX_CONCURRENT_UPLOADS = 8;
 const POLL_INTERVAL_MS = 1500;
+// champs lus par le polling: evite de rapatrier params / chemins a chaque tick
+const POLL_FIELDS = "id,status,error,download_url,output_filename,media_type,original_filename,action,target_format";
 
 type DetectedMediaType = "video" | "audio" | "image";
 
@@ -214,7 +216,6 @@ export function useConverter() {
           : compressSettings;
 
       const formData = new FormData();
-      formData.append("file", item.file);
       if (item.relativePath) {
         formData.append("relative_path", item.relativePath);
       }
@@ -360,6 +361,9 @@ export function useConverter() {
         }
       }
 
+      // File last: the server can start transcoding while the upload is still arriving
+      formData.append("file", item.file);
+
       setQueue((prev) =>
         prev.map((i) =>
           i.id === item.id ? { ...i, status: "uploading" as const } : i,
@@ -401,12 +405,18 @@ export function useConverter() {
   // Poll for job updates
   const pollJobs = useCallback(async () => {
     try {
-      const response = await fetch("/jobs?limit=200");
-      if (!response.ok) return;
-
-      const data = await response.json();
       const jobsMap = new Map<string, JobResponse>();
-      (data.jobs || []).forEach((j: JobResponse) => jobsMap.set(j.id, j));
+      let after: string | null = null;
+      do {
+        const params = new URLSearchParams({ limit: "200", fields: POLL_FIELDS });
+        if (after) params.set("after", after);
+        const response = await fetch(`/jobs?${params}`);
+        if (!response.ok) return;
+
+        const data = await response.json();
+        (data.jobs || []).forEach((j: JobResponse) => jobsMap.set(j.id, j));
+        after = data.next_after || null;
+      } while (after);
 
       setQueue((prev) =>
         {
@@ -123,6 +123,7 @@ export const IMAGE_FORMATS = [
   "tiff",
   "ico",
   "pdf",
+  "auto",
 ];
 
 export const VIDEO_EXTENSIONS = [
@@ -0,0 +1,88 @@
+"""Micro-benchmark du cout sqlite par requete: connexion par appel vs connexion poolee par thread.
+
+    python3 scripts/bench_db.py --jobs 2000 --ops 5000
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+
+def _repo_root() -> str:
+    return os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def _legacy_connect(path: str) -> sqlite3.Connection:
+    # ancien _db_connect: nouvelle connexion a chaque helper
+    conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _seed(app_module, session_id: str, count: int) -> list[str]:
+    now = app_module._now_ts()
+    ids = [app_module._new_id() for _ in range(count)]
+    with app_module._db_connect() as conn:
+        conn.executemany(
+            """
+            INSERT INTO jobs (id, session_id, media_type, original_filename, action, status, error, created_at, input_path, params)
+            VALUES (?, ?, 'image', 'x.png', 'convert', ?, '', ?, '/dev/null', '{}')
+            """,
+            [(job_id, session_id, "done" if i % 3 else "queued", now + i) for i, job_id in enumerate(ids)],
+        )
+    return ids
+
+
+def _request_cycle(connect, job_id: str, session_id: str) -> None:
+    # ce que fait une requete de polling + une transition de job
+    with connect() as conn:
+        conn.execute("SELECT * FROM jobs WHERE id = ? AND session_id = ?", (job_id, session_id)).fetchone()
+    with connect() as conn:
+        conn.execute(
+            "SELECT COUNT(*) AS n FROM jobs WHERE session_id = ? AND status IN ('queued', 'processing')",
+            (session_id,),
+        ).fetchone()
+    with connect() as conn:
+        conn.execute("UPDATE jobs SET started_at = ? WHERE id = ?", (int(time.time()), job_id))
+
+
+def _bench(label: str, connect, ids: list[str], session_id: str, ops: int) -> float:
+    start = time.perf_counter()
+    for i in range(ops):
+        _request_cycle(connect, ids[i % len(ids)], session_id)
+    elapsed = time.perf_counter() - start
+    per_op_us = elapsed / ops * 1e6
+    print(f"{label:<24} {ops} cycles  {elapsed:8.3f}s  {per_op_us:8.1f} us/cycle")
+    return per_op_us
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description="cout db par requete avant/apres pool de connexions")
+    p.add_argument("--jobs", type=int, default=2000)
+    p.add_argument("--ops", type=int, default=5000)
+    args = p.parse_args()
+
+    root = _repo_root()
+    if root not in sys.path:
+        sys.path.insert(0, root)
+
+    import app as app_module
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app_module.DB_PATH = os.path.join(tmp, "bench.sqlite3")
+        app_module._db_init()
+        session_id = app_module._new_id()
+        ids = _seed(app_module, session_id, max(1, args.jobs))
+
+        legacy = _bench("connexion par appel", lambda: _legacy_connect(app_module.DB_PATH), ids, session_id, args.ops)
+        pooled = _bench("connexion poolee", app_module._db_connect, ids, session_id, args.ops)
+        print(f"gain: x{legacy / pooled:.1f}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,119 @@
+"""Paliers image_effort: temps d encodage et taille par format sur un corpus de reference.
+
+    python3 scripts/bench_image_effort.py --size 2000x1500 --repeat 3
+    python3 scripts/bench_image_effort.py --corpus ~/photos --formats jpg,webp
+
+Sans --corpus: trois images synthetiques (photo, capture d ecran, graphique avec alpha).
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+
+
+def _repo_root() -> str:
+    return os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def _synthetic_corpus(width: int, height: int) -> dict:
+    from PIL import Image, ImageDraw
+
+    # photo: bruit lisse + degrade
+    base = Image.effect_noise((max(1, width // 8), max(1, height // 8)), 60).resize((width, height), Image.BICUBIC)
+    gradient = Image.linear_gradient("L").resize((width, height))
+    photo = Image.merge("RGB", [base, gradient, base.transpose(Image.Transpose.FLIP_LEFT_RIGHT)])
+
+    # capture d ecran: aplats, bordures, texte
+    screen = Image.new("RGB", (width, height), (245, 245, 245))
+    draw = ImageDraw.Draw(screen)
+    for y in range(0, height, 40):
+        draw.rectangle((20, y + 4, width - 20, y + 34), outline=(200, 200, 210), fill=(255, 255, 255))
+        draw.text((30, y + 12), f"ligne {y // 40} - convertisseur image effort", fill=(30, 30, 30))
+
+    # graphique: formes sur fond transparent
+    graphic = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(graphic)
+    for i in range(12):
+        x = (i * width) // 12
+        draw.ellipse((x, height // 4, x + width // 8, height // 4 + width // 8), fill=(40 * i % 256, 120, 200, 180))
+    return {"photo": photo, "screen": screen, "graphic": graphic}
+
+
+def _load_corpus(path: str) -> dict:
+    from PIL import Image
+
+    corpus = {}
+    for name in sorted(os.listdir(path)):
+        try:
+            with Image.open(os.path.join(path, name)) as img:
+                img.load()
+                corpus[name] = img.copy()
+        except Exception:
+            continue
+    return corpus
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description="temps/taille par palier d effort d encodage")
+    p.add_argument("--size", default="2000x1500")
+    p.add_argument("--corpus", default="", help="dossier d images (sinon corpus synthetique)")
+    p.add_argument("--formats", default="jpg,webp,png,gif,avif")
+    p.add_argument("--quality", type=int, default=80)
+    p.add_argument("--repeat", type=int, default=1)
+    args = p.parse_args()
+
+    root = _repo_root()
+    if root not in sys.path:
+        sys.path.insert(0, root)
+
+    import app as app_module
+    from PIL import Image
+
+    if args.corpus:
+        corpus = _load_corpus(args.corpus)
+    else:
+        width, height = (int(v) for v in args.size.lower().split("x"))
+        corpus = _synthetic_corpus(width, height)
+
+    Image.init()
+    formats = [f.strip() for f in args.formats.split(",") if f.strip()]
+    if "avif" in formats and "AVIF" not in Image.SAVE:
+        formats.remove("avif")
+    tiers = list(app_module._IMAGE_EFFORT_SETTINGS)
+
+    print(f"{'format':<6} {'palier':<9} {'temps':>9} {'taille':>12} {'vs max':>8}")
+    for fmt in formats:
+        out_ext = f".{fmt}"
+        totals = {}
+        for tier in tiers:
+            elapsed = 0.0
+            size = 0
+            for img in corpus.values():
+                has_alpha = img.mode in ("RGBA", "LA", "PA")
+                for _ in range(max(1, args.repeat)):
+                    start = time.perf_counter()
+                    if fmt == "avif":
+                        # hors _encode_image_bytes (repli generique): memes reglages que _process_image
+                        buffer = io.BytesIO()
+                        img.save(buffer, format="AVIF", quality=args.quality, **app_module._effort_kwargs("AVIF", tier))
+                        encoded = buffer.getvalue()
+                    else:
+                        encoded = app_module._encode_image_bytes(
+                            img=img, out_ext=out_ext, quality=args.quality, lossless=False, has_alpha=has_alpha, effort=tier
+                        )
+                    elapsed += time.perf_counter() - start
+                size += len(encoded)
+            totals[tier] = (elapsed / max(1, args.repeat), size)
+
+        ref_size = totals["max"][1]
+        for tier in tiers:
+            elapsed, size = totals[tier]
+            print(f"{fmt:<6} {tier:<9} {elapsed:8.3f}s {size:>12} {size / ref_size - 1:+8.1%}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
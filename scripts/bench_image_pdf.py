@@ -0,0 +1,77 @@
+"""Image -> PDF: flux copies tels quels (DCTDecode / IDAT PNG) vs save PDF de Pillow (decodage + re-encodage).
+
+    python3 scripts/bench_image_pdf.py --size 4000x3000 --repeat 3
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+
+def _repo_root() -> str:
+    return os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def _make_sources(tmp: str, width: int, height: int) -> dict:
+    from PIL import Image
+
+    base = Image.effect_noise((max(1, width // 8), max(1, height // 8)), 60).resize((width, height), Image.BICUBIC)
+    gradient = Image.linear_gradient("L").resize((width, height))
+    photo = Image.merge("RGB", [base, gradient, base.transpose(Image.Transpose.FLIP_LEFT_RIGHT)])
+    sources = {"jpeg": os.path.join(tmp, "photo.jpg"), "png": os.path.join(tmp, "photo.png")}
+    photo.save(sources["jpeg"], quality=88, dpi=(300, 300))
+    photo.save(sources["png"])
+    return sources
+
+
+def _legacy(input_path: str, output_path: str) -> None:
+    # ancien convert -> pdf: decodage complet puis save PDF Pillow (JPEG re-encode)
+    from PIL import Image
+
+    with Image.open(input_path) as img:
+        img.convert("RGB").save(output_path, "PDF", resolution=100.0)
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description="duree et taille image -> PDF")
+    p.add_argument("--size", default="4000x3000")
+    p.add_argument("--repeat", type=int, default=3)
+    args = p.parse_args()
+
+    root = _repo_root()
+    if root not in sys.path:
+        sys.path.insert(0, root)
+
+    import app as app_module
+
+    width, height = (int(v) for v in args.size.lower().split("x"))
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, "out.pdf")
+        for label, source in _make_sources(tmp, width, height).items():
+            source_bytes = os.path.getsize(source)
+
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                _legacy(source, output)
+            legacy_s = (time.perf_counter() - start) / args.repeat
+            legacy_bytes = os.path.getsize(output)
+
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                app_module._process_image(
+                    input_path=source, output_path=output, action="convert", target_format="pdf",
+                    comp_mode=None, comp_value=None, params={},
+                )
+            embed_s = (time.perf_counter() - start) / args.repeat
+            print(
+                f"{label:<5} pillow {legacy_s * 1000:8.1f} ms {legacy_bytes / source_bytes:6.3f}x"
+                f" | copie {embed_s * 1000:8.1f} ms {os.path.getsize(output) / source_bytes:6.3f}x"
+                f"  x{legacy_s / embed_s:.1f}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
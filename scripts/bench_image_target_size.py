@@ -0,0 +1,87 @@
+"""Compression image a taille cible: recherche dichotomique historique vs recherche guidee par modele.
+
+    python3 scripts/bench_image_target_size.py --size 4000x3000 --format webp --ratios 0.3,0.5,0.7
+
+TRIAL_ENCODE_WORKERS=1 mesure la recherche sans essais paralleles.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+
+def _repo_root() -> str:
+    return os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def _make_photo(width: int, height: int):
+    # bruit lisse + degrade: courbe taille/qualite proche d une photo
+    from PIL import Image
+
+    base = Image.effect_noise((max(1, width // 8), max(1, height // 8)), 60).resize((width, height), Image.BICUBIC)
+    gradient = Image.linear_gradient("L").resize((width, height))
+    return Image.merge("RGB", [base, gradient, base.transpose(Image.Transpose.FLIP_LEFT_RIGHT)])
+
+
+def _legacy_search(app_module, img, out_ext: str, target_bytes: int) -> tuple[bytes, int]:
+    # ancien _save_image_with_target_size: dichotomie 10..95 en pleine resolution
+    lo, hi = 10, 95
+    best = None
+    encodes = 0
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        encoded = app_module._encode_image_bytes(img=img, out_ext=out_ext, quality=mid, lossless=False, has_alpha=False)
+        encodes += 1
+        if len(encoded) <= target_bytes:
+            best = encoded
+            lo = mid + 1
+        else:
+            hi = mid - 1
+    if best is None:
+        best = app_module._encode_image_bytes(img=img, out_ext=out_ext, quality=10, lossless=False, has_alpha=False)
+        encodes += 1
+    return best, encodes
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description="nombre d encodages et duree de la recherche a taille cible")
+    p.add_argument("--size", default="4000x3000")
+    p.add_argument("--format", default="jpg", choices=["jpg", "webp", "gif"])
+    p.add_argument("--ratios", default="0.3,0.5,0.7", help="cibles en fraction de la taille a q90")
+    args = p.parse_args()
+
+    root = _repo_root()
+    if root not in sys.path:
+        sys.path.insert(0, root)
+
+    import app as app_module
+
+    width, height = (int(v) for v in args.size.lower().split("x"))
+    out_ext = f".{args.format}"
+    img = _make_photo(width, height)
+    reference = len(app_module._encode_image_bytes(img=img, out_ext=out_ext, quality=90, lossless=False, has_alpha=False))
+
+    print(f"{width}x{height} {args.format} reference q90={reference} bytes")
+    for ratio in (float(r) for r in args.ratios.split(",")):
+        target = int(reference * ratio)
+
+        start = time.perf_counter()
+        legacy, legacy_encodes = _legacy_search(app_module, img, out_ext, target)
+        legacy_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        best, stats = app_module._search_quality_for_size(img=img, out_ext=out_ext, target_bytes=target, has_alpha=False)
+        model_s = time.perf_counter() - start
+
+        print(
+            f"cible {ratio:.2f}: dichotomie {legacy_encodes} enc {legacy_s:7.2f}s ({len(legacy) / target:.3f})"
+            f" | modele {stats['rounds']} tours x{stats['width']} ({stats['encodes']}+{stats['proxy_encodes']} proxy)"
+            f" {model_s:7.2f}s ({len(best) / target:.3f})"
+        )
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,88 @@
+"""JPEG -> JPEG: chemin sans perte (segments / jpegtran / tables d origine) vs decodage + re-encodage.
+
+    python3 scripts/bench_jpeg_lossless.py --size 4000x3000 --repeat 5
+
+Le chemin jpegtran n est mesure que si JPEGTRAN_BIN est trouve dans le PATH.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+
+def _repo_root() -> str:
+    return os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def _make_jpeg(path: str, width: int, height: int) -> None:
+    from PIL import Image
+
+    base = Image.effect_noise((max(1, width // 8), max(1, height // 8)), 60).resize((width, height), Image.BICUBIC)
+    gradient = Image.linear_gradient("L").resize((width, height))
+    photo = Image.merge("RGB", [base, gradient, base.transpose(Image.Transpose.FLIP_LEFT_RIGHT)])
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    exif[0x010F] = "bench"
+    photo.save(path, quality=88, exif=exif.tobytes(), comment=b"bench")
+
+
+def _legacy(input_path: str, output_path: str) -> None:
+    # ancien convert jpg -> jpg: decodage complet et re-encodage q95
+    from PIL import Image
+
+    with Image.open(input_path) as img:
+        img.save(output_path, quality=95)
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description="duree et taille des transformations JPEG sans perte")
+    p.add_argument("--size", default="4000x3000")
+    p.add_argument("--repeat", type=int, default=3)
+    args = p.parse_args()
+
+    root = _repo_root()
+    if root not in sys.path:
+        sys.path.insert(0, root)
+
+    import app as app_module
+    from PIL import Image
+
+    width, height = (int(v) for v in args.size.lower().split("x"))
+    cases = [
+        ("convert", {}),
+        ("strip", {"image_strip_metadata": "1"}),
+        ("auto-orient", {"image_auto_orient": "1"}),
+        ("progressive", {"image_progressive": "1"}),
+    ]
+    print(f"jpegtran: {app_module._jpegtran_path() or 'absent'}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "source.jpg")
+        output = os.path.join(tmp, "out.jpg")
+        _make_jpeg(source, width, height)
+        source_bytes = os.path.getsize(source)
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            _legacy(source, output)
+        legacy_s = (time.perf_counter() - start) / args.repeat
+        print(f"{'decode + q95':<14} {legacy_s * 1000:8.1f} ms {os.path.getsize(output) / source_bytes:7.3f}x")
+
+        for label, params in cases:
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                # ce que fait _process_image pour un JPEG -> JPEG sans redimensionnement
+                with Image.open(source) as img:
+                    method = app_module._save_jpeg_lossless(img, input_path=source, output_path=output, params=params)
+            elapsed = (time.perf_counter() - start) / args.repeat
+            print(
+                f"{label:<14} {elapsed * 1000:8.1f} ms {os.path.getsize(output) / source_bytes:7.3f}x"
+                f"  {method:<9} x{legacy_s / elapsed:.1f} vs decodage"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,87 @@
+"""Assemblage de N images en un PDF: fenetre de pages en vol vs document entier en memoire (save_all Pillow).
+
+    python3 scripts/bench_pdf_assemble.py --pages 60 --size 2480x3508 --windows 1,4,8
+
+Chaque cas tourne dans un processus separe pour mesurer la memoire de pointe (ru_maxrss).
+"""
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def _repo_root() -> str:
+    return os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def _make_pages(tmp: str, count: int, width: int, height: int) -> list[str]:
+    # scans: pages PNG RGBA (re-encodees) et JPEG (copiees) en alternance
+    from PIL import Image
+
+    base = Image.effect_noise((max(1, width // 16), max(1, height // 16)), 40).resize((width, height), Image.BICUBIC)
+    paths = []
+    for i in range(count):
+        path = os.path.join(tmp, f"page{i:04d}.{'png' if i % 2 else 'jpg'}")
+        if i % 2:
+            base.convert("RGBA").save(path, compress_level=1)
+        else:
+            base.convert("RGB").save(path, quality=85, dpi=(300, 300))
+        paths.append(path)
+    return paths
+
+
+def _run_case(case: str, tmp: str, output: str) -> None:
+    from PIL import Image
+
+    paths = sorted(os.path.join(tmp, name) for name in os.listdir(tmp) if name.startswith("page"))
+    start = time.perf_counter()
+    if case == "pillow":
+        # document entier: toutes les pages decodees avant l ecriture
+        images = [Image.open(path).convert("RGB") for path in paths]
+        images[0].save(output, "PDF", resolution=100.0, save_all=True, append_images=images[1:])
+    else:
+        os.environ["PDF_PAGE_WINDOW"] = case
+        root = _repo_root()
+        if root not in sys.path:
+            sys.path.insert(0, root)
+        import app as app_module
+
+        app_module._assemble_pdf(output_path=output, params={"pdf_pages": [{"path": path} for path in paths]})
+    elapsed = time.perf_counter() - start
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{elapsed:.3f} {peak_mb:.1f} {os.path.getsize(output)}")
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description="duree et memoire de pointe de l assemblage PDF")
+    p.add_argument("--pages", type=int, default=60)
+    p.add_argument("--size", default="2480x3508", help="A4 a 300 dpi par defaut")
+    p.add_argument("--windows", default="1,4,8")
+    p.add_argument("--case", default="", help=argparse.SUPPRESS)
+    p.add_argument("--dir", default="", help=argparse.SUPPRESS)
+    args = p.parse_args()
+
+    if args.case:
+        _run_case(args.case, args.dir, os.path.join(args.dir, "out.pdf"))
+        return 0
+
+    width, height = (int(v) for v in args.size.lower().split("x"))
+    with tempfile.TemporaryDirectory() as tmp:
+        _make_pages(tmp, args.pages, width, height)
+        print(f"{args.pages} pages {width}x{height}")
+        for case in ["pillow"] + [w.strip() for w in args.windows.split(",") if w.strip()]:
+            out = subprocess.run(
+                [sys.executable, __file__, "--case", case, "--dir", tmp],
+                check=True, capture_output=True, text=True,
+            ).stdout.split()
+            label = "save_all" if case == "pillow" else f"fenetre {case}"
+            print(f"{label:<11} {float(out[0]):8.2f}s  pointe {float(out[1]):8.1f} MB  {int(out[2]) / 1e6:8.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
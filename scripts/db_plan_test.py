@@ -0,0 +1,237 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+
+def _plan(conn: sqlite3.Connection, sql: str, args: tuple) -> str:
+    rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", args).fetchall()
+    return " | ".join(r[3] for r in rows)
+
+
+def _seed(conn: sqlite3.Connection, count: int) -> None:
+    statuses = ("queued", "processing", "done", "error")
+    conn.executemany(
+        """
+        INSERT INTO jobs (id, session_id, original_filename, action, status, created_at, input_path, expires_at)
+        VALUES (?, ?, 'x.png', 'convert', ?, ?, '/dev/null', ?)
+        """,
+        [
+            (f"{i:032x}", f"session{i % 40:012d}", statuses[(i // 40) % 4], 1000 + i, 2000 + i if i % 2 else None)
+            for i in range(count)
+        ],
+    )
+
+
+def _make_legacy_db(path: str) -> None:
+    # schema d avant les migrations versionnees (sans params, anciens index)
+    conn = sqlite3.connect(path)
+    conn.execute(
+        """
+        CREATE TABLE jobs (
+          id TEXT PRIMARY KEY, session_id TEXT NOT NULL, original_filename TEXT NOT NULL,
+          action TEXT NOT NULL, target_format TEXT, comp_mode TEXT, comp_value TEXT,
+          status TEXT NOT NULL, error TEXT, created_at INTEGER NOT NULL, started_at INTEGER,
+          done_at INTEGER, expires_at INTEGER, input_path TEXT NOT NULL, output_path TEXT,
+          output_filename TEXT
+        )
+        """
+    )
+    conn.execute("CREATE INDEX idx_jobs_session_created ON jobs(session_id, created_at)")
+    conn.execute("CREATE INDEX idx_jobs_expires ON jobs(expires_at)")
+    conn.commit()
+    conn.close()
+
+
+def main() -> None:
+    repo_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    if repo_root not in sys.path:
+        sys.path.insert(0, repo_root)
+
+    import app as app_module
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app_module.DB_PATH = os.path.join(tmp, "legacy.sqlite3")
+        _make_legacy_db(app_module.DB_PATH)
+        app_module._db_init()
+        app_module._db_init()  # idempotent
+
+        conn = app_module._db_connect()
+        assert app_module._db_schema_version(conn) == len(app_module._DB_MIGRATIONS)
+        columns = {r["name"] for r in conn.execute("PRAGMA table_info(jobs)")}
+        assert {"media_type", "params"} <= columns, columns
+        indexes = {r["name"] for r in conn.execute("PRAGMA index_list(jobs)")}
+        assert "idx_jobs_session_created" not in indexes, indexes
+
+        with conn:
+            _seed(conn, 4000)
+
+        plan = _plan(conn, app_module._SQL_SESSION_STATS, ("session000000000001",))
+        assert "SEARCH session_stats USING INDEX" in plan, plan
+
+        # compteurs tenus par triggers: insert, transitions, suppression
+        sid = "session000000000001"
+        expected = {
+            st: conn.execute("SELECT COUNT(*) FROM jobs WHERE session_id = ? AND status = ?", (sid, st)).fetchone()[0]
+            for st in ("queued", "processing", "done", "error")
+        }
+        assert app_module._db_session_stats(sid) == expected, (app_module._db_session_stats(sid), expected)
+        job_id = conn.execute(
+            "SELECT id FROM jobs WHERE session_id = ? AND status = 'queued' LIMIT 1", (sid,)
+        ).fetchone()[0]
+        app_module._db_update_job(job_id, status="processing")
+        app_module._db_update_job(job_id, status="done")
+        expected["queued"] -= 1
+        expected["done"] += 1
+        assert app_module._db_session_stats(sid) == expected
+        assert app_module._db_count_active_for_session(sid) == expected["queued"] + expected["processing"]
+        app_module._db_delete_jobs([job_id])
+        expected["done"] -= 1
+        assert app_module._db_session_stats(sid) == expected
+
+        full = sorted(f for f in app_module._JOB_LIST_FIELDS if f != "download_url")
+        plan = _plan(conn, app_module._sql_list_for_session(full, with_cursor=False), ("session000000000001", 1500, 100))
+        assert "idx_jobs_session_page" in plan, plan
+        assert "TEMP B-TREE" not in plan, plan
+        sql = app_module._sql_list_for_session(["created_at", "id", "status"], with_cursor=True)
+        plan = _plan(conn, sql, ("session000000000001", 1500, 3000, 3000, "f" * 32, 100))
+        assert "idx_jobs_session_page" in plan and "TEMP B-TREE" not in plan, plan
+
+        # pagination par curseur: toutes les lignes, sans doublon
+        sid = "session000000000002"
+        seen: list[str] = []
+        after = None
+        while True:
+            page, after = app_module._db_list_jobs_for_session(sid, limit=7, after=after, fields={"id"})
+            assert all(list(j) == ["id"] for j in page), page
+            seen.extend(j["id"] for j in page)
+            if after is None:
+                break
+        expected_ids = [
+            r[0]
+            for r in conn.execute(
+                "SELECT id FROM jobs WHERE session_id = ? AND (expires_at IS NULL OR expires_at > ?) ORDER BY created_at DESC, id DESC",
+                (sid, app_module._now_ts()),
+            )
+        ]
+        assert seen == expected_ids, (len(seen), len(expected_ids))
+
+        plan = _plan(conn, app_module._SQL_JOB_HISTORY_WINDOW, (1500,))
+        assert "idx_job_history_finished" in plan, plan
+
+        plan = _plan(conn, app_module._SQL_COLLECT_EXPIRED, (2500, 1200, 500))
+        assert "MULTI-INDEX OR" in plan, plan
+        assert "idx_jobs_expires" in plan and "idx_jobs_created" in plan, plan
+        assert "SCAN jobs" not in plan, plan
+
+        # purge: lots de CLEANUP_BATCH_SIZE, fichiers des jobs expires seulement, budget de temps
+        app_module.DB_PATH = os.path.join(tmp, "cleanup.sqlite3")
+        app_module._db_init()
+        conn = app_module._db_connect()
+        app_module.UPLOAD_DIR = os.path.join(tmp, "uploads")
+        app_module.PROCESSED_DIR = os.path.join(tmp, "processed")
+        os.makedirs(app_module.UPLOAD_DIR)
+        os.makedirs(app_module.PROCESSED_DIR)
+        now = app_module._now_ts()
+
+        def add_jobs(count: int, expires_at: int, *, with_output: bool = True) -> list[tuple[str, str, str | None]]:
+            jobs = []
+            for _ in range(count):
+                job_id = app_module._new_id()
+                input_path = os.path.join(app_module.UPLOAD_DIR, f"{job_id}__x.png")
+                output_path = os.path.join(app_module.PROCESSED_DIR, f"{job_id}__x.pdf") if with_output else None
+                for path in (input_path, output_path):
+                    if path:
+                        with open(path, "wb") as f:
+                            f.write(b"x" * 10)
+                jobs.append((job_id, input_path, output_path))
+            with conn:
+                conn.executemany(
+                    """
+                    INSERT INTO jobs (id, session_id, original_filename, action, status, created_at,
+                                      input_path, output_path, expires_at)
+                    VALUES (?, 'cleanup', 'x.png', 'convert', 'done', ?, ?, ?, ?)
+                    """,
+                    [(job_id, now, i, o, expires_at) for job_id, i, o in jobs],
+                )
+            return jobs
+
+        expired = add_jobs(6, now - 1) + add_jobs(1, now - 1, with_output=False)
+        os.remove(expired[0][1])  # fichier deja absent: pas une erreur
+        live = add_jobs(2, now + 3600)
+        batches = []
+        collect = app_module._db_collect_expired_jobs
+        app_module._db_collect_expired_jobs = lambda now_ts, limit: batches.append(limit) or collect(now_ts, limit=limit)
+        app_module.CLEANUP_BATCH_SIZE = 3
+        try:
+            assert app_module._cleanup_sweep(now) == 7
+        finally:
+            app_module._db_collect_expired_jobs = collect
+        assert len(batches) == 3, batches  # 3 + 3 + 1, le lot incomplet termine la purge
+        assert not any(os.path.exists(p) for _, i, o in expired for p in (i, o) if p)
+        assert all(os.path.exists(p) for _, i, o in live for p in (i, o))
+        assert app_module._db_existing_job_ids([j[0] for j in expired + live]) == {j[0] for j in live}
+        assert app_module._unlink_batch([live[0][1], None, live[0][1]]) == 1
+
+        # budget epuise: le lot en cours se termine, le reste attend la purge suivante
+        expired = add_jobs(7, now - 1)
+        delete = app_module._db_delete_jobs
+        app_module._db_delete_jobs = lambda ids: (time.sleep(0.05), delete(ids))
+        app_module.CLEANUP_SWEEP_BUDGET_SECONDS = 0.01
+        try:
+            assert app_module._cleanup_sweep(now) == 3
+        finally:
+            app_module._db_delete_jobs = delete
+        app_module.CLEANUP_SWEEP_BUDGET_SECONDS = 5
+        assert len(app_module._db_existing_job_ids([j[0] for j in expired])) == 4
+        assert app_module._cleanup_sweep(now) == 4
+
+        # orphelins: delai de grace, ids encore en base conserves, logs two-pass, lots ORPHAN_SCAN_BATCH
+        app_module.DATA_DIR = os.path.join(tmp, "data")
+        os.makedirs(app_module.DATA_DIR)
+        old = now - app_module.ORPHAN_GRACE_SECONDS - 10
+
+        def touch(directory: str, name: str, mtime: float) -> str:
+            path = os.path.join(directory, name)
+            with open(path, "wb") as f:
+                f.write(b"x" * 100)
+            os.utime(path, (mtime, mtime))
+            return path
+
+        old_orphans = [
+            touch(app_module.UPLOAD_DIR, f"{app_module._new_id()}__a.png", old),
+            touch(app_module.PROCESSED_DIR, f"{app_module._new_id()}__a.pdf", old),
+            touch(app_module.PROCESSED_DIR, f"{app_module._new_id()}.zip", old),
+            touch(app_module.DATA_DIR, "ffpass_old-0.log", old),
+        ]
+        kept = [
+            touch(app_module.UPLOAD_DIR, f"{app_module._new_id()}__fresh.png", now),
+            touch(app_module.DATA_DIR, "ffpass_fresh-0.log", now),
+            touch(app_module.UPLOAD_DIR, "readme.txt", old),
+            touch(app_module.DATA_DIR, "other.log", old),
+        ]
+        for _, input_path, output_path in live:
+            kept += [touch(app_module.UPLOAD_DIR, os.path.basename(input_path), old)]
+            kept += [touch(app_module.PROCESSED_DIR, os.path.basename(output_path), old)]
+        lookups = []
+        existing = app_module._db_existing_job_ids
+        app_module._db_existing_job_ids = lambda ids: lookups.append(len(ids)) or existing(ids)
+        app_module.ORPHAN_SCAN_BATCH = 2
+        runs = app_module._orphan_stats["runs"]
+        try:
+            assert app_module._reconcile_orphans(now) == (4, 400)
+        finally:
+            app_module._db_existing_job_ids = existing
+        assert lookups and max(lookups) <= 2, lookups
+        assert not any(os.path.exists(p) for p in old_orphans)
+        assert all(os.path.exists(p) for p in kept)
+        assert app_module._orphan_stats["runs"] == runs + 1
+        assert app_module._orphan_stats["last_run_at"] == now
+        assert app_module._reconcile_orphans(now + app_module.ORPHAN_GRACE_SECONDS + 10) == (2, 200)
+
+    print("db plans ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Stand-in local du proxy frontal pour DOWNLOAD_OFFLOAD (tests / dev sans nginx).
+
+Intercepte X-Accel-Redirect / X-Sendfile comme le ferait nginx ou apache et sert
+le fichier reference. Usage dev:
+
+    DOWNLOAD_OFFLOAD=x-accel python3 scripts/offload_proxy.py
+"""
+
+import os
+import sys
+import urllib.parse
+
+from werkzeug.wsgi import wrap_file
+
+
+class OffloadProxy:
+    def __init__(self, wsgi_app, *, prefix: str, roots: dict[str, str]) -> None:
+        self.wsgi_app = wsgi_app
+        self.prefix = prefix.rstrip("/")
+        self.roots = roots
+
+    def _resolve(self, headers: dict[str, str]) -> str | None:
+        if "x-sendfile" in headers:
+            return headers["x-sendfile"]
+        uri = headers.get("x-accel-redirect")
+        if not uri or not uri.startswith(self.prefix + "/"):
+            return None
+        name, _, rel = uri[len(self.prefix) + 1:].partition("/")
+        root = self.roots.get(name)
+        if root is None:
+            return None
+        path = os.path.realpath(os.path.join(root, urllib.parse.unquote(rel)))
+        if not path.startswith(os.path.realpath(root) + os.sep):
+            return None
+        return path
+
+    def __call__(self, environ, start_response):
+        captured: dict = {}
+
+        def _capture(status, headers, exc_info=None):
+            captured["status"] = status
+            captured["headers"] = headers
+            return lambda data: None
+
+        body = self.wsgi_app(environ, _capture)
+        lowered = {k.lower(): v for k, v in captured["headers"]}
+        path = self._resolve(lowered)
+        if path is None:
+            start_response(captured["status"], captured["headers"])
+            return body
+
+        if hasattr(body, "close"):
+            body.close()
+        if not os.path.isfile(path):
+            start_response("404 NOT FOUND", [("Content-Type", "text/plain")])
+            return [b"not found"]
+
+        headers = [
+            (k, v)
+            for k, v in captured["headers"]
+            if k.lower() not in {"x-accel-redirect", "x-sendfile", "content-length"}
+        ]
+        headers.append(("Content-Length", str(os.path.getsize(path))))
+        start_response(captured["status"], headers)
+        return wrap_file(environ, open(path, "rb"))
+
+
+def wrap(app_module) -> OffloadProxy:
+    return OffloadProxy(
+        app_module.app.wsgi_app,
+        prefix=app_module.DOWNLOAD_OFFLOAD_PREFIX,
+        roots={"processed": app_module.PROCESSED_DIR, "archives": app_module.ARCHIVE_DIR},
+    )
+
+
+def main() -> None:
+    repo_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    if repo_root not in sys.path:
+        sys.path.insert(0, repo_root)
+
+    import app as app_module
+
+    app_module.app.wsgi_app = wrap(app_module)
+    app_module.app.run(port=5001)
+
+
+if __name__ == "__main__":
+    main()
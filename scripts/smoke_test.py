@@ -1,7 +1,9 @@
 import io
 import os
 import sys
+import threading
 import time
+import zipfile
 
 
 def _make_png_bytes() -> bytes:
@@ -13,6 +15,21 @@ def _make_png_bytes() -> bytes:
     return buf.getvalue()
 
 
+def _make_psd_rle_bytes(img) -> bytes:
+    """PSD minimal (image composee seule) en RLE: chaque ligne de chaque canal compressee a part."""
+    width, height = img.size
+    rows = []
+    for band in img.split():
+        data = band.tobytes()
+        for y in range(height):
+            row = data[y * width:(y + 1) * width]
+            rows.append(b"".join(bytes([len(row[i:i + 128]) - 1]) + row[i:i + 128] for i in range(0, width, 128)))
+    header = b"8BPS" + (1).to_bytes(2, "big") + bytes(6) + len(img.getbands()).to_bytes(2, "big")
+    header += height.to_bytes(4, "big") + width.to_bytes(4, "big") + (8).to_bytes(2, "big")
+    header += (1 if img.mode == "L" else 3).to_bytes(2, "big") + bytes(12) + (1).to_bytes(2, "big")
+    return header + b"".join(len(row).to_bytes(2, "big") for row in rows) + b"".join(rows)
+
+
 def _poll(client, job_id: str, timeout_s: int = 30) -> dict:
     deadline = time.time() + timeout_s
     last = None
@@ -42,6 +59,26 @@ def main() -> None:
         assert r.status_code == 200
         assert r.get_json()["ok"] is True
 
+        # contenu verifie par signature pendant l upload
+        data = {
+            "action": "convert",
+            "format": "pdf",
+            "file": (io.BytesIO(b"not really an image"), "bogus.png"),
+        }
+        r = c.post("/jobs", data=data, content_type="multipart/form-data")
+        assert r.status_code == 415, r.data
+
+        # AVIF/HEIF reconnus par leurs marques compatibles, wav > 4 Go en RF64/BW64
+        ftyp = b"\x00\x00\x00\x1cftypMA1B\x00\x00\x00\x00mif1miafMA1B"
+        assert app_module._verify_upload_content("x.avif", "image", ftyp) == "heif"
+        ftyp = b"\x00\x00\x00\x18ftypmiaf\x00\x00\x00\x00mif1heic"
+        assert app_module._verify_upload_content("x.heic", "image", ftyp) == "heif"
+        ftyp = b"\x00\x00\x00\x18ftypisom\x00\x00\x02\x00isomiso2"
+        assert app_module._verify_upload_content("x.mp4", "video", ftyp) == "mp4"
+        for magic in (b"RF64", b"BW64"):
+            wav = magic + b"\xff\xff\xff\xffWAVEds64"
+            assert app_module._verify_upload_content("x.wav", "audio", wav) == "wav"
+
         png = _make_png_bytes()
         data = {
             "action": "convert",
@@ -61,17 +98,599 @@ def main() -> None:
         body = r.data
         assert body[:4] == b"%PDF", body[:32]
 
+        # historique ecrit juste apres le passage a done
+        deadline = time.time() + 5
+        while True:
+            groups = c.get("/stats/jobs?media_type=image").get_json()["groups"]
+            if groups or time.time() > deadline:
+                break
+            time.sleep(0.05)
+        group = next(g for g in groups if (g["action"], g["target_format"]) == ("convert", "pdf"))
+        assert group["count"] >= 1 and group["total_ms"]["p50"] is not None, group
+        assert c.get("/stats/jobs?days=x").status_code == 400
+
         r = c.get("/jobs?limit=10")
         assert r.status_code == 200
         jobs = r.get_json()["jobs"]
         assert any(j["id"] == job_id for j in jobs), jobs
 
+        r = c.get("/jobs?limit=1&fields=id,status")
+        page = r.get_json()
+        assert all(set(j) == {"id", "status"} for j in page["jobs"]), page
+        r = c.get(f"/jobs?limit=1&after={page['next_after']}")
+        assert r.get_json()["jobs"] == [] and r.get_json()["next_after"] is None, r.data
+        assert c.get("/jobs?after=abc").status_code == 400
+
+        r = c.get("/download-all")
+        assert r.status_code == 200, r.data
+        assert zipfile.ZipFile(io.BytesIO(r.data)).namelist() == ["test.pdf"]
+
+        # archive de session incrementale: envoi de fichier avec Range
+        app_module.SESSION_ARCHIVE_ENABLED = True
+        try:
+            r = c.get("/download-all")
+            assert r.status_code == 200, r.data
+            full = r.data
+            assert zipfile.ZipFile(io.BytesIO(full)).namelist() == ["test.pdf"]
+            r = c.get("/download-all", headers={"Range": "bytes=0-3"})
+            assert r.status_code == 206, r.status_code
+            assert r.data == full[:4]
+        finally:
+            app_module.SESSION_ARCHIVE_ENABLED = False
+
+        # purge: session verrouillee (ajout/publication en cours) laissee intacte, sinon archives,
+        # copie de publication abandonnee et verrou supprimes
+        import fcntl
+
+        old = time.time() - app_module.RETENTION_SECONDS - 10
+        working, published = app_module._session_archive_paths("smoke-prune")
+        lock_path = os.path.join(app_module.ARCHIVE_DIR, "smoke-prune.lock")
+        for path in (working, published):
+            open(path, "wb").close()
+        with open(lock_path, "a") as held:
+            fcntl.flock(held, fcntl.LOCK_EX)
+            for path in (working, published, lock_path):
+                os.utime(path, (old, old))
+            app_module._prune_session_archives(int(time.time()))
+            assert all(os.path.exists(path) for path in (working, published, lock_path))
+            fcntl.flock(held, fcntl.LOCK_UN)
+        # copie en cours: mtime d origine reporte par copy2, mais creee a l instant
+        copying = f"{published}.{app_module._new_id()}.tmp"
+        open(copying, "wb").close()
+        os.utime(copying, (old, old))
+        app_module._prune_session_archives(int(time.time()))
+        assert not any(os.path.exists(path) for path in (working, published, lock_path))
+        assert os.path.exists(copying)
+        app_module._prune_session_archives(int(time.time()) + app_module.RETENTION_SECONDS + 10)
+        assert not os.path.exists(copying) and not os.path.exists(lock_path)
+
+        # delegation au proxy: en-tete seul, le stand-in sert le fichier
+        app_module.DOWNLOAD_OFFLOAD = "x-accel"
+        try:
+            r = c.get(job["download_url"])
+            assert r.status_code == 200, r.data
+            assert r.headers["X-Accel-Redirect"].startswith("/_protected/processed/"), r.headers
+            assert r.data == b""
+        finally:
+            app_module.DOWNLOAD_OFFLOAD = ""
+
+    import offload_proxy
+
+    original_wsgi_app = app.wsgi_app
+    app.wsgi_app = offload_proxy.wrap(app_module)
+    app_module.DOWNLOAD_OFFLOAD = "x-accel"
+    try:
+        with app.test_client() as c3:
+            c3.set_cookie("session_id", c.get_cookie("session_id").value)
+            r = c3.get(job["download_url"])
+            assert r.status_code == 200, r.data
+            assert r.data == body
+            assert "X-Accel-Redirect" not in r.headers
+    finally:
+        app_module.DOWNLOAD_OFFLOAD = ""
+        app.wsgi_app = original_wsgi_app
+
     with app.test_client() as c2:
         r = c2.get(f"/jobs/{job_id}")
         assert r.status_code == 404
         r = c2.get(f"/download/{job_id}")
         assert r.status_code == 404
 
+    # taille cible: calibrage sur proxy, sous la cible, moins d encodages que la dichotomie
+    from PIL import Image
+
+    photo = Image.effect_noise((400, 300), 60).resize((2400, 1800), Image.BICUBIC).convert("RGB")
+    reference = len(app_module._encode_image_bytes(img=photo, out_ext=".jpg", quality=90, lossless=False, has_alpha=False))
+    best, stats = app_module._search_quality_for_size(img=photo, out_ext=".jpg", target_bytes=reference // 2, has_alpha=False)
+    assert len(best) <= reference // 2, (len(best), reference)
+    assert stats["proxy_encodes"] and stats["rounds"] <= app_module.TARGET_SIZE_MAX_ENCODES, stats
+
+    # paliers d effort: reglages par format, valeur inconnue refusee a l admission
+    assert app_module._effort_kwargs("WEBP", "fast") == {"method": 2}
+    assert app_module._image_effort({"image_effort": "bogus"}) == "balanced"
+    assert app_module._effort_kwargs("AVIF", "max") == {"speed": 6}  # vitesse Pillow par defaut, comme avant
+    fast_png = app_module._encode_image_bytes(img=photo, out_ext=".png", quality=80, lossless=True, has_alpha=False, effort="fast")
+    max_png = app_module._encode_image_bytes(img=photo, out_ext=".png", quality=80, lossless=True, has_alpha=False, effort="max")
+    assert Image.open(io.BytesIO(fast_png)).tobytes() == photo.tobytes() and len(max_png) < len(fast_png)
+    with app.test_client() as c5:
+        turbo = io.BytesIO()
+        photo.resize((400, 300)).save(turbo, format="JPEG")
+        data = {"action": "compress", "image_effort": "turbo", "file": (io.BytesIO(turbo.getvalue()), "photo.jpg")}
+        assert c5.post("/jobs", data=data, content_type="multipart/form-data").status_code == 400
+
+    # format auto: plus petit des candidats, extension reportee dans output_filename
+    with app.test_client() as c6:
+        small = io.BytesIO()
+        photo.resize((400, 300)).save(small, format="PNG")
+        data = {"action": "convert", "format": "auto", "file": (io.BytesIO(small.getvalue()), "small.png")}
+        r = c6.post("/jobs", data=data, content_type="multipart/form-data")
+        assert r.status_code == 202, r.data
+        job = _poll(c6, r.get_json()["job_id"], timeout_s=60)
+        assert job["status"] == "done", job
+        chosen = os.path.splitext(job["output_filename"])[1]
+        assert job["output_filename"].startswith("small.") and chosen in {".avif", ".webp", ".jpg", ".png"}, job
+        with Image.open(io.BytesIO(c6.get(job["download_url"]).data)) as result:
+            assert result.size == (400, 300) and f".{result.format.lower()}".replace("jpeg", "jpg") == chosen
+        data = {"action": "convert", "format": "auto", "file": (io.BytesIO(b"%PDF-1.4"), "doc.pdf")}
+        assert c6.post("/jobs", data=data, content_type="multipart/form-data").status_code == 400
+    # candidat PNG de format auto: palette exacte (octree seul decalait des couleurs proches)
+    from PIL import ImageChops
+
+    few = Image.new("RGB", (100, 100))
+    few.putdata([((i * 37) % 256, (i * 91) % 256, (i * 13) % 256) for i in range(200)] * 50)
+    exact = app_module._exact_palette(few)
+    assert exact is not None and ImageChops.difference(exact.convert("RGB"), few).getbbox() is None
+
+    # photo jpeg des jobs compress/srcset et de la reduction jpeg
+    buf = io.BytesIO()
+    photo.save(buf, format="JPEG", quality=90)
+
+    # qualite visuelle cible: SSIM luma atteint a la plus basse qualite trouvee
+    if app_module.np is not None:
+        reference = app_module._SsimReference(photo)
+        assert reference.score(app_module._png_bytes(photo, fast=True)) > 0.9999
+        encoded, stats = app_module._search_quality_for_ssim(img=photo, out_ext=".jpg", target_ssim=0.98, has_alpha=False)
+        assert stats["ssim"] >= 0.98 and stats["encodes"] <= app_module.SSIM_MAX_ENCODES, stats
+        lower = app_module._encode_image_bytes(img=photo, out_ext=".jpg", quality=stats["quality"] - 5, lossless=False, has_alpha=False)
+        assert reference.score(lower) < stats["ssim"]
+        with app.test_client() as c7:
+            data = {"action": "compress", "comp_mode": "quality", "comp_value": "0.3", "file": (io.BytesIO(buf.getvalue()), "photo.jpg")}
+            assert c7.post("/jobs", data=data, content_type="multipart/form-data").status_code == 400
+            data = {"action": "compress", "comp_mode": "quality", "comp_value": "97", "file": (io.BytesIO(buf.getvalue()), "photo.jpg")}
+            r = c7.post("/jobs", data=data, content_type="multipart/form-data")
+            assert r.status_code == 202, r.data
+            job = _poll(c7, r.get_json()["job_id"], timeout_s=60)
+            assert job["status"] == "done" and job["output_filename"] == "photo.jpg", job
+            assert reference.score(c7.get(job["download_url"]).data) >= 0.97
+            # plus petite que la fenetre SSIM: qualite par defaut au lieu d un echec
+            tiny = io.BytesIO()
+            photo.resize((4, 4)).save(tiny, format="JPEG")
+            data = {"action": "compress", "comp_mode": "quality", "file": (io.BytesIO(tiny.getvalue()), "tiny.jpg")}
+            r = c7.post("/jobs", data=data, content_type="multipart/form-data")
+            assert r.status_code == 202, r.data
+            assert _poll(c7, r.get_json()["job_id"], timeout_s=60)["status"] == "done"
+
+    # jpeg -> jpeg sans perte: metadonnees retirees au niveau des segments, pixels identiques
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    jpeg_path = os.path.join(app_module.UPLOAD_DIR, "smoke_exif.jpg")
+    out_path = os.path.join(app_module.UPLOAD_DIR, "smoke_exif_out.jpg")
+    photo.resize((640, 480)).save(jpeg_path, quality=85, exif=exif.tobytes(), comment=b"smoke")
+    try:
+        app_module._process_image(
+            input_path=jpeg_path, output_path=out_path, action="convert", target_format="jpg",
+            comp_mode=None, comp_value=None, params={"image_strip_metadata": "1"},
+        )
+        with Image.open(out_path) as stripped, Image.open(jpeg_path) as original:
+            assert not stripped.getexif() and "comment" not in stripped.info
+            assert stripped.tobytes() == original.tobytes()
+        app_module._process_image(
+            input_path=jpeg_path, output_path=out_path, action="compress", target_format=None,
+            comp_mode=None, comp_value="lossless", params={"image_auto_orient": "1"},
+        )
+        with Image.open(out_path) as oriented:
+            assert oriented.size == (480, 640) and oriented.getexif().get(0x0112) == 1
+        # orientation appliquee apres la reduction draft: taille orientee identique
+        app_module._process_image(
+            input_path=jpeg_path, output_path=out_path, action="convert", target_format="jpg",
+            comp_mode=None, comp_value=None, params={"image_auto_orient": "1", "image_max_size": "100"},
+        )
+        with Image.open(out_path) as oriented:
+            assert oriented.size == (75, 100), oriented.size
+        if app_module._jpegtran_path() is None:
+            # rotation sans jpegtran: re-encodage, soumis au plafond de decodage
+            max_pixels = app_module.IMAGE_MAX_PIXELS
+            app_module.IMAGE_MAX_PIXELS = 1000
+            try:
+                app_module._process_image(
+                    input_path=jpeg_path, output_path=out_path, action="convert", target_format="jpg",
+                    comp_mode=None, comp_value=None, params={"image_auto_orient": "1"},
+                )
+                raise AssertionError("re-encodage au-dela de IMAGE_MAX_PIXELS")
+            except ValueError as e:
+                assert "trop grande" in str(e)
+            finally:
+                app_module.IMAGE_MAX_PIXELS = max_pixels
+    finally:
+        for path in (jpeg_path, out_path):
+            if os.path.exists(path):
+                os.remove(path)
+    # memes options via l API: drapeaux recopies dans les params du job, valeur invalide refusee
+    with app.test_client() as c10:
+        oriented = io.BytesIO()
+        photo.resize((64, 48)).save(oriented, format="JPEG", exif=exif.tobytes(), comment=b"smoke")
+        data = {"action": "convert", "format": "jpg", "image_progressive": "peut-etre"}
+        data["file"] = (io.BytesIO(oriented.getvalue()), "exif.jpg")
+        assert c10.post("/jobs", data=data, content_type="multipart/form-data").status_code == 400
+        data = {"action": "convert", "format": "jpg", "image_strip_metadata": "1", "image_auto_orient": "true"}
+        data["file"] = (io.BytesIO(oriented.getvalue()), "exif.jpg")
+        r = c10.post("/jobs", data=data, content_type="multipart/form-data")
+        assert r.status_code == 202, r.data
+        job = _poll(c10, r.get_json()["job_id"], timeout_s=60)
+        assert job["status"] == "done", job
+        with Image.open(io.BytesIO(c10.get(job["download_url"]).data)) as result:
+            assert result.size == (48, 64) and "comment" not in result.info
+            assert result.getexif().get(0x0112, 1) == 1
+
+    # image -> pdf: flux JPEG / IDAT PNG copies tels quels, page dimensionnee par le DPI
+    from pypdf import PdfReader
+
+    jpeg_path = os.path.join(app_module.UPLOAD_DIR, "smoke_embed.jpg")
+    png_path = os.path.join(app_module.UPLOAD_DIR, "smoke_embed.png")
+    out_path = os.path.join(app_module.UPLOAD_DIR, "smoke_embed.pdf")
+    photo.resize((600, 300)).save(jpeg_path, quality=85, dpi=(300, 300), exif=exif.tobytes(), comment=b"gps secret")
+    photo.resize((200, 100)).quantize(64).save(png_path)
+    try:
+        app_module._process_image(
+            input_path=jpeg_path, output_path=out_path, action="convert", target_format="pdf",
+            comp_mode=None, comp_value=None, params={"image_auto_orient": "1"},
+        )
+        # flux compresse copie, en-tete sans EXIF ni commentaire
+        with open(jpeg_path, "rb") as f, open(out_path, "rb") as pdf:
+            source, body = f.read(), pdf.read()
+        scan = source[source.index(b"\xff\xda"):]
+        assert scan in body
+        assert b"Exif\x00\x00" not in body and b"gps secret" not in body
+        stream = body[body.index(b"\xff\xd8\xff"):body.index(scan) + len(scan)]
+        with Image.open(io.BytesIO(stream)) as embedded, Image.open(jpeg_path) as original:
+            assert embedded.tobytes() == original.tobytes()
+        page = PdfReader(out_path).pages[0]
+        assert (float(page.mediabox.width), float(page.mediabox.height)) == (144.0, 72.0)
+        assert page.get("/Rotate") == 90
+        app_module._process_image(
+            input_path=png_path, output_path=out_path, action="convert", target_format="pdf",
+            comp_mode=None, comp_value=None, params={},
+        )
+        page = PdfReader(out_path).pages[0]
+        assert float(page.mediabox.width) == 144.0
+        with Image.open(png_path) as original:
+            embedded = page.images[0].image.convert("RGB")
+            assert embedded.tobytes() == original.convert("RGB").tobytes()
+    finally:
+        for path in (jpeg_path, png_path, out_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    # assemblage pdf: pages d un dossier en tri naturel, ou job_ids dans l ordre donne avec reduction
+    with app.test_client() as c8:
+        assert c8.post("/jobs/assemble-pdf", data={}).status_code == 400
+        page_ids = {}
+        for name, width in (("page10.jpg", 300), ("page2.jpg", 200), ("page1.jpg", 100)):
+            page = io.BytesIO()
+            photo.resize((width, 100)).save(page, format="JPEG", dpi=(72, 72))
+            data = {"action": "convert", "format": "jpg", "relative_path": f"scans/{name}", "file": (io.BytesIO(page.getvalue()), name)}
+            r = c8.post("/jobs", data=data, content_type="multipart/form-data")
+            assert r.status_code == 202, r.data
+            page_ids[name] = r.get_json()["job_id"]
+        for job_id in page_ids.values():
+            assert _poll(c8, job_id)["status"] == "done"
+
+        r = c8.post("/jobs/assemble-pdf", data={"relative_path": "scans"})
+        assert r.status_code == 202 and r.get_json()["pages"] == 3, r.data
+        job = _poll(c8, r.get_json()["job_id"])
+        assert job["status"] == "done" and job["output_filename"] == "scans.pdf", job
+        pages = PdfReader(io.BytesIO(c8.get(job["download_url"]).data)).pages
+        assert [float(p.mediabox.width) for p in pages] == [100.0, 200.0, 300.0]
+
+        ids = f"{page_ids['page10.jpg']},{page_ids['page1.jpg']}"
+        r = c8.post("/jobs/assemble-pdf", data={"job_ids": ids, "image_max_size": "150", "filename": "lot"})
+        assert r.status_code == 202, r.data
+        job = _poll(c8, r.get_json()["job_id"])
+        assert job["status"] == "done" and job["output_filename"] == "lot.pdf", job
+        pages = PdfReader(io.BytesIO(c8.get(job["download_url"]).data)).pages
+        # reduction: pixels en moins, format physique de page conserve
+        assert [float(p.mediabox.width) for p in pages] == [300.0, 100.0]
+        assert pages[0].images[0].image.size == (150, 50)
+
+    # srcset: une archive, une variante par largeur x format, manifest coherent
+    with app.test_client() as c4:
+        data = {"action": "srcset", "srcset_widths": "320,640,4000", "file": (io.BytesIO(buf.getvalue()), "photo.jpg")}
+        assert c4.post("/jobs", data={**data, "srcset_formats": "bmp"}, content_type="multipart/form-data").status_code == 400
+        data["file"] = (io.BytesIO(buf.getvalue()), "photo.jpg")
+        r = c4.post("/jobs", data={**data, "srcset_formats": "webp,jpg"}, content_type="multipart/form-data")
+        assert r.status_code == 202, r.data
+        job = _poll(c4, r.get_json()["job_id"], timeout_s=60)
+        assert job["status"] == "done" and job["output_filename"] == "photo_srcset.zip", job
+        archive = zipfile.ZipFile(io.BytesIO(c4.get(job["download_url"]).data))
+        assert [(i["width"], i["height"], i["format"]) for i in job["srcset"]["images"]] == [
+            (w, w * 3 // 4, fmt) for w in (2400, 640, 320) for fmt in ("webp", "jpg")
+        ], job["srcset"]
+        for item in job["srcset"]["images"]:
+            with Image.open(archive.open(item["file"])) as variant:
+                assert variant.size == (item["width"], item["height"])
+            assert archive.getinfo(item["file"]).file_size == item["bytes"]
+        assert "manifest.json" in archive.namelist()
+        # upload de dossier: l entree du download-all garde le nom de l archive
+        srcset_job = {"action": "srcset", "output_path": "x.zip", "params": '{"relative_path": "album/photo.jpg"}'}
+        assert app_module._archive_name_for_job(srcset_job) == "album/photo_srcset.zip"
+
+    # reduction jpeg: decodage a l echelle DCT puis LANCZOS, meme taille que ImageOps.contain
+    with Image.open(io.BytesIO(buf.getvalue())) as jpeg:
+        small = app_module._resize_preserve_aspect(jpeg, 300)
+        assert jpeg.size == (600, 450), jpeg.size  # draft 1/4: juste 2x la cible
+    assert small.size == (300, 225), small.size
+
+    # raster geant: reduction par bandes de lignes identique a la reduction en memoire
+    from PIL import ImageChops
+
+    tiff_path = os.path.join(app_module.UPLOAD_DIR, "smoke_bands.tif")
+    photo.save(tiff_path, format="TIFF")
+    band_bytes = app_module.IMAGE_TILED_BAND_BYTES
+    app_module.IMAGE_TILED_BAND_BYTES = 256 * 1024
+    try:
+        with Image.open(tiff_path) as tiff:
+            assert app_module._raw_band_tiles(tiff), tiff.tile
+            banded = app_module._banded_resize(tiff, app_module._band_reader(tiff_path, tiff), (600, 450))
+        expected = photo.resize((600, 450), Image.LANCZOS, reducing_gap=2)
+        assert max(hi for _, hi in ImageChops.difference(banded, expected).getextrema()) <= 2
+
+        # donnees compressees: bandes TIFF LZW (predicteur) relues une a une, lignes RLE d un PSD
+        lzw_path = os.path.join(app_module.UPLOAD_DIR, "smoke_bands_lzw.tif")
+        psd_path = os.path.join(app_module.UPLOAD_DIR, "smoke_bands.psd")
+        scan = photo.crop((0, 0, 800, 601))
+        scan.save(lzw_path, format="TIFF", compression="tiff_lzw", tiffinfo={317: 2})
+        with open(psd_path, "wb") as f:
+            f.write(_make_psd_rle_bytes(scan))
+        limits = (app_module.IMAGE_MAX_PIXELS, app_module.IMAGE_TILED_MIN_PIXELS)
+        app_module.IMAGE_MAX_PIXELS = app_module.IMAGE_TILED_MIN_PIXELS = 1000
+        try:
+            for source in (lzw_path, psd_path):
+                with Image.open(source) as img:
+                    read_band = app_module._band_reader(source, img)
+                    assert read_band is not None, img.tile
+                    assert read_band(97, 355).tobytes() == scan.crop((0, 97, 800, 355)).tobytes()
+                # au-dela de IMAGE_MAX_PIXELS: reduction et conversion pleine taille sans decodage complet
+                for fmt, params, size in (("jpg", {"image_max_size": "400"}, (400, 300)), ("png", {}, (800, 601))):
+                    out = f"{source}.{fmt}"
+                    app_module._process_image(
+                        input_path=source, output_path=out, action="convert", target_format=fmt,
+                        comp_mode=None, comp_value=None, params=params,
+                    )
+                    with Image.open(out) as result:
+                        assert result.size == size, result.size
+                        if fmt == "png":
+                            assert result.tobytes() == scan.tobytes()
+                    os.remove(out)
+        finally:
+            app_module.IMAGE_MAX_PIXELS, app_module.IMAGE_TILED_MIN_PIXELS = limits
+            os.remove(lzw_path)
+            os.remove(psd_path)
+    finally:
+        app_module.IMAGE_TILED_BAND_BYTES = band_bytes
+
+    # plafond de decodage complet: applique sur chaque chemin qui decode, pas seulement _process_image
+    max_pixels = app_module.IMAGE_MAX_PIXELS
+    app_module.IMAGE_MAX_PIXELS = 1000
+    try:
+        for decode in (
+            lambda: next(app_module._pdf_pages_in_order([tiff_path], {"image_max_size": "100"}, "fast", 1)),
+            lambda: app_module._process_srcset(input_path=tiff_path, output_path=tiff_path + ".zip", base_name="x", params={}),
+        ):
+            try:
+                decode()
+                raise AssertionError("decodage au-dela de IMAGE_MAX_PIXELS")
+            except ValueError as e:
+                assert "trop grande" in str(e)
+    finally:
+        app_module.IMAGE_MAX_PIXELS = max_pixels
+        os.remove(tiff_path)
+
+    # animation: GIF transparent -> WebP anime et retour, durees et boucle conservees
+    frames = []
+    for i in range(10):
+        frame = Image.new("RGBA", (160, 120), (0, 0, 0, 0))
+        frame.paste((255, 20 * i, 0, 255), (i * 12, 30, i * 12 + 40, 70))
+        frames.append(frame)
+    gif_path = os.path.join(app_module.UPLOAD_DIR, "smoke_anim.gif")
+    webp_path = os.path.join(app_module.UPLOAD_DIR, "smoke_anim.webp")
+    back_path = os.path.join(app_module.UPLOAD_DIR, "smoke_anim_back.gif")
+    durations = [40 + 10 * i for i in range(10)]
+    frames[0].save(gif_path, save_all=True, append_images=frames[1:], duration=durations, loop=0, disposal=2)
+    frame_workers, idle = app_module.FRAME_WORKERS, app_module._idle_cpu_threads
+    app_module.FRAME_WORKERS, app_module._idle_cpu_threads = 2, lambda: 2  # chemin parallele meme sur 1 coeur
+    try:
+        app_module._process_image(
+            input_path=gif_path, output_path=webp_path, action="convert", target_format="webp",
+            comp_mode=None, comp_value=None, params={"image_max_size": "80"},
+        )
+        app_module._process_image(
+            input_path=webp_path, output_path=back_path, action="convert", target_format="gif",
+            comp_mode=None, comp_value=None, params={},
+        )
+        for path in (webp_path, back_path):
+            with Image.open(path) as anim:
+                assert anim.n_frames == 10 and anim.size == (80, 60) and anim.info["loop"] == 0, (path, anim.info)
+                seen = []
+                for index in range(anim.n_frames):
+                    anim.seek(index)
+                    anim.load()
+                    seen.append(anim.info["duration"])
+                    rgba = anim.convert("RGBA")
+                    assert rgba.getpixel((0, 0))[3] == 0 and rgba.getpixel((index * 6 + 10, 25))[3] == 255
+                assert seen == durations, (path, seen)
+        # plafond de decodage: largeur x hauteur x frames
+        max_pixels = app_module.IMAGE_MAX_PIXELS
+        app_module.IMAGE_MAX_PIXELS = 160 * 120 * 5
+        try:
+            app_module._process_image(
+                input_path=gif_path, output_path=webp_path, action="convert", target_format="webp",
+                comp_mode=None, comp_value=None, params={},
+            )
+            raise AssertionError("animation decodee au-dela de IMAGE_MAX_PIXELS")
+        except ValueError as e:
+            assert "trop grande" in str(e)
+        finally:
+            app_module.IMAGE_MAX_PIXELS = max_pixels
+        # premiere frame opaque effacee, transparence declaree seulement par les frames suivantes
+        palette = [0, 0, 0, 0, 128, 255, 255, 0, 0] + [0] * 759
+        late = [Image.new("P", (40, 30), 1)] + [Image.new("P", (40, 30), 0) for _ in range(2)]
+        for i, frame in enumerate(late):
+            frame.putpalette(palette)
+            if i:
+                frame.paste(2, (5 * i, 5, 5 * i + 15, 20))
+                frame.info["transparency"] = 0
+        late[0].save(gif_path, save_all=True, append_images=late[1:], duration=50, loop=0, disposal=2, optimize=False)
+        for fmt, path in (("webp", webp_path), ("gif", back_path)):
+            app_module._process_image(
+                input_path=gif_path, output_path=path, action="convert", target_format=fmt,
+                comp_mode=None, comp_value=None, params={},
+            )
+            with Image.open(path) as anim:
+                assert anim.n_frames == 3, (path, anim.n_frames)
+                anim.seek(2)
+                anim.load()
+                rgba = anim.convert("RGBA")
+                assert rgba.getpixel((30, 25))[3] == 0 and rgba.getpixel((12, 10))[3] == 255, path
+    finally:
+        app_module.FRAME_WORKERS, app_module._idle_cpu_threads = frame_workers, idle
+        for path in (gif_path, webp_path, back_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    # admission memoire: estimation depuis l en-tete, file huge au-dela du seuil
+    probe = app_module._estimate_image_memory(os.path.join(repo_root, "agent.md"), {})
+    assert probe is None
+    jpeg_path = os.path.join(app_module.UPLOAD_DIR, "smoke_probe.jpg")
+    photo.save(jpeg_path, format="JPEG")
+    try:
+        full_probe = app_module._estimate_image_memory(jpeg_path, {})
+        thumb_probe = app_module._estimate_image_memory(jpeg_path, {"image_max_size": "300"})
+    finally:
+        os.remove(jpeg_path)
+    assert (full_probe["width"], full_probe["height"]) == (2400, 1800), full_probe
+    assert thumb_probe["mem_bytes"] < full_probe["mem_bytes"] / 4, (thumb_probe, full_probe)
+    huge = {"image_probe": {"mem_bytes": app_module.IMAGE_HUGE_JOB_MB * 1024 * 1024}}
+    assert app_module._executor_for_job("image", huge) is app_module.huge_image_executor
+    assert app_module._executor_for_job("image", {}) is app_module.image_executor
+
+    budget = app_module._MemoryBudget(100)
+    held = budget.acquire(80)
+    waiter = threading.Thread(target=lambda: budget.release(budget.acquire(500)))
+    waiter.start()
+    waiter.join(0.2)
+    assert waiter.is_alive()  # plus grand que le budget: attend d etre seul
+    budget.release(held)
+    waiter.join(5)
+    assert not waiter.is_alive() and budget.reserved == 0
+
+    # submit: demarrage differe sans thread bloque, dans l ordre d arrivee
+    started = []
+    held = budget.acquire(80)
+    budget.submit(50, lambda reserved: started.append(("big", reserved)))
+    budget.submit(10, lambda reserved: started.append(("small", reserved)))
+    assert started == []  # la petite demande ne double pas la grosse
+    budget.release(held)
+    assert started == [("big", 50), ("small", 10)] and budget.reserved == 60
+
+    # pages pdf decodees: meme file que les jobs image, sans bloquer les threads de pdf_page_executor
+    page_paths = []
+    # une fenetre entiere (plus de pages que de threads) en attente de memoire
+    for i in range(app_module.PDF_PAGE_WINDOW or 2 * app_module.PDF_PAGE_WORKERS):
+        page_paths.append(os.path.join(app_module.UPLOAD_DIR, f"smoke_budget{i}.png"))
+        photo.resize((320, 240)).convert("RGBA").save(page_paths[-1])
+    out_path = os.path.join(app_module.UPLOAD_DIR, "smoke_budget.pdf")
+    shared_budget = app_module.image_memory_budget
+    app_module.image_memory_budget = budget = app_module._MemoryBudget(64 * 1024 * 1024)
+    try:
+        held = budget.acquire(budget.capacity)
+        order = []
+        budget.submit(budget.capacity, lambda reserved: order.append(("big", reserved)))
+        assembler = threading.Thread(target=app_module._assemble_pdf, kwargs={
+            "output_path": out_path,
+            "params": {"pdf_pages": [{"path": p} for p in page_paths], "image_max_size": "200"},
+        })
+        assembler.start()
+        deadline = time.time() + 5
+        while len(budget._waiting) < 1 + len(page_paths) and time.time() < deadline:
+            time.sleep(0.02)
+        assert len(budget._waiting) == 1 + len(page_paths), budget._waiting
+        assert app_module.pdf_page_executor.submit(lambda: "free").result(timeout=5) == "free"
+        budget.release(held)
+        assert order == [("big", budget.capacity)] and budget.reserved == budget.capacity
+        assembler.join(0.2)
+        assert assembler.is_alive()  # les pages ne doublent pas la grosse demande
+        budget.release(order[0][1])
+        assembler.join(30)
+        assert not assembler.is_alive() and budget.reserved == 0
+        assert len(PdfReader(out_path).pages) == len(page_paths)
+    finally:
+        app_module.image_memory_budget = shared_budget
+        for path in page_paths + [out_path]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    # png: palette derivee de la quantification 256, transparence conservee
+    gray = photo.getchannel(0)
+    gradient = Image.linear_gradient("L").resize(gray.size)
+    rgba = Image.merge("RGBA", [gray, gradient, gray.rotate(180), gradient.rotate(90)])
+    full = len(app_module._png_bytes(rgba.quantize(colors=256, method=Image.FASTOCTREE)))
+    target = full * 4 // 5
+    encoded, stats = app_module._search_png_palette_for_size(img=rgba, target_bytes=target, has_alpha=True)
+    assert len(encoded) <= target and stats["colors"] < 256, stats
+    assert Image.open(io.BytesIO(encoded)).convert("RGBA").getextrema()[3][0] < 255
+
+    # upload en direct: champ apres le fichier ou corps tronque -> job en erreur, jamais traite
+    import wave
+    from concurrent.futures import ThreadPoolExecutor
+
+    wav = io.BytesIO()
+    with wave.open(wav, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(8000)
+        w.writeframes(b"\0" * 80000)
+    boundary = "smokeboundary"
+
+    def part(name: str, value: bytes, filename: str = "") -> bytes:
+        disposition = f'form-data; name="{name}"' + (f'; filename="{filename}"' if filename else "")
+        return f"--{boundary}\r\nContent-Disposition: {disposition}\r\n\r\n".encode() + value + b"\r\n"
+
+    head = part("action", b"convert") + part("format", b"mp3") + part("file", wav.getvalue(), "a.wav")
+    bodies = {
+        "champs du formulaire apres le fichier": head + part("audio_bitrate", b"128k") + f"--{boundary}--\r\n".encode(),
+        "upload incomplet": head[:60000],
+    }
+    live_executor = app_module.live_transcode_executor
+    app_module.LIVE_TRANSCODE_ENABLED = True
+    try:
+        for expected, body in bodies.items():
+            # pool occupe: le job reste en file pendant l echec de l upload
+            gate = threading.Event()
+            app_module.live_transcode_executor = ThreadPoolExecutor(max_workers=1)
+            app_module.live_transcode_executor.submit(gate.wait)
+            with app.test_client() as c9:
+                r = c9.post("/jobs", data=body, content_type=f"multipart/form-data; boundary={boundary}")
+                assert r.status_code == 400 and r.get_json()["error"] == expected, r.data
+                gate.set()
+                app_module.live_transcode_executor.shutdown(wait=True)
+                (job,) = c9.get("/jobs").get_json()["jobs"]
+                assert (job["status"], job["error"]) == ("error", expected), job
+                assert not os.path.exists(job["input_path"])
+    finally:
+        app_module.LIVE_TRANSCODE_ENABLED = False
+        app_module.live_transcode_executor = live_executor
+    assert app_module._executor_for_job("audio", {"live_transcode": True}) is live_executor
+
     print("smoke ok")
 
 
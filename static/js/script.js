@@ -592,7 +592,6 @@ document.addEventListener('DOMContentLoaded', () => {
         barEl.style.width = "25%";
 
         const formData = new FormData();
-        formData.append('file', item.file);
         if (item.relativePath) {
             formData.append('relative_path', item.relativePath);
         }
@@ -687,6 +686,9 @@ document.addEventListener('DOMContentLoaded', () => {
             }
         }
 
+        // Fichier en dernier: le serveur peut transcoder pendant la reception
+        formData.append('file', item.file);
+
         try {
             console.debug('Uploading item', { action, targetFormat, name: item.file?.name });
             const response = await fetch('/jobs', {